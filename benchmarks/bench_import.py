@@ -0,0 +1,45 @@
+"""Benchmark of the time needed to import the leabra package in a new process.
+
+Each run spawns a fresh Python interpreter, so that nothing is cached in
+`sys.modules`. The time of a bare interpreter start is measured as well, and
+subtracted from the results.
+
+    $ python benchmarks/bench_import.py [n_runs]
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+HEAVY_MODULES = ('scipy', 'bokeh', 'ipywidgets')  # modules `import leabra` should not load
+
+
+def _run(code, n_runs):
+    """Return the median wall time of running `code` in a new interpreter"""
+    times = []
+    for _ in range(n_runs):
+        start = time.perf_counter()
+        subprocess.check_call([sys.executable, '-c', code], cwd=ROOT)
+        times.append(time.perf_counter() - start)
+    return sorted(times)[len(times) // 2]
+
+def bench_import(n_runs=10, module='leabra'):
+    """Return the median import time of `module`, and the heavy modules it loads"""
+    baseline = _run('pass', n_runs)
+    numpy    = _run('import numpy', n_runs)
+    total    = _run('import {}'.format(module), n_runs)
+    loaded = subprocess.check_output(
+        [sys.executable, '-c', 'import sys, {}; print(" ".join(sys.modules))'.format(module)],
+        cwd=ROOT).decode().split()
+    return {'name': 'import_{}'.format(module.replace('.', '_')), 'n_runs': n_runs,
+            'time': total - baseline, 'time_without_numpy': total - numpy,
+            'heavy_modules': sorted({m.split('.')[0] for m in loaded} & set(HEAVY_MODULES))}
+
+
+if __name__ == '__main__':
+    n_runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    results = [bench_import(n_runs, module) for module in ('leabra', 'leabra.frozen')]
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,113 @@
+"""Benchmarks of network construction, cycles, trials, learning and `.wts` loading.
+
+Networks follow `examples/train_network.py`: an input layer, `n_hidden` hidden
+layers and an output layer, all of the same size, connected in a chain. The
+layer size, the number of hidden layers, the projection type and the engine
+(see `leabra.engines`) are varied. Configurations with more than `max_links`
+links per connection are skipped.
+
+Results are written as a JSON list, one entry per configuration and
+measurement, with the median time over the runs. Two result files can be
+compared with `benchmarks/compare.py`.
+
+    $ python benchmarks/bench_network.py [output.json] [--quick]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import leabra
+import leabra.io
+
+
+SIZES    = (4, 25, 100, 1000, 10000)
+N_HIDDEN = (0, 1, 2)
+PROJS    = ('full', '1to1')
+ENGINES  = ('python', 'numpy')
+MAX_LINKS = 10**6
+
+
+def build_network(size, n_hidden, proj, engine='python'):
+    """Build a chain network, as `examples/train_network.py` does"""
+    unit_spec  = leabra.UnitSpec(adapt_on=True, noisy_act=True)
+    layer_spec = leabra.LayerSpec(lay_inhib=True, g_i=1.8, ff=1, fb=1)
+    conn_spec  = leabra.ConnectionSpec(proj=proj, lrule='leabra', lrate=0.04,
+                                       rnd_type='uniform', rnd_mean=0.50, rnd_var=0.25)
+
+    layers = [leabra.Layer(size, spec=layer_spec, unit_spec=unit_spec, genre=leabra.INPUT, name='input_layer')]
+    layers += [leabra.Layer(size, spec=layer_spec, unit_spec=unit_spec, genre=leabra.HIDDEN,
+                            name='hidden_layer_{}'.format(i)) for i in range(n_hidden)]
+    layers.append(leabra.Layer(size, spec=layer_spec, unit_spec=unit_spec, genre=leabra.OUTPUT, name='output_layer'))
+    connections = [leabra.Connection(pre, post, spec=conn_spec) for pre, post in zip(layers[:-1], layers[1:])]
+
+    network = leabra.Network(spec=leabra.NetworkSpec(engine=engine), layers=layers, connections=connections)
+    rng = np.random.RandomState(0)
+    network.set_inputs ({'input_layer' : (rng.uniform(size=size) > 0.75).astype(float).tolist()})
+    network.set_outputs({'output_layer': (rng.uniform(size=size) > 0.75).astype(float).tolist()})
+    return network
+
+def _median_time(fun, n_runs):
+    times = []
+    for _ in range(n_runs):
+        start = time.perf_counter()
+        fun()
+        times.append(time.perf_counter() - start)
+    return sorted(times)[len(times) // 2]
+
+def bench_config(size, n_hidden, proj, engine='python', n_runs=3):
+    """Return the benchmark results of one configuration, as a list of dicts"""
+    config = {'size': size, 'n_hidden': n_hidden, 'proj': proj, 'engine': engine}
+    network = None
+
+    def construct():
+        nonlocal network
+        network = build_network(size, n_hidden, proj, engine)
+
+    results = [('construction', _median_time(construct, n_runs))]
+    network.trial()  # warm-up: lookup tables, netin scaling
+    results.append(('cycle', _median_time(network.cycle, n_runs)))
+    results.append(('trial', _median_time(network.trial, n_runs)))
+    results.append(('learning', _median_time(lambda: [conn.learn() for conn in network.connections],
+                                             n_runs)))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'network.wts')
+        leabra.io.write_wts(network, path)
+        results.append(('load_wts', _median_time(lambda: leabra.io.load_wts(network, path), n_runs)))
+
+    n_units = size * (n_hidden + 2)
+    n_links = sum(conn.n_links for conn in network.connections)
+    return [dict(config, name=name, time=t, n_runs=n_runs, n_units=n_units, n_links=n_links)
+            for name, t in results]
+
+def run(sizes=SIZES, n_hiddens=N_HIDDEN, projs=PROJS, engines=ENGINES, n_runs=3, max_links=MAX_LINKS):
+    """Run the benchmarks on all configurations"""
+    results = []
+    for engine in engines:
+        for proj in projs:
+            for n_hidden in n_hiddens:
+                for size in sizes:
+                    if (size * size if proj == 'full' else size) > max_links:
+                        continue
+                    results.extend(bench_config(size, n_hidden, proj, engine, n_runs=n_runs))
+    return results
+
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if '--quick' in sys.argv:
+        results = run(sizes=(4, 25, 100), n_hiddens=(1,), n_runs=1)
+    else:
+        results = run()
+    output = json.dumps({'python': sys.version.split()[0], 'numpy': np.__version__,
+                         'results': results}, indent=2)
+    if len(args) > 0:
+        with open(args[0], 'w') as fd:
+            fd.write(output)
+    else:
+        print(output)
@@ -0,0 +1,40 @@
+"""Compare two benchmark result files, and flag regressions.
+
+A measurement regresses if it is slower than in the baseline by more than
+`threshold` (relative). Exits with status 1 if any regression is found.
+
+    $ python benchmarks/compare.py baseline.json new.json [threshold]
+"""
+import json
+import sys
+
+
+KEYS = ('name', 'size', 'n_hidden', 'proj', 'engine')
+
+
+def _index(results):
+    return {tuple(r.get(key) for key in KEYS): r['time'] for r in results}
+
+def compare(baseline, new):
+    """Return `(key, baseline_time, new_time, ratio)` tuples for measurements present in both"""
+    baseline, new = _index(baseline['results']), _index(new['results'])
+    return [(key, baseline[key], new[key], new[key] / baseline[key])
+            for key in sorted(set(baseline) & set(new), key=str) if baseline[key] > 0]
+
+def regressions(baseline, new, threshold=0.2):
+    return [row for row in compare(baseline, new) if row[3] > 1 + threshold]
+
+
+if __name__ == '__main__':
+    with open(sys.argv[1]) as fd:
+        baseline = json.load(fd)
+    with open(sys.argv[2]) as fd:
+        new = json.load(fd)
+    threshold = float(sys.argv[3]) if len(sys.argv) > 3 else 0.2
+
+    flagged = regressions(baseline, new, threshold)
+    for key, t_base, t_new, ratio in compare(baseline, new):
+        mark = ' REGRESSION' if ratio > 1 + threshold else ''
+        print('{:<40} {:10.3e}s -> {:10.3e}s  x{:.2f}{}'.format(
+              ' '.join(str(k) for k in key), t_base, t_new, ratio, mark))
+    sys.exit(1 if len(flagged) > 0 else 0)
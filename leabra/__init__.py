@@ -4,3 +4,4 @@ from .unit        import Unit, UnitSpec, INPUT, HIDDEN, OUTPUT
 from .layer       import Layer, LayerSpec
 from .connection  import Connection, ConnectionSpec
 from .network     import Network, NetworkSpec
+from .metrics     import EpochMetrics
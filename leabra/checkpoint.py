@@ -0,0 +1,125 @@
+"""Saving and restoring the full state of a network.
+
+A checkpoint is a single, uncompressed `.npz` file holding the weights, fast
+weights and pending weight changes of every connection, the state and running
+averages of every unit, the inhibition state of every layer, the cycle counters
+of the layers's specs and the network's counters. Members are stored
+uncompressed, so that they can be memory-mapped when loading large networks,
+rather than read in memory.
+
+A checkpoint is restored into a network with the same layers and connections
+as the one it was saved from. The parameters of the specs are not saved: the
+network must be built with the same specs as the saved one for a restored run
+to match a continued one.
+"""
+import struct
+import zipfile
+
+import numpy as np
+
+from .state import NetworkState, UNIT_STATE, LAYER_STATE, COUNTERS
+
+
+CONN_STATE = ('wt', 'fwt', 'dwt')
+
+
+def save(network, path):
+    """Save the state of the network in the `path` file.
+
+    As with `numpy.savez`, the `.npz` extension is added to `path` if missing.
+    """
+    state = NetworkState.capture(network)
+    arrays = {'counters': np.array([state.counters[name] for name in COUNTERS]),
+              'phase'   : np.array(state.phase)}
+    for i, values in enumerate(state.layers):
+        for name in UNIT_STATE:
+            arrays['layer{}/{}'.format(i, name)] = values[name]
+        arrays['layer{}/state'.format(i)] = np.array([values[name] for name in LAYER_STATE])
+        arrays['layer{}/spec_cycle_count'.format(i)] = np.array(network.layers[i].spec.cycle_count)
+    for i, conn in enumerate(network.connections):
+        conn.weight_store.flush()
+        for name in CONN_STATE:
+            arrays['connection{}/{}'.format(i, name)] = getattr(conn, name)
+    np.savez(path, **arrays)
+
+def load(network, path, mmap_mode=None):
+    """Restore the state of the network from the `path` file.
+
+    :param mmap_mode:  if not None, the connections arrays are memory-mapped
+                       instead of read in memory (see `numpy.memmap`). With
+                       'c' (copy-on-write), the modified pages are copied. With
+                       'r', the arrays are copied in memory the first time the
+                       network modifies them (by learning, or by assigning
+                       weights). With 'r+', changes are written to the file.
+    """
+    arrays = read_npz(path, mmap_mode=mmap_mode)
+
+    n_layers = sum(1 for name in arrays if name.endswith('/state'))
+    n_conns  = sum(1 for name in arrays if name.endswith('/wt'))
+    if (n_layers, n_conns) != (len(network.layers), len(network.connections)):
+        raise ValueError('checkpoint has {} layers and {} connections, network has {} and {}'.format(
+                         n_layers, n_conns, len(network.layers), len(network.connections)))
+
+    layers = []
+    for i in range(n_layers):
+        values = {name: arrays['layer{}/{}'.format(i, name)] for name in UNIT_STATE}
+        values.update(zip(LAYER_STATE, arrays['layer{}/state'.format(i)]))
+        layers.append(values)
+    counters = dict(zip(COUNTERS, arrays['counters']))  # older checkpoints may have fewer counters
+    NetworkState(layers, counters=counters, phase=str(arrays['phase'])).restore(network)
+    for i, layer in enumerate(network.layers):
+        layer.spec.cycle_count = int(arrays['layer{}/spec_cycle_count'.format(i)])
+
+    for i, conn in enumerate(network.connections):
+        if conn.storage_dir is not None:  # the files may be shared with a fork
+            conn.unshare_weights()
+        for name in CONN_STATE:
+            values = arrays['connection{}/{}'.format(i, name)]
+            if len(values) != len(conn.wt):
+                raise ValueError('connection {} has {} weights, checkpoint has {}'.format(
+                                 i, len(conn.wt), len(values)))
+            if conn.storage_dir is not None:
+                for block in conn.blocks(len(values)):  # memory-mapped storage: updated in place
+                    getattr(conn, name)[block] = values[block]
+            else:
+                setattr(conn, name, values)
+        conn.shared_weights = mmap_mode == 'r' and conn.storage_dir is None  # read-only: copied on write
+        conn.wt_version += 1
+
+def read_npz(path, mmap_mode=None):
+    """Return a dict with all the arrays of a `.npz` file.
+
+    If `mmap_mode` is not None, the arrays are memory-mapped with this mode
+    (see `numpy.memmap`). This requires the file members to be uncompressed, as
+    created by `numpy.savez`.
+    """
+    if mmap_mode is None:
+        with np.load(path) as npz:
+            return {name: npz[name] for name in npz.files}
+
+    arrays = {}
+    with zipfile.ZipFile(path) as zf, open(path, 'rb') as fd:
+        for info in zf.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError('compressed member {} cannot be memory-mapped'.format(info.filename))
+            # skipping the local file header: 30 bytes, the file name and the extra field.
+            fd.seek(info.header_offset + 26)
+            name_len, extra_len = struct.unpack('<HH', fd.read(4))
+            start = info.header_offset + 30 + name_len + extra_len
+            fd.seek(start)
+
+            version = np.lib.format.read_magic(fd)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(fd)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(fd)
+
+            name = info.filename[:-len('.npy')]
+            if len(shape) == 0 or 0 in shape:  # scalars and empty arrays cannot be mapped
+                fd.seek(start)
+                arrays[name] = np.lib.format.read_array(fd)
+            else:
+                arrays[name] = np.memmap(path, dtype=dtype, mode=mmap_mode, offset=fd.tell(),
+                                         shape=shape, order='F' if fortran_order else 'C')
+    return arrays
+
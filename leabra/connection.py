@@ -1,41 +1,153 @@
+import collections
+import copy
 import random
 
 import numpy as np
 
+from . import storage
+from .spec import Spec
 
 
 class Link:
-    """A link between two units. Simple, non active class."""
+    """A link between two units. Simple, non active class.
 
-    def __init__(self, pre_unit, post_unit, w0, fw0, index=None):
+    The values of the link are stored in the arrays of its connection: a Link
+    is only a view on them.
+    """
+
+    def __init__(self, connection, index):
         """
         Parameters:
-            pre_unit   the unit sending its activity
-            post_unit  the unit receiving the activity
-            w0         the initial weight value
-            fw0        initial value of the fast weight parameter
-            index      position in the weight matrix
+            connection  the connection the link belongs to
+            index       position of the link in the connection arrays
+        """
+        self.connection = connection
+        self.index = index
+        self.pre   = connection.pre.units[connection.pre_idx[index]]   # sending unit
+        self.post  = connection.post.units[connection.post_idx[index]] # receiving unit
+        # position of the weight in the weight arrays (shared weights: several links per weight)
+        self.wt_index = index if connection.wt_idx is None else connection.wt_idx[index]
+
+    @property
+    def wt(self):
+        return float(self.connection.wt[self.wt_index])
+
+    @wt.setter
+    def wt(self, value):
+        self.connection.unshare_weights()
+        self.connection.wt[self.wt_index] = value
+
+    @property
+    def fwt(self):
+        return float(self.connection.fwt[self.wt_index])
+
+    @fwt.setter
+    def fwt(self, value):
+        self.connection.unshare_weights()
+        self.connection.fwt[self.wt_index] = value
+
+    @property
+    def dwt(self):
+        return float(self.connection.dwt[self.wt_index])
+
+    @dwt.setter
+    def dwt(self, value):
+        self.connection.unshare_weights()
+        self.connection.dwt[self.wt_index] = value
+
+
+class Weights:
+    """Weight arrays of a connection, or of several tied connections.
+
+    Tied connections reference the same `Weights`: they share their weights,
+    and their weight changes accumulate in the same `dwt`, applied once. The
+    feedback path of a reciprocal connection also references the `Weights` of
+    the feedforward path, and reads them transposed.
+    """
+
+    def __init__(self, wt, fwt, dwt):
+        self.wt, self.fwt, self.dwt = wt, fwt, dwt
+        self.version = 0       # incremented every time the weights may have changed
+        self.shared  = False   # True if the arrays are shared with a fork
+        self.n_connections = 0 # number of connections using these weights
+
+    def fork(self):
+        """Return a `Weights` sharing the arrays, copied on first write.
+
+        The shared arrays are made read-only: writing to them directly, rather
+        than after `unshare()`, fails instead of changing the weights of both.
+        """
+        for array in (self.wt, self.fwt, self.dwt):
+            array.flags.writeable = False
+        self.shared = True
+        return copy.copy(self)
+
+    def unshare(self, storage_dir=None, block_size=None):
+        """Copy the arrays, if they are shared with a fork.
+
+        If `storage_dir` is not None, the copies are memory-mapped files of
+        this directory, written by blocks of `block_size`.
         """
-        self.pre  = pre_unit
-        self.post = post_unit
-        self.wt   = w0
-        self.fwt  = fw0
-        self.dwt  = 0.0
-        self.key  = None
+        if self.shared:
+            if storage_dir is None:
+                self.wt, self.fwt, self.dwt = self.wt.copy(), self.fwt.copy(), self.dwt.copy()
+            else:
+                self.wt, self.fwt, self.dwt = [storage.store(storage_dir, name, getattr(self, name),
+                                                             block_size=block_size)
+                                               for name in ('wt', 'fwt', 'dwt')]
+            self.shared = False
+
+    def flush(self):
+        """Write the changes of memory-mapped arrays to their files"""
+        storage.flush([self.wt, self.fwt, self.dwt])
 
 
 class Connection:
-    """Connection between layers"""
+    """Connection between layers
+
+    The links of the connection are stored as arrays: the `k`-th link goes from
+    the unit `pre_idx[k]` of the pre layer to the unit `post_idx[k]` of the post
+    layer, with weight `wt[k]`, fast weight `fwt[k]`, and pending weight change
+    `dwt[k]`. For 'full' projections, links are ordered pre unit first, so that
+    `wt` can be reshaped as a `(n_pre, n_post)` matrix.
+
+    In 'conv' projections, links share weights: the weight of the `k`-th link
+    is `wt[wt_idx[k]]`, and `wt` is the convolution kernel. `wt_idx` is None
+    for the other projections.
+
+    'sparse' projections hold arbitrary links, ordered pre unit first. They
+    are obtained by pruning the links of a trained connection (see the
+    `pruning` module).
 
-    def __init__(self, pre_layer, post_layer, spec=None):
+    The weight arrays are held by a `Weights` instance, `weight_store`, which
+    tied connections share.
+    """
+
+    def __init__(self, pre_layer, post_layer, spec=None, tie=None, reciprocal=None, storage_dir=None):
         """
         Parameters:
             pre_layer   the layer sending its activity.
             post_layer  the layer receiving the activity.
+            tie         a connection to tie the weights with: the new connection
+                        uses the same links and weights, and the weight changes
+                        of both are summed and applied once. The layers must
+                        have the sizes of the layers of `tie`, and the spec the
+                        same projection and learning parameters (see
+                        `ConnectionSpec.learning_params()`).
+            reciprocal  a connection from `post_layer` to `pre_layer`: the new
+                        connection is its feedback path, and reads its weights
+                        transposed, without copying them. Its spec only sets the
+                        netin scaling (`wt_scale_abs`, `wt_scale_rel`): learning
+                        is done once, by `reciprocal`. 'full' and '1to1'
+                        projections only.
+            storage_dir directory where to store the links arrays, as
+                        memory-mapped files, for connections larger than memory
+                        (see the `storage` module). The files are in a
+                        subdirectory of their own, `self.storage_dir`. If
+                        None, they are in memory.
         """
         self.pre   = pre_layer
         self.post  = post_layer
-        self.links = []
         self.spec  = spec
         if self.spec is None:
             self.spec = ConnectionSpec()
@@ -44,11 +156,127 @@ class Connection:
         self.wt_scale_rel_eff = None  # effective relative scaling weight, once other connections
                                       # are taken into account (computed by the network).
 
-        self.spec.projection_init(self)
+        self._links = None  # Link views, created on demand
+        self.storage_dir = storage_dir
+        self.block_size  = None if storage_dir is None else storage.BLOCK_SIZE  # links per block
+        self.wt_idx = None  # weight of each link, for projections sharing weights
+        self.transposed = reciprocal is not None  # feedback path of a reciprocal connection
+        if reciprocal is not None:
+            if tie is not None:
+                raise ValueError('a connection cannot be both tied and reciprocal')
+            if (reciprocal.pre is not post_layer or reciprocal.post is not pre_layer
+                or reciprocal.transposed or reciprocal.spec.proj not in ('full', '1to1')
+                or self.spec.projection_params() != reciprocal.spec.projection_params()):
+                raise ValueError("the reciprocal connection must be a 'full' or '1to1' projection "
+                                 "from the post layer to the pre layer, with the same projection")
+            self.pre_idx, self.post_idx = reciprocal.post_idx, reciprocal.pre_idx
+            self.weight_store = reciprocal.weight_store
+            self.storage_dir, self.block_size = reciprocal.storage_dir, reciprocal.block_size
+        elif tie is None:
+            if storage_dir is not None:  # files of its own, in a subdirectory
+                self.storage_dir = storage.claim(storage_dir)
+            self.spec.projection_init(self)
+        else:
+            if ((len(pre_layer.units), len(post_layer.units)) != (len(tie.pre.units), len(tie.post.units))
+                or self.spec.projection_params() != tie.spec.projection_params()):
+                raise ValueError('tied connections must have the same projection, '
+                                 'between layers of the same sizes')
+            if self.spec.learning_params() != tie.spec.learning_params():
+                raise ValueError('tied connections must have the same learning parameters '
+                                 '(lrule, lrate, sig_gain, sig_off): their summed weight changes '
+                                 'are applied once')
+            self.pre_idx, self.post_idx, self.wt_idx = tie.pre_idx, tie.post_idx, tie.wt_idx
+            self.weight_store = tie.weight_store
+            self.storage_dir, self.block_size = tie.storage_dir, tie.block_size
+        self.weight_store.n_connections += 1
 
         pre_layer.from_connections.append(self)
         post_layer.to_connections.append(self)
 
+    @property
+    def wt(self):
+        return self.weight_store.wt
+
+    @wt.setter
+    def wt(self, value):
+        self.weight_store.wt = value
+
+    @property
+    def fwt(self):
+        return self.weight_store.fwt
+
+    @fwt.setter
+    def fwt(self, value):
+        self.weight_store.fwt = value
+
+    @property
+    def dwt(self):
+        return self.weight_store.dwt
+
+    @dwt.setter
+    def dwt(self, value):
+        self.weight_store.dwt = value
+
+    @property
+    def wt_version(self):
+        """Incremented every time the weights may have changed"""
+        return self.weight_store.version
+
+    @wt_version.setter
+    def wt_version(self, value):
+        self.weight_store.version = value
+
+    @property
+    def shared_weights(self):
+        """True if `wt`, `fwt` and `dwt` are shared with a fork"""
+        return self.weight_store.shared
+
+    @shared_weights.setter
+    def shared_weights(self, value):
+        self.weight_store.shared = value
+
+    @property
+    def tied(self):
+        """True if the weights are shared with other connections (tied or reciprocal)"""
+        return self.weight_store.n_connections > 1
+
+    @property
+    def n_links(self):
+        return len(self.pre_idx)
+
+    def blocks(self, size=None):
+        """Slices over the links (or `size` elements), by blocks of `block_size`"""
+        return storage.blocks(self.n_links if size is None else size, self.block_size)
+
+    @property
+    def link_wt(self):
+        """Weight of each link"""
+        return self.wt if self.wt_idx is None else self.wt[self.wt_idx]
+
+    @property
+    def links(self):
+        """List of the links of the connection, created on first access."""
+        if self._links is None:
+            self._links = [Link(self, k) for k in range(self.n_links)]
+        return self._links
+
+    def unshare_weights(self):
+        """Give the connection its own copy of the weight arrays, if they are
+        shared with a fork (see `Network.fork()`). Called before any modification."""
+        self.weight_store.unshare(self.storage_dir, self.block_size)
+
+    def set_dtype(self, dtype):
+        """Convert the weight arrays to the `dtype` floating-point type"""
+        if self.storage_dir is not None:
+            self.wt, self.fwt, self.dwt = [storage.store(self.storage_dir, name, getattr(self, name),
+                                                         dtype=dtype, block_size=self.block_size)
+                                           for name in ('wt', 'fwt', 'dwt')]
+        else:
+            self.wt, self.fwt, self.dwt = (self.wt.astype(dtype), self.fwt.astype(dtype),
+                                           self.dwt.astype(dtype))
+        self.shared_weights = False
+        self.wt_version += 1
+
     @property
     def wt_scale(self):
         try:
@@ -59,36 +287,52 @@ class Connection:
 
     @property
     def weights(self):
-        """Return a matrix of the links weights"""
+        """Return a matrix of the links weights, or the kernel for 'conv' projections"""
         if self.spec.proj.lower() == '1to1':
-            return np.array([[link.wt for link in self.links]])
-        else:  # proj == 'full'
+            return self.wt[np.newaxis, :].copy()
+        elif self.spec.proj.lower() == 'conv':  # the kernel
+            return self.wt.reshape(tuple(self.spec.kernel)).copy()
+        else:  # proj == 'full' or 'sparse'
             W = np.zeros((len(self.pre.units), len(self.post.units)))  # weight matrix
-            link_it = iter(self.links)  # link iterator
-            for i, pre_u in enumerate(self.pre.units):
-                for j, post_u in enumerate(self.post.units):
-                    W[i, j] = next(link_it).wt
+            W[self.pre_idx, self.post_idx] = self.link_wt
             return W
 
     @weights.setter
     def weights(self, value):
         """Override the links weights"""
+        self.wt_version += 1
+        self.unshare_weights()
+        value = np.asarray(value, dtype=float)
         if self.spec.proj.lower() == '1to1':
-            assert len(value) == len(self.links)
-            for wt, link in zip(value, self.links):
-                link.wt  = wt
-                link.fwt = self.spec.sig_inv(wt)
-        else:  # proj == 'full'
-            link_it = iter(self.links)  # link iterator
-            assert len(value) * len(value[0]) == len(self.links)
-            for i, pre_u in enumerate(self.pre.units):
-                for j, post_u in enumerate(self.post.units):
-                    link = next(link_it)
-                    link.wt = value[i][j]
-                    link.fwt = self.spec.sig_inv(value[i][j])
-
-    def learn(self):
-        self.spec.learn(self)
+            assert value.size == self.n_links
+            self.wt[:] = value.reshape(-1)
+        elif self.spec.proj.lower() == 'conv':  # the kernel
+            assert value.shape == tuple(self.spec.kernel)
+            self.wt[:] = value.reshape(-1)
+        else:  # proj == 'full' or 'sparse': the weights of the missing links are ignored
+            assert value.shape == (len(self.pre.units), len(self.post.units))
+            for block in self.blocks():
+                self.wt[block] = value[self.pre_idx[block], self.post_idx[block]]
+        for block in self.blocks(len(self.wt)):
+            self.fwt[block] = self.spec.sig_inv(self.wt[block])
+
+    def learn(self, apply=True):
+        """Compute the weight changes of the trial. If `apply` is False, they are
+        accumulated in `dwt`, to be applied later with `apply_dwt()`."""
+        if self.transposed:  # learning is done by the reciprocal connection
+            return
+        self.unshare_weights()
+        if self.spec.lrule is not None and apply:
+            self.wt_version += 1
+        self.spec.learn(self, apply=apply)
+
+    def apply_dwt(self):
+        """Apply the accumulated weight changes"""
+        if self.spec.lrule is not None and not self.transposed:
+            self.wt_version += 1
+            self.unshare_weights()
+            self.spec.apply_dwt(self)
+            np.clip(self.wt, 0.0, 1.0, out=self.wt)
 
     def cycle(self):
         self.spec.cycle(self)
@@ -96,17 +340,28 @@ class Connection:
     def compute_netin_scaling(self):
         self.spec.compute_netin_scaling(self)
 
-class ConnectionSpec:
+ConnectionDerived = collections.namedtuple('ConnectionDerived', ['d_rev_slope', 'sig_gain_inv'])
+
 
-    legal_proj  = 'full', '1to1'        #              ... for self.proj
+class ConnectionSpec(Spec):
+
+    legal_proj  = 'full', '1to1', 'conv', 'sparse'  #            ... for self.proj
 
     def __init__(self, **kwargs):
         """Connnection parameters"""
         # self.force    = False   # activity are set directly in the post_layer
         self.inhib    = False   # if True, inhibitory connection
         self.proj     = 'full'  # connection pattern between units.
-                                # Can be 'Full' or '1to1'. In the latter case,
-                                # the layers must have the same size.
+                                # Can be 'Full', '1to1', 'conv' or 'sparse'. With
+                                # '1to1', the layers must have the same size.
+                                # 'sparse' projections are created by pruning.
+
+        # convolutional projection: layers with 2-D shapes, and a kernel shared by all the
+        # post units. The post layer's shape must be ((h + 2 * padding - kernel[0]) // stride + 1,
+        # (w + 2 * padding - kernel[1]) // stride + 1), with (h, w) the pre layer's shape.
+        self.kernel   = (3, 3)  # kernel size (height, width)
+        self.stride   = 1
+        self.padding  = 0       # number of zero rows and columns added on each side
 
         # random initialization
         self.rnd_type = 'uniform' # shape of the weight initialization
@@ -134,39 +389,145 @@ class ConnectionSpec:
             assert hasattr(self, key) # making sure the parameter exists.
             setattr(self, key, value)
 
+    def _derive(self):
+        return ConnectionDerived(d_rev_slope=(1 - self.d_rev)/self.d_rev, sig_gain_inv=1 / self.sig_gain)
+
     def cycle(self, connection):
         """Transmit activity."""
-        for link in connection.links:
-            if link.post.act_ext is None: # activity not forced
-                scaled_act = self.wt_scale_abs * connection.wt_scale * link.wt * link.pre.act
-                link.post.add_excitatory(scaled_act)
-
-    def _rnd_wt(self):
-        """Return a random weight, according to the specified distribution"""
+        acts  = connection.pre.unit_array('act')
+        netin = self.wt_scale_abs * connection.wt_scale * self.netin(connection, acts)
+        for post_u, net_raw in zip(connection.post.units, netin):
+            if post_u.act_ext is None: # activity not forced
+                post_u.add_excitatory(net_raw)
+
+    def projection_params(self):
+        """Parameters defining the links of the projection"""
+        if self.proj == 'conv':
+            return self.proj, tuple(self.kernel), self.stride, self.padding
+        return (self.proj,)
+
+    def learning_params(self):
+        """Parameters of the learning of the weights, which tied connections share"""
+        return self.lrule, self.lrate, self.sig_gain, self.sig_off
+
+    def netin(self, connection, acts):
+        """Return the unscaled input of each post unit, given the pre units's activities."""
+        acts = acts.astype(connection.wt.dtype, copy=False)
+        if self.proj == 'full':
+            if connection.block_size is not None:
+                return self._blocked_full_netin(connection, acts)
+            if connection.transposed:  # weights of the reciprocal connection, (n_post, n_pre)
+                return np.dot(connection.wt.reshape(-1, len(acts)), acts)
+            return np.dot(acts, connection.wt.reshape(len(acts), -1))
+        if self.proj == 'conv':  # only uses the kernel, not the link arrays
+            return self._conv_netin(connection, acts)
+        netin = np.zeros(len(connection.post.units), dtype=connection.wt.dtype)
+        for block in connection.blocks():  # '1to1' and 'sparse': scatter-add over the links
+            netin += np.bincount(connection.post_idx[block],
+                                 weights=connection.wt[block] * acts[connection.pre_idx[block]],
+                                 minlength=len(netin))
+        return netin
+
+    def _rnd_wts(self, n):
+        """Return `n` random weights, according to the specified distribution.
+
+        The weights are drawn one by one from the `random` module, so that
+        `random.seed()` makes them reproducible.
+        """
         if self.rnd_type == 'uniform':
-            return random.uniform(self.rnd_mean - self.rnd_var,
-                                  self.rnd_mean + self.rnd_var)
+            return np.array([random.uniform(self.rnd_mean - self.rnd_var,
+                                            self.rnd_mean + self.rnd_var) for _ in range(n)])
         elif self.rnd_type == 'gaussian':
-            return random.gauss(self.rnd_mean, np.sqrt(self.rnd_var))
+            return np.array([random.gauss(self.rnd_mean, np.sqrt(self.rnd_var)) for _ in range(n)])
         raise NotImplementedError
 
+    def _blocked_full_netin(self, connection, acts):
+        """Net input of a 'full' projection, by blocks of rows of the weight matrix"""
+        n_rows = len(connection.pre.units) if not connection.transposed else len(connection.post.units)
+        W = connection.wt.reshape(n_rows, -1)
+        rows = max(1, connection.block_size // W.shape[1])
+        if connection.transposed:  # rows are post units: skipping the columns of inactive pre units
+            active = np.flatnonzero(acts)
+            netin = np.zeros(n_rows, dtype=W.dtype)
+            for r in range(0, n_rows, rows):
+                netin[r:r + rows] = np.dot(W[r:r + rows][:, active], acts[active])
+            return netin
+        netin = np.zeros(W.shape[1], dtype=W.dtype)
+        for r in range(0, n_rows, rows):  # rows are pre units: skipping the inactive ones
+            active = r + np.flatnonzero(acts[r:r + rows])
+            if len(active) > 0:
+                netin += np.dot(acts[active], W[active])
+        return netin
+
+    def _conv_netin(self, connection, acts):
+        """Convolution of the pre layer's activities with the kernel"""
+        (h, w), (kh, kw), pad = connection.pre.shape, self.kernel, self.padding
+        padded = np.zeros((h + 2 * pad, w + 2 * pad), dtype=acts.dtype)
+        padded[pad:pad + h, pad:pad + w] = acts.reshape(h, w)
+        s0, s1 = padded.strides
+        windows = np.lib.stride_tricks.as_strided(
+            padded, shape=tuple(connection.post.shape) + (kh, kw),
+            strides=(self.stride * s0, self.stride * s1, s0, s1))
+        return np.tensordot(windows, connection.wt.reshape(kh, kw), axes=2).reshape(-1)
+
+    def _init_links(self, connection, pre_idx, post_idx, n_wts=None):
+        """Create the links arrays, with random initial weights.
+
+        If `n_wts` is not None, links share `n_wts` weights, and the caller sets
+        `connection.wt_idx`.
+        """
+        n_wts = len(pre_idx) if n_wts is None else n_wts
+        wt = self._rnd_wts(n_wts)
+        arrays = [pre_idx, post_idx, wt, self.sig_inv(wt), np.zeros(n_wts)]
+        if connection.storage_dir is not None:
+            arrays = [storage.store(connection.storage_dir, name, values, block_size=connection.block_size)
+                      for name, values in zip(['pre_idx', 'post_idx', 'wt', 'fwt', 'dwt'], arrays)]
+        connection.pre_idx, connection.post_idx = arrays[:2]
+        connection.weight_store = Weights(*arrays[2:])
+
     def _full_projection(self, connection):
         # creating unit-to-unit links
-        connection.links = []
-        for i, pre_u in enumerate(connection.pre.units):
-            for j, post_u in enumerate(connection.post.units):
-                w0 = self._rnd_wt()
-                fw0 = self.sig_inv(w0)
-                connection.links.append(Link(pre_u, post_u, w0, fw0, index=(i, j)))
+        n_pre, n_post = len(connection.pre.units), len(connection.post.units)
+        if connection.storage_dir is None:
+            self._init_links(connection, np.repeat(np.arange(n_pre), n_post),
+                                         np.tile(np.arange(n_post), n_pre))
+            return
+        # memory-mapped links, created by blocks of pre units
+        arrays = {name: storage.allocate(connection.storage_dir, name, dtype, n_pre * n_post)
+                  for name, dtype in [('pre_idx', int), ('post_idx', int), ('wt', float),
+                                      ('fwt', float), ('dwt', float)]}
+        rows = max(1, connection.block_size // n_post)
+        for r in range(0, n_pre, rows):
+            block = slice(r * n_post, min(n_pre, r + rows) * n_post)
+            arrays['pre_idx'][block]  = np.repeat(np.arange(r, min(n_pre, r + rows)), n_post)
+            arrays['post_idx'][block] = np.tile(np.arange(n_post), min(n_pre, r + rows) - r)
+            wt = self._rnd_wts(block.stop - block.start)
+            arrays['wt'][block], arrays['fwt'][block] = wt, self.sig_inv(wt)
+        connection.pre_idx, connection.post_idx = arrays['pre_idx'], arrays['post_idx']
+        connection.weight_store = Weights(arrays['wt'], arrays['fwt'], arrays['dwt'])
 
     def _1to1_projection(self, connection):
         # creating unit-to-unit links
-        connection.links = []
         assert len(connection.pre.units) == len(connection.post.units)
-        for i, (pre_u, post_u) in enumerate(zip(connection.pre.units, connection.post.units)):
-            w0 = self._rnd_wt()
-            fw0 = self.sig_inv(w0)
-            connection.links.append(Link(pre_u, post_u, w0, fw0, index=(i, i)))
+        idx = np.arange(len(connection.pre.units))
+        self._init_links(connection, idx, idx.copy())
+
+    def _conv_projection(self, connection):
+        # links from the pre units under the kernel, ordered by post unit, then kernel position
+        pre_shape, post_shape = tuple(connection.pre.shape), tuple(connection.post.shape)
+        if len(pre_shape) != 2 or len(post_shape) != 2:
+            raise ValueError("'conv' projections require layers with a 2-D shape")
+        (h, w), (kh, kw), stride, pad = pre_shape, self.kernel, self.stride, self.padding
+        expected = ((h + 2 * pad - kh) // stride + 1, (w + 2 * pad - kw) // stride + 1)
+        if post_shape != expected:
+            raise ValueError('the post layer has shape {}, the convolution gives {}'.format(
+                             post_shape, expected))
+        oy, ox, ky, kx = [a.reshape(-1) for a in np.meshgrid(np.arange(expected[0]), np.arange(expected[1]),
+                                                              np.arange(kh), np.arange(kw), indexing='ij')]
+        y, x = oy * stride + ky - pad, ox * stride + kx - pad
+        valid = (0 <= y) & (y < h) & (0 <= x) & (x < w)  # links from the padding are not created
+        self._init_links(connection, (y * w + x)[valid], (oy * expected[1] + ox)[valid], n_wts=kh * kw)
+        connection.wt_idx = (ky * kw + kx)[valid]
 
     def compute_netin_scaling(self, connection):
         """Compute Netin Scaling
@@ -175,12 +536,17 @@ class ConnectionSpec:
         """
         pre_act_avg = connection.pre.avg_act_p_eff
         pre_size = len(connection.pre.units)
-        n_links = len(connection.links)
+        n_links = connection.n_links
 
         sem_extra = 2.0 # constant
         pre_act_n = max(1, int(pre_act_avg * pre_size + 0.5)) # estimated number of active units
 
-        if (n_links == pre_size):
+        if self.proj in ('conv', 'sparse'):  # per post unit, from its number of links
+            fan_in = np.maximum(1, np.bincount(connection.post_idx, minlength=len(connection.post.units)))
+            post_act_n_max = np.minimum(fan_in, pre_act_n)
+            post_act_n_avg = np.maximum(1, pre_act_avg * fan_in + 0.5)
+            connection.wt_scale_act = 1.0 / np.minimum(post_act_n_max, post_act_n_avg + sem_extra)
+        elif (n_links == pre_size):
             connection.wt_scale_act = 1.0 / pre_act_n
         else:
             post_act_n_max = min(n_links, pre_act_n)
@@ -193,49 +559,70 @@ class ConnectionSpec:
             self._full_projection(connection)
         if self.proj == '1to1':
             self._1to1_projection(connection)
+        if self.proj == 'conv':
+            self._conv_projection(connection)
+        if self.proj == 'sparse':
+            raise ValueError("'sparse' projections are created by pruning a connection "
+                             "(see the `pruning` module)")
 
 
-    def learn(self, connection):
+    def learn(self, connection, apply=True):
         if self.lrule is not None:
             self.learning_rule(connection)
-            self.apply_dwt(connection)
-        for link in connection.links:
-            link.wt = max(0.0, min(1.0, link.wt)) # clipping weights after change
+            if apply:
+                self.apply_dwt(connection)
+        if apply:  # clipping weights after change
+            for block in connection.blocks(len(connection.wt)):
+                wt = connection.wt[block]
+                np.clip(wt, 0.0, 1.0, out=wt)
 
     def apply_dwt(self, connection):
-
-        for link in connection.links:
-            # print('before  wt={}  fwt={}  dwt={}'.format(link.wt, link.fwt, link.dwt))
-            link.dwt *= (1 - link.fwt) if (link.dwt > 0) else link.fwt
-            link.fwt += link.dwt
-            link.wt = self.sig(link.fwt)
-            # print('after   wt={}  fwt={}  dwt={}'.format(link.wt, link.fwt, link.dwt))
-
-            link.dwt = 0.0
+        for block in connection.blocks(len(connection.dwt)):
+            dwt, fwt = connection.dwt[block], connection.fwt[block]
+            dwt *= np.where(dwt > 0, 1 - fwt, fwt)
+            fwt += dwt
+            connection.wt[block] = self.sig(fwt)
+            dwt[:] = 0.0
 
     def learning_rule(self, connection):
         """Leabra learning rule."""
-
-        for i, link in enumerate(connection.links):
-            srs = link.post.avg_s_eff * link.pre.avg_s_eff
-            srm = link.post.avg_m * link.pre.avg_m
-            # print('{}:{} erro {}\n  ru_avg_s_eff={}\n  su_avg_s_eff={}\n  srs={}\n  ru_avg_m={}\n  su_avg_m={}\n  srm={}'.format(connection.post.name, i, self.m_lrn  * self.xcal(srs, srm), link.post.avg_s_eff, link.pre.avg_s_eff, srs, link.post.avg_m, link.pre.avg_m, srm))
-            # print('{}:{} hebb {}\n  avg_l_lrn={}\n  xcal={}\n  srs={}\n  avg_l={}'.format(connection.post.name, i, link.post.avg_l_lrn * self.xcal(srs, link.post.avg_l), link.post.avg_l_lrn, self.xcal(srs, link.post.avg_l), srs, link.post.avg_l))
-            link.dwt += (  self.lrate * ( self.m_lrn * self.xcal(srs, srm)
-                         + link.post.avg_l_lrn * self.xcal(srs, link.post.avg_l)))
+        pre, post = connection.pre, connection.post
+        pre_avg_s_eff, pre_avg_m = pre.unit_array('avg_s_eff'), pre.unit_array('avg_m')
+        post_avg_s_eff, post_avg_m = post.unit_array('avg_s_eff'), post.unit_array('avg_m')
+        post_avg_l, post_avg_l_lrn = post.unit_array('avg_l'), post.unit_array('avg_l_lrn')
+
+        for block in connection.blocks():
+            pre_idx, post_idx = connection.pre_idx[block], connection.post_idx[block]
+            srs = post_avg_s_eff[post_idx] * pre_avg_s_eff[pre_idx]
+            srm = post_avg_m[post_idx] * pre_avg_m[pre_idx]
+            avg_l     = post_avg_l[post_idx]
+            avg_l_lrn = post_avg_l_lrn[post_idx]
+            dwt = (  self.lrate * ( self.m_lrn * self.xcal(srs, srm)
+                   + avg_l_lrn * self.xcal(srs, avg_l)))
+            if connection.wt_idx is None:
+                connection.dwt[block] += dwt
+            else:  # shared weights: changes summed over the links of each weight
+                connection.dwt += np.bincount(connection.wt_idx[block], weights=dwt,
+                                              minlength=len(connection.dwt))
 
     def xcal(self, x, th):
-        if (x < self.d_thr):
-            return 0
-        elif (x > th * self.d_rev):
-            return (x - th)
-        else:
-            return (-x * ((1 - self.d_rev)/self.d_rev))
+        """XCAL check-mark function. Works on scalars as well as arrays."""
+        x, th = np.asarray(x, dtype=float), np.asarray(th, dtype=float)
+        res = np.where(x < self.d_thr, 0.0,
+                       np.where(x > th * self.d_rev, x - th, -x * self.derived.d_rev_slope))
+        return res if res.ndim > 0 else float(res)
 
     def sig(self, w):
-        return 1 / (1 + (self.sig_off * (1 - w) / w) ** self.sig_gain)
+        """Sigmoidal contrast enhancement of weights. Works on scalars as well as arrays."""
+        w = np.asarray(w, dtype=float)
+        with np.errstate(divide='ignore'):
+            res = 1 / (1 + (self.sig_off * (1 - w) / w) ** self.sig_gain)
+        return res if res.ndim > 0 else float(res)
 
     def sig_inv(self, w):
-        if   w <= 0.0: return 0.0
-        elif w >= 1.0: return 1.0
-        return 1 / (1 + ((1 - w) / w) ** (1 / self.sig_gain) / self.sig_off)
+        """Inverse of `sig()`. Works on scalars as well as arrays."""
+        w = np.asarray(w, dtype=float)
+        w_in = np.clip(w, 1e-12, 1.0)  # avoiding division by zero; w <= 0.0 is handled below
+        res = 1 / (1 + ((1 - w_in) / w_in) ** self.derived.sig_gain_inv / self.sig_off)
+        res = np.where(w <= 0.0, 0.0, np.where(w >= 1.0, 1.0, res))
+        return res if res.ndim > 0 else float(res)
@@ -0,0 +1,343 @@
+"""Engines executing the cycles of a network.
+
+The engine is selected with `NetworkSpec.engine`:
+
+    'python'  the reference implementation: the `cycle()` methods of the
+              connections, layers and units.
+    'numpy'   the state of each layer is held in arrays, and updated with
+              vectorized operations (the kernels of the `frozen` module).
+    'numba'   as 'numpy', but each layer cycle (net input, inhibition, units
+              and averages) is a single compiled loop. Requires numba.
+
+The 'numpy' and 'numba' engines load the state of the units in arrays at the
+start of a quarter, and write it back at its end, along with the units's and
+layers's logs. Phases, learning, and everything that happens between quarters
+still runs on the unit objects. When hooks are registered, or when cycles are
+run one by one with `Network.cycle()`, the units are updated after every cycle.
+
+Engines implement the standard specs only: specs overriding the methods used
+during cycles are rejected (`avg_l_lrn()`, only used in learning, can be
+overridden). The units of a layer must share one spec; per-unit parameters
+(`Layer(unit_params=...)`) are read as arrays, and broadcast over the units.
+All engines are checked against the same emergent
+traces (see the `parity` module).
+
+With `NetworkSpec.dtype = 'float32'`, the 'numpy' and 'numba' engines hold the
+units's state in single precision during quarters; the 'python' engine keeps
+the units's variables as Python floats, and only the weights are single
+precision.
+"""
+import numpy as np
+
+from .unit import UnitSpec
+from .layer import LayerSpec
+from .connection import ConnectionSpec
+from .frozen import FrozenNetwork, UNIT_PARAMS, LAYER_PARAMS, derived_params, _param
+from .profiling import connection_name
+
+
+ENGINES = ('python', 'numpy', 'numba')
+
+UNIT_VARS  = ('g_e', 'I_net', 'I_net_r', 'v_m', 'v_m_eq', 'act', 'act_nd', 'adapt', 'spike',
+              'avg_ss', 'avg_s', 'avg_m', 'avg_s_eff')
+AVG_PARAMS = ('avg_ss_dt', 'avg_s_dt', 'avg_m_dt', 'avg_m_in_s')
+LAYER_VARS = ('gc_i', 'ffi', 'fbi', 'avg_act')
+
+CYCLE_METHODS = ((UnitSpec, ('cycle', 'calculate_net_in', 'integrate_I_net', 'update_avgs',
+                             'xx1', 'noisy_xx1')),
+                 (LayerSpec, ('cycle', '_inhibition')),
+                 (ConnectionSpec, ('cycle',)))
+
+
+class _NoTiming:
+    """Context manager doing nothing, used when profiling is disabled"""
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NO_TIMING = _NoTiming()
+
+def _no_timing(stage, name):
+    return _NO_TIMING
+
+
+def create_engine(name):
+    """Return the engine named `name`, or None for the reference ('python') engine"""
+    if name == 'python':
+        return None
+    elif name == 'numpy':
+        return NumPyEngine()
+    elif name == 'numba':
+        return NumbaEngine()
+    raise ValueError("unknown engine '{}', must be one of {}".format(name, ENGINES))
+
+
+class NumPyEngine:
+    """Vectorized engine: one set of array operations per layer and per cycle"""
+
+    name = 'numpy'
+
+    def run(self, network, n_cycles):
+        """Execute `n_cycles` cycles of the network, within the current quarter"""
+        layers = self._load(network)
+        dtype  = np.dtype(network.spec.dtype)
+        conns  = [(network.layers.index(conn.pre), network.layers.index(conn.post), conn)
+                  for conn in network.connections]
+        minus  = network.phase == 'minus'
+        records = [{name: [] for name in st['log_names']} for st in layers]
+        timing = _no_timing if network.profiler is None else network.profiler.timing
+        conn_names = [connection_name(conn) for conn in network.connections]
+
+        for _ in range(n_cycles):
+            net_raw = [np.zeros(st['size'], dtype=dtype) for st in layers]
+            for (i_pre, i_post, conn), conn_name in zip(conns, conn_names):  # previous cycle's activities
+                with timing('propagation', conn_name):
+                    net_raw[i_post] += (conn.spec.wt_scale_abs * conn.wt_scale
+                                        * conn.spec.netin(conn, layers[i_pre]['act'][0]))
+            for st, net, record in zip(layers, net_raw, records):
+                with timing('integration', st['name']):
+                    self._layer_cycle(st, net, minus, timing)
+                with timing('logging', st['name']):
+                    for name, values in record.items():
+                        values.append(self._log_value(st, name))
+
+        self._store(network, layers, records, n_cycles)
+        network.cycle_count += n_cycles
+        network.cycle_tot   += n_cycles
+
+    def _layer_cycle(self, st, net, minus, timing):
+        p, forced = st['unit'], st['forced']
+        # net input (UnitSpec.calculate_net_in())
+        st['g_e'] = np.where(forced, st['g_e'], st['g_e'] + p['dt_net'] * (net - st['g_e']))
+        # inhibition, computed in the minus phase only (LayerSpec.cycle())
+        if minus:
+            with timing('inhibition', st['name']):
+                st['gc_i'] = FrozenNetwork._inhibition(st['spec'], st)
+        # units (UnitSpec.cycle()), for non-forced units
+        if not forced.all():
+            saved = {name: st[name].copy() for name in UNIT_VARS} if forced.any() else None
+            FrozenNetwork._unit_cycle(p, st['nxx1'], st, st['gc_i'])
+            if saved is not None:
+                for name in UNIT_VARS:
+                    st[name] = np.where(forced, saved[name], st[name])
+        # averages (UnitSpec.update_avgs()), for all units
+        st['avg_ss'] += p['avg_ss_dt'] * (st['act_nd'] - st['avg_ss'])
+        st['avg_s']  += p['avg_s_dt']  * (st['avg_ss'] - st['avg_s'])
+        st['avg_m']  += p['avg_m_dt']  * (st['avg_s']  - st['avg_m'])
+        st['avg_s_eff'] = p['avg_m_in_s'] * st['avg_m'] + (1 - p['avg_m_in_s']) * st['avg_s']
+        st['avg_act'] = st['act'].mean(axis=1)
+
+    @staticmethod
+    def _log_value(st, name):
+        if name == 'net':
+            return st['unit']['g_bar_e'] * st['g_e'][0]
+        if name == 'act_eq':
+            return st['act'][0].copy()
+        value = st[name]
+        return value[0].copy() if value.ndim == 2 else float(np.ravel(value)[0])
+
+    def _load(self, network):
+        """Gather the state and parameters of the layers in arrays"""
+        check_specs(network)
+        dtype = np.dtype(network.spec.dtype)
+        layers = []
+        for layer in network.layers:
+            unit_spec = layer.units[0].spec
+            st = {name: np.array([[float(getattr(u, name, 0.0)) for u in layer.units]], dtype=dtype)
+                  for name in UNIT_VARS}
+            st.update({name: np.array([float(getattr(layer, name))], dtype=dtype) for name in LAYER_VARS})
+            st['gc_i'] = st['gc_i'][:, np.newaxis]
+            st['name']   = layer.name
+            st['size']   = len(layer.units)
+            st['forced'] = np.array([[u.act_ext is not None for u in layer.units]])
+            st['unit'] = {name: _param(getattr(unit_spec, name)) for name in UNIT_PARAMS + AVG_PARAMS}
+            st['unit'].update({name: values.astype(dtype) for name, values in layer.unit_params.items()})
+            st['unit'].update({name: (value.astype(dtype) if isinstance(value, np.ndarray) else value)
+                               for name, value in derived_params(unit_spec, layer.unit_params).items()})
+            st['spec'] = {name: _param(getattr(layer.spec, name)) for name in LAYER_PARAMS}
+            st['nxx1'] = (None, None)
+            if unit_spec.noisy_act:
+                unit_spec.noisy_xx1(0.0)  # forcing the computation of the lookup table
+                st['nxx1'] = unit_spec._nxx1_conv
+            st['log_names'] = sorted({name for u in layer.units for name in u.log_names}
+                                     | set(layer.logs.keys()))
+            for name in st['log_names']:
+                if name not in st and name not in ('net', 'act_eq'):
+                    raise ValueError("the '{}' variable cannot be logged by the {} engine".format(
+                                     name, self.name))
+            layers.append(st)
+        return layers
+
+    def _store(self, network, layers, records, n_cycles):
+        """Write the state of the layers back in the units and layers objects, and their logs"""
+        names = [name for name in UNIT_VARS if name != 'spike']
+        for layer, st, record in zip(network.layers, layers, records):
+            values = zip(*[st[name][0].tolist() for name in names])
+            logs = {name: np.array(record[name]).reshape(n_cycles, -1).T.tolist()
+                    for name in layer.units[0].log_names} if n_cycles > 0 else {}
+            forced = st['forced'][0]
+            for j, (unit, unit_values) in enumerate(zip(layer.units, values)):
+                unit.__dict__.update(zip(names, unit_values))
+                if not forced[j]:
+                    unit.spike = int(st['spike'][0, j])
+                for name in unit.log_names:
+                    unit.logs[name].extend(logs[name][j] if name in logs else
+                                           [record[name][t][j] for t in range(n_cycles)])
+            layer.gc_i = float(np.ravel(st['gc_i'])[0])
+            for name in ('ffi', 'fbi', 'avg_act'):
+                setattr(layer, name, float(st[name][0]))
+            for name in layer.logs:
+                layer.logs[name].extend(record[name])
+            layer.spec.cycle_count += n_cycles
+
+
+class NumbaEngine(NumPyEngine):
+    """Compiled engine: each layer cycle is a single loop over the units"""
+
+    name = 'numba'
+
+    def __init__(self):
+        try:
+            import numba
+        except ImportError:
+            raise ImportError("the 'numba' engine requires the numba package")
+        self._kernel = _numba_kernel(numba)
+
+    def _layer_cycle(self, st, net, minus, timing):  # inhibition is timed with the units
+        if 'arrays' not in st:  # packing the state and parameters, once per quarter
+            st['arrays'] = _pack(st)
+        U, params, lay, layer_params, xs, conv = st['arrays']
+        self._kernel(U, net, st['forced'][0], params, lay, layer_params, minus, xs, conv,
+                     st['unit']['noisy_act'])
+        for k, name in enumerate(UNIT_VARS):
+            st[name] = U[k:k+1]
+        st['gc_i'], st['ffi'], st['fbi'], st['avg_act'] = (lay[0:1, np.newaxis], lay[1:2],
+                                                           lay[2:3], lay[3:4])
+
+
+KERNEL_PARAMS = ('dt_net', 'dt_v_m', 'gc_l', 'g_bar_e', 'g_bar_i', 'e_rev_e', 'e_rev_l',
+                 'e_rev_i', 'act_thr', 'act_gain', 'v_m_r', 'adapt_on', 'dt_adapt', 'v_m_gain',
+                 'spike_gain') + AVG_PARAMS
+
+
+def _pack(st):
+    """State and parameters of a layer, as the arrays of the numba kernel"""
+    U = np.vstack([st[name] for name in UNIT_VARS])
+    # one column for homogeneous layers, one per unit for layers with per-unit parameters
+    n_cols = max(np.size(st['unit'][name]) for name in KERNEL_PARAMS)
+    params = np.array([np.broadcast_to(np.asarray(st['unit'][name], dtype=float), (n_cols,))
+                       for name in KERNEL_PARAMS])
+    lay = np.array([float(np.ravel(st[name])[0]) for name in LAYER_VARS])
+    layer_params = np.array([float(st['spec'][name]) for name in LAYER_PARAMS])
+    xs, conv = st['nxx1'] if st['nxx1'][0] is not None else (np.zeros(1), np.zeros(1))
+    return U, params, lay, layer_params, xs, conv
+
+_KERNEL = None
+
+def _numba_kernel(numba):
+    """Compile (once) the fused layer cycle"""
+    global _KERNEL
+    if _KERNEL is not None:
+        return _KERNEL
+
+    (G_E, I_NET, I_NET_R, V_M, V_M_EQ, ACT, ACT_ND, ADAPT, SPIKE,
+     AVG_SS, AVG_S, AVG_M, AVG_S_EFF) = range(len(UNIT_VARS))
+    (DT_NET, DT_V_M, GC_L, G_BAR_E, G_BAR_I, E_REV_E, E_REV_L, E_REV_I, ACT_THR,
+     ACT_GAIN, V_M_R, ADAPT_ON, DT_ADAPT, V_M_GAIN, SPIKE_GAIN,
+     AVG_SS_DT, AVG_S_DT, AVG_M_DT, AVG_M_IN_S) = range(len(KERNEL_PARAMS))
+    LAY_INHIB, FB_DT, FB, FF, G_I, FF0 = range(len(LAYER_PARAMS))
+    GC_I, FFI, FBI, AVG_ACT = range(len(LAYER_VARS))
+
+    @numba.njit(cache=True)
+    def layer_cycle(U, net, forced, P, lay, lp, minus, xs, conv, noisy):
+        n = U.shape[1]
+        hetero = P.shape[1] > 1  # per-unit parameters
+        # net input
+        g_e_sum = 0.0
+        for j in range(n):
+            p = P[:, j] if hetero else P[:, 0]
+            if not forced[j]:
+                U[G_E, j] += p[DT_NET] * (net[j] - U[G_E, j])
+            g_e_sum += U[G_E, j]
+        # inhibition
+        if minus:
+            if lp[LAY_INHIB] != 0.0:
+                lay[FFI] = lp[FF] * max(0.0, g_e_sum / n - lp[FF0])
+                lay[FBI] += lp[FB_DT] * (lp[FB] * lay[AVG_ACT] - lay[FBI])
+                lay[GC_I] = lp[G_I] * (lay[FFI] + lay[FBI])
+            else:
+                lay[GC_I] = 0.0
+        # units
+        act_sum = 0.0
+        for j in range(n):
+            p = P[:, j] if hetero else P[:, 0]
+            if not forced[j]:
+                dt_v_m, gc_l = p[DT_V_M], p[GC_L]
+                gc_i = p[G_BAR_I] * lay[GC_I]
+                gc_e, adapt = p[G_BAR_E] * U[G_E, j], U[ADAPT, j]
+                v_m = U[V_M, j]
+                I_net = (gc_e * (p[E_REV_E] - v_m) + gc_i * (p[E_REV_I] - v_m)
+                         + gc_l * (p[E_REV_L] - v_m) - adapt)
+                v_m_half = v_m + 0.5 * dt_v_m * I_net
+                I_net = (gc_e * (p[E_REV_E] - v_m_half) + gc_i * (p[E_REV_I] - v_m_half)
+                         + gc_l * (p[E_REV_L] - v_m_half) - adapt)
+                v_m_eq = U[V_M_EQ, j]
+                I_net_r = (gc_e * (p[E_REV_E] - v_m_eq) + gc_i * (p[E_REV_I] - v_m_eq)
+                           + gc_l * (p[E_REV_L] - v_m_eq) - adapt)
+                v_m += dt_v_m * I_net
+                v_m_eq += dt_v_m * I_net_r
+                spike = 0.0
+                if v_m > p[ACT_THR]:
+                    spike, v_m, I_net = 1.0, p[V_M_R], 0.0
+
+                if v_m_eq <= p[ACT_THR]:
+                    x = v_m_eq - p[ACT_THR]
+                else:
+                    g_e_thr = (  gc_i * (p[E_REV_I] - p[ACT_THR]) + gc_l * (p[E_REV_L] - p[ACT_THR])
+                               - adapt) / (p[ACT_THR] - p[E_REV_E])
+                    x = gc_e - g_e_thr
+                if noisy and x < xs[0]:
+                    new_act = 0.0
+                elif noisy and x <= xs[-1]:
+                    new_act = np.interp(x, xs, conv)
+                else:
+                    X = p[ACT_GAIN] * max(x, 0.0)
+                    new_act = X / (X + 1)
+
+                U[ACT_ND, j] += dt_v_m * (new_act - U[ACT_ND, j])
+                U[ACT, j] = U[ACT_ND, j]
+                if p[ADAPT_ON] != 0.0:
+                    U[ADAPT, j] += (p[DT_ADAPT] * (p[V_M_GAIN] * (v_m - p[E_REV_L]) - adapt)
+                                    + spike * p[SPIKE_GAIN])
+                U[V_M, j], U[V_M_EQ, j] = v_m, v_m_eq
+                U[I_NET, j], U[I_NET_R, j], U[SPIKE, j] = I_net, I_net_r, spike
+            # averages
+            U[AVG_SS, j] += p[AVG_SS_DT] * (U[ACT_ND, j] - U[AVG_SS, j])
+            U[AVG_S, j]  += p[AVG_S_DT]  * (U[AVG_SS, j] - U[AVG_S, j])
+            U[AVG_M, j]  += p[AVG_M_DT]  * (U[AVG_S, j]  - U[AVG_M, j])
+            U[AVG_S_EFF, j] = p[AVG_M_IN_S] * U[AVG_M, j] + (1 - p[AVG_M_IN_S]) * U[AVG_S, j]
+            act_sum += U[ACT, j]
+        lay[AVG_ACT] = act_sum / n
+
+    _KERNEL = layer_cycle
+    return _KERNEL
+
+
+def check_specs(network):
+    """Raise ValueError if the network uses specs the vectorized engines do not implement"""
+    for layer in network.layers:
+        unit_spec = layer.units[0].spec
+        if any(u.spec is not unit_spec for u in layer.units):
+            raise ValueError('layer {} has heterogeneous unit specs'.format(layer.name))
+    specs = ([layer.units[0].spec for layer in network.layers] + [layer.spec for layer in network.layers]
+             + [conn.spec for conn in network.connections])
+    for spec in specs:
+        for base, methods in CYCLE_METHODS:
+            if isinstance(spec, base):
+                for name in methods:
+                    if getattr(type(spec), name) is not getattr(base, name):
+                        raise ValueError('{} overrides {}(), which is not supported by the '
+                                         'vectorized engines'.format(type(spec).__name__, name))
@@ -0,0 +1,386 @@
+"""Frozen networks: a single-file inference artifact, and its runtime.
+
+`freeze()` writes the topology, the parameters of the specs and the weights of
+a trained network in one `.npz` file. `FrozenNetwork.load()` reads it back and
+runs the minus phase settling of the network, vectorized over units and over
+batches of input patterns. This module only depends on NumPy, and does not
+build any Unit, Layer or Connection object.
+
+Only the parameters of the specs are frozen: spec subclasses overriding methods
+are not reproduced. Each call to `settle()` starts from a fresh state, as a newly
+built network would. The state is separate from the network (see the `state`
+module), so that one frozen network can settle several states concurrently.
+`FrozenNetwork.from_network()` creates a frozen network directly from a
+`Network`, without a file, to serve concurrent states with its weights.
+
+For deployment, weights can be quantized to integers, with one scale per
+connection (`freeze(..., quantize='int8')` or `FrozenNetwork.quantize()`), and
+the accuracy of the quantized network checked against the float one on a
+validation set with `quantization_report()`.
+"""
+import copy
+import json
+import time
+
+import numpy as np
+
+from .state import FrozenState
+
+
+UNIT_PARAMS  = ('tau_net', 'tau_v_m', 'g_l', 'g_bar_e', 'g_bar_l', 'g_bar_i',
+                'e_rev_e', 'e_rev_l', 'e_rev_i', 'act_thr', 'act_gain', 'noisy_act',
+                'v_m_init', 'v_m_r', 'adapt_on', 'dt_adapt', 'v_m_gain', 'spike_gain')
+LAYER_PARAMS = ('lay_inhib', 'fb_dt', 'fb', 'ff', 'g_i', 'ff0')
+DERIVED_PARAMS = ('dt_net', 'dt_v_m', 'gc_l')  # from `UnitSpec.derived`
+
+FORMAT_VERSION = 3  # 2: quantized weights, 3: derived constants
+ACT_LEVELS = 255    # quantization levels of the activities, for integer accumulation
+QUANT_BLOCK = 2**16 # quantized weights converted at once, to compute a net input
+
+
+def freeze(network, path, quantize=None, accumulate='float32'):
+    """Write the frozen version of `network` in the `path` file (`.npz`).
+
+    :param quantize:    if not None, the integer type of the quantized weights
+                        (see `FrozenNetwork.quantize()`).
+    :param accumulate:  accumulation of the quantized net inputs.
+    """
+    meta, arrays = _freeze(network, quantize=quantize, accumulate=accumulate)
+    np.savez(path, meta=np.array(json.dumps(meta)), **arrays)
+
+def _freeze(network, quantize=None, accumulate='float32'):
+    """Return the metadata and the arrays of the frozen version of `network`"""
+    meta = {'version': FORMAT_VERSION, 'quarter_size': network.spec.quarter_size,
+            'layers': [], 'connections': []}
+    arrays = {}
+
+    for i, layer in enumerate(network.layers):
+        unit_spec = layer.units[0].spec
+        if any(u.spec is not unit_spec for u in layer.units):
+            raise ValueError('layer {} has heterogeneous unit specs'.format(layer.name))
+        meta['layers'].append({'name': layer.name, 'size': len(layer.units), 'genre': layer.genre,
+                               'unit': {p: _param(getattr(unit_spec, p)) for p in UNIT_PARAMS},
+                               'spec': {p: _param(getattr(layer.spec, p)) for p in LAYER_PARAMS}})
+        if unit_spec.noisy_act:
+            unit_spec.noisy_xx1(0.0)  # forcing the computation of the lookup table
+            arrays['layer{}/nxx1_xs'.format(i)], arrays['layer{}/nxx1_conv'.format(i)] = unit_spec._nxx1_conv
+        for name, values in layer.unit_params.items():
+            arrays['layer{}/unit/{}'.format(i, name)] = values
+        for name, value in derived_params(unit_spec, layer.unit_params).items():
+            if np.ndim(value) > 0:
+                arrays['layer{}/unit/{}'.format(i, name)] = value
+            else:
+                meta['layers'][-1]['unit'][name] = value
+
+    for i, conn in enumerate(network.connections):
+        conn.compute_netin_scaling()
+        W = np.zeros((len(conn.pre.units), len(conn.post.units)), dtype=conn.wt.dtype)
+        W[conn.pre_idx, conn.post_idx] = conn.link_wt
+        scale = conn.spec.wt_scale_abs * conn.wt_scale
+        if np.ndim(scale) > 0:  # per post unit scaling ('conv' projections), folded in the weights
+            W *= scale
+            scale = 1.0
+        meta['connections'].append({'pre': network.layers.index(conn.pre),
+                                    'post': network.layers.index(conn.post),
+                                    'scale': float(scale)})
+        if quantize is not None:
+            W, meta['connections'][-1]['w_scale'] = quantize_weights(W, quantize)
+            meta['connections'][-1]['accumulate'] = _check_accumulate(accumulate)
+        arrays['connection{}/W'.format(i)] = W
+    return meta, arrays
+
+
+class FrozenNetwork:
+    """Inference-only network, loaded from a file created by `freeze()`, or
+    created from a `Network` with `from_network()`.
+
+    It runs the minus phase only: no plus phase, and no learning. Spec
+    subclasses are not reproduced, only the spec parameters. It is the only
+    way to advance several states concurrently against the same weights: a
+    `Network` keeps its state on its units and layers.
+    """
+
+    def __init__(self, meta, arrays):
+        self.quarter_size = meta['quarter_size']
+        self.layers       = meta['layers']
+        self.connections  = meta['connections']
+        self.names        = [layer['name'] for layer in self.layers]
+        for i, layer in enumerate(self.layers):
+            layer['nxx1'] = (arrays.get('layer{}/nxx1_xs'.format(i)),
+                             arrays.get('layer{}/nxx1_conv'.format(i)))
+            prefix = 'layer{}/unit/'.format(i)
+            layer['unit'].update({name[len(prefix):]: values for name, values in arrays.items()
+                                  if name.startswith(prefix)})
+            p = layer['unit']
+            if 'dt_net' not in p:  # version 1 and 2 files: derived constants not frozen
+                p.update(dt_net=1.0 / np.asarray(p['tau_net']), dt_v_m=1.0 / np.asarray(p['tau_v_m']),
+                         gc_l=np.asarray(p['g_bar_l']) * np.asarray(p['g_l']))
+        for i, conn in enumerate(self.connections):
+            conn['W'] = arrays['connection{}/W'.format(i)]
+            conn['W'].flags.writeable = False  # weights are shared by all states
+
+    @classmethod
+    def load(cls, path):
+        """Load a frozen network from a file created by `freeze()`"""
+        with np.load(path) as npz:
+            meta = json.loads(str(npz['meta']))
+            if meta['version'] not in (1, 2, FORMAT_VERSION):
+                raise ValueError('unsupported frozen network version: {}'.format(meta['version']))
+            arrays = {name: npz[name] for name in npz.files if name != 'meta'}
+        return cls(meta, arrays)
+
+    @classmethod
+    def from_network(cls, network):
+        """Return the frozen version of `network`, without writing it to a file.
+
+        The weights are copied: the frozen network is not affected when
+        `network` continues learning.
+        """
+        return cls(*_freeze(network))
+
+    def settle(self, inputs=None, state=None):
+        """Run the minus phase, and return the activities of all layers at its end.
+
+        :param inputs:  dict with layer names as keys, and activities as values.
+                        Activities can be 1-d arrays, or 2-d arrays of shape
+                        `(batch_size, layer_size)` to settle a batch of patterns
+                        at once. Not needed when resuming a `state`.
+        :param state:   the `FrozenState` to settle, as created by `new_state()`,
+                        and possibly advanced with `run()`. If None, a new
+                        state is allocated for `inputs`.
+        :returns:       a dict with layer names as keys and the `act_m` activities
+                        as values, with the same dimensions as the inputs.
+        """
+        if state is None:
+            if inputs is None:
+                raise ValueError('settle() requires inputs, or a state to resume')
+            state = self.new_state(inputs)
+        self.run(state, 3 * self.quarter_size - state.cycle_count)
+        return {layer['name']: (st['act'] if state.batched else st['act'][0])
+                for layer, st in zip(self.layers, state.layers)}
+
+    def new_state(self, inputs):
+        """Return a fresh `FrozenState`, with the activities of `inputs` forced.
+
+        The frozen network is never modified by running a state: any number of
+        states can be run concurrently, for instance from different threads.
+        """
+        inputs  = {name: np.asarray(acts, dtype=float) for name, acts in inputs.items()}
+        batch_size = max([len(acts) for acts in inputs.values() if acts.ndim == 2] or [1])
+        return FrozenState([self._init_state(i, inputs.get(layer['name']), batch_size)
+                            for i, layer in enumerate(self.layers)],
+                           batched=any(acts.ndim == 2 for acts in inputs.values()))
+
+    def run(self, state, n_cycles):
+        """Advance `state` by `n_cycles` cycles, in place."""
+        if not isinstance(state, FrozenState):
+            raise TypeError('expected a FrozenState, as returned by new_state(), got a {}'.format(
+                            type(state).__name__))
+        for _ in range(n_cycles):
+            self._cycle(state.layers)
+        state.cycle_count += n_cycles
+
+    def _init_state(self, i, forced, batch_size):
+        """State of a layer at the start of a trial"""
+        p = self.layers[i]['unit']
+        shape = (batch_size, self.layers[i]['size'])
+        st = {'g_e': np.zeros(shape), 'v_m': np.full(shape, p['v_m_init']),
+              'v_m_eq': np.full(shape, p['v_m_init']), 'act': np.zeros(shape),
+              'act_nd': np.zeros(shape), 'adapt': np.zeros(shape),
+              'ffi': np.zeros(batch_size), 'fbi': np.zeros(batch_size),
+              'avg_act': np.zeros(batch_size), 'forced': forced is not None}
+        if forced is not None:  # see UnitSpec.force_activity()
+            act = np.broadcast_to(forced, shape).copy()
+            st['g_e'] = act / p['g_bar_e']
+            st['act'], st['act_nd'] = act, act.copy()
+            st['v_m'] = np.where(act == 0, p['e_rev_l'], p['act_thr'] + act / p['act_gain'])
+            st['v_m_eq'] = st['v_m'].copy()
+        return st
+
+    def _cycle(self, states):
+        """Execute one cycle, updating the layers's states in place"""
+        # connections transmit the activities of the previous cycle
+        net_raw = [0.0] * len(self.layers)
+        for conn in self.connections:
+            if not states[conn['post']]['forced']:
+                net_raw[conn['post']] = (net_raw[conn['post']]
+                                         + conn['scale'] * self._netin(conn, states[conn['pre']]['act']))
+
+        for layer, st, net in zip(self.layers, states, net_raw):
+            if not st['forced']:
+                p = layer['unit']
+                st['g_e'] += p['dt_net'] * (net - st['g_e'])
+                g_i = self._inhibition(layer['spec'], st)
+                self._unit_cycle(p, layer['nxx1'], st, g_i)
+            else:
+                self._inhibition(layer['spec'], st)
+            st['avg_act'] = st['act'].mean(axis=1)
+
+    @staticmethod
+    def _netin(conn, acts):
+        """Unscaled net input of a connection"""
+        if 'w_scale' not in conn:
+            return np.dot(acts, conn['W'])
+        W = conn['W']
+        if conn['accumulate'] == 'float32':
+            return conn['w_scale'] * _blocked_dot(acts.astype(np.float32), W, np.float32)
+        # 'int': activities quantized as well, exact integer accumulation
+        acc_dtype = np.int32 if ACT_LEVELS * np.iinfo(W.dtype).max * len(W) < 2**31 else np.int64
+        acts_q = np.rint(acts * ACT_LEVELS).astype(acc_dtype)
+        return (conn['w_scale'] / ACT_LEVELS) * _blocked_dot(acts_q, W, acc_dtype)
+
+    def quantize(self, dtype='int8', accumulate='float32'):
+        """Return a copy of the network, with weights quantized to the integer `dtype`.
+
+        Each connection's weights are stored as `w_scale * W`, with `W` integers
+        and `w_scale` chosen so that the largest weight maps to the largest
+        integer of `dtype`: 'int8' and 'uint8' divide the memory of the weights
+        by 8, 'int16' and 'uint16' by 4. Weights being positive, unsigned types
+        have twice the resolution.
+
+        :param accumulate:  'float32', the integer weights are converted and
+                            multiplied in single precision (with BLAS);
+                            or 'int', the activities are quantized to
+                            `ACT_LEVELS` levels and accumulated exactly, in
+                            int32 (int64 if int32 could overflow).
+
+        The weights are converted by blocks of `QUANT_BLOCK` weights, so that
+        settling never holds a converted copy of a weight matrix. The
+        conversion takes about the time saved by the smaller matrices:
+        settling is not faster than with float weights, and 'int'
+        accumulation is slower, as NumPy has no BLAS path for integers.
+        """
+        _check_accumulate(accumulate)
+        quantized = copy.copy(self)
+        quantized.connections = []
+        for conn in self.connections:
+            conn = dict(conn)
+            W = conn['W'] if 'w_scale' not in conn else conn['w_scale'] * conn['W'].astype(float)
+            conn['W'], conn['w_scale'] = quantize_weights(W, dtype)
+            conn['W'].flags.writeable = False
+            conn['accumulate'] = accumulate
+            quantized.connections.append(conn)
+        return quantized
+
+    @property
+    def weight_nbytes(self):
+        """Memory used by the weights, in bytes"""
+        return sum(conn['W'].nbytes for conn in self.connections)
+
+    @staticmethod
+    def _inhibition(spec, st):
+        """Layer inhibition (see LayerSpec._inhibition()), as a `(batch_size, 1)` array"""
+        if not spec['lay_inhib']:
+            return np.zeros((len(st['avg_act']), 1))
+        st['ffi'] = spec['ff'] * np.maximum(0, st['g_e'].mean(axis=1) - spec['ff0'])
+        st['fbi'] += spec['fb_dt'] * (spec['fb'] * st['avg_act'] - st['fbi'])
+        return (spec['g_i'] * (st['ffi'] + st['fbi']))[:, np.newaxis]
+
+    @staticmethod
+    def _unit_cycle(p, nxx1, st, g_i):
+        """Units update (see UnitSpec.cycle()), for non-forced layers"""
+        dt_v_m, gc_l = p['dt_v_m'], p['gc_l']
+        gc_e = p['g_bar_e'] * st['g_e']
+        gc_i = p['g_bar_i'] * g_i
+
+        def current(v_m):
+            return (  gc_e * (p['e_rev_e'] - v_m) + gc_i * (p['e_rev_i'] - v_m)
+                    + gc_l * (p['e_rev_l'] - v_m) - st['adapt'])
+
+        # half-step integration for I_net, one-step for I_net_r
+        I_net = current(st['v_m'])
+        I_net = current(st['v_m'] + 0.5 * dt_v_m * I_net)
+        I_net_r = current(st['v_m_eq'])
+
+        st['v_m']    += dt_v_m * I_net
+        st['v_m_eq'] += dt_v_m * I_net_r
+        spike = st['v_m'] > p['act_thr']
+        st['v_m'] = np.where(spike, p['v_m_r'], st['v_m']).astype(st['v_m'].dtype, copy=False)
+        st['I_net'], st['I_net_r'] = np.where(spike, 0.0, I_net), I_net_r
+        st['spike'] = spike.astype(float)
+
+        g_e_thr = (  gc_i * (p['e_rev_i'] - p['act_thr']) + gc_l * (p['e_rev_l'] - p['act_thr'])
+                   - st['adapt']) / (p['act_thr'] - p['e_rev_e'])
+        x = np.where(st['v_m_eq'] <= p['act_thr'], st['v_m_eq'] - p['act_thr'], gc_e - g_e_thr)
+        new_act = _noisy_xx1(x, p['act_gain'], *nxx1) if p['noisy_act'] else _xx1(x, p['act_gain'])
+
+        st['act_nd'] += dt_v_m * (new_act - st['act_nd'])
+        st['act'] = st['act_nd'].copy()
+
+        if p['adapt_on']:
+            st['adapt'] += (  p['dt_adapt'] * (p['v_m_gain'] * (st['v_m'] - p['e_rev_l']) - st['adapt'])
+                            + spike * p['spike_gain'])
+
+
+def derived_params(unit_spec, unit_params):
+    """The `DERIVED_PARAMS` of a layer's units, as floats, or as per-unit arrays
+    if they depend on the layer's per-unit parameters"""
+    derived = unit_spec.derived if not unit_params else unit_spec.derive_with(unit_params)
+    return {name: (_param(getattr(derived, name)) if np.ndim(getattr(derived, name)) == 0
+                   else getattr(derived, name)) for name in DERIVED_PARAMS}
+
+def quantize_weights(W, dtype):
+    """Return the integer weights `W_q` and the scale `w_scale`, with `W ~= w_scale * W_q`"""
+    w_max = float(np.abs(W).max()) if W.size > 0 else 0.0
+    w_scale = w_max / np.iinfo(dtype).max if w_max > 0 else 1.0
+    return np.rint(W / w_scale).astype(dtype), w_scale
+
+def quantization_report(frozen, quantized, inputs, targets=None):
+    """Compare a quantized network to the float one on a validation set.
+
+    :param inputs:   the validation patterns, as a dict with layer names as
+                     keys, and `(n_patterns, layer_size)` arrays as values.
+    :param targets:  the target activities of the output layers, in the same
+                     format, to compare the sum of squared errors (`sse`).
+    :returns:        a dict with, for each layer, the maximum and mean absolute
+                     differences of `act_m` (`'act_m'`); for each target layer,
+                     the mean `sse` of both networks (`'sse'`); the memory of
+                     the weights (`'weight_nbytes'`) and the time of settling
+                     the validation set (`'time'`), for both networks.
+    """
+    from . import metrics
+    results = []
+    for network in (frozen, quantized):
+        start = time.perf_counter()
+        act_m = network.settle(inputs)
+        results.append((act_m, time.perf_counter() - start))
+    (acts, t), (acts_q, t_q) = results
+
+    report = {'act_m': {}, 'sse': {},
+              'weight_nbytes': (frozen.weight_nbytes, quantized.weight_nbytes), 'time': (t, t_q)}
+    for name in frozen.names:
+        delta = np.abs(np.asarray(acts[name]) - np.asarray(acts_q[name]))
+        report['act_m'][name] = {'max': float(delta.max()), 'mean': float(delta.mean())}
+    for name, target in ({} if targets is None else targets).items():
+        report['sse'][name] = (float(np.mean(metrics.sse(target, acts[name]))),
+                               float(np.mean(metrics.sse(target, acts_q[name]))))
+    return report
+
+def _blocked_dot(acts, W, dtype):
+    """`np.dot(acts, W.astype(dtype))`, without a converted copy of `W`: the rows
+    of `W` are converted by blocks of about `QUANT_BLOCK` weights, in one buffer"""
+    rows = max(1, QUANT_BLOCK // max(1, W.shape[1]))
+    buffer = np.empty((min(rows, len(W)), W.shape[1]), dtype=dtype)
+    out = np.zeros(np.shape(acts)[:-1] + (W.shape[1],), dtype=dtype)
+    for r in range(0, len(W), rows):
+        block = buffer[:min(rows, len(W) - r)]
+        block[...] = W[r:r + len(block)]
+        out += np.dot(acts[..., r:r + len(block)], block)
+    return out
+
+def _check_accumulate(accumulate):
+    if accumulate not in ('float32', 'int'):
+        raise ValueError("accumulate must be 'float32' or 'int', not {!r}".format(accumulate))
+    return accumulate
+
+def _param(value):
+    return value if isinstance(value, bool) else float(value)
+
+def _xx1(x, act_gain):
+    X = act_gain * np.maximum(x, 0.0)
+    return X / (X + 1)
+
+def _noisy_xx1(x, act_gain, xs, conv):
+    """Vectorized version of UnitSpec.noisy_xx1(), from its precomputed lookup table"""
+    return np.where(x < xs[0], 0.0,
+                    np.where(x > xs[-1], _xx1(x, act_gain), np.interp(x, xs, conv)))
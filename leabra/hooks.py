@@ -0,0 +1,88 @@
+"""Callbacks on the network's cycle, quarter, phase and trial boundaries.
+
+Callbacks are registered with `Network.add_hook(event, callback)`, and are
+called as `callback(network, state)`, where `state` gives access to the state
+of the layers as arrays: `state['hidden_layer']['act']`. Arrays are built on
+first access, and shared by all the callbacks of an event: they should not be
+modified.
+
+Events, in the order they happen at the end of a trial:
+
+    cycle        after the units and layers are updated, before the end of
+                 phase updates (as emergent's cycle logs)
+    quarter      at the end of each quarter
+    minus_phase  after the minus phase activities (`act_m`) are stored
+    plus_phase   after learning
+    trial        at the end of the trial
+
+Units record their `log_names` variables at every cycle: creating the layers
+with `Layer(..., log_names=())` and recording with a hook moves monitoring out
+of the units.
+
+Cached results of `Network.test_trial()` call the 'minus_phase' hooks, but not
+the 'cycle' and 'quarter' hooks (see `Network.test_trial()`).
+"""
+import numpy as np
+
+
+EVENTS = ('cycle', 'quarter', 'minus_phase', 'plus_phase', 'trial')
+
+
+class LayerView:
+    """Arrays of the units's variables of a layer, built on demand"""
+
+    def __init__(self, layer):
+        self.layer   = layer
+        self._arrays = {}
+
+    def __getitem__(self, name):
+        if name not in self._arrays:
+            self._arrays[name] = self.layer.unit_array(name)
+        return self._arrays[name]
+
+    def __getattr__(self, name):  # layer variables: gc_i, ffi, fbi, avg_act...
+        return getattr(self.layer, name)
+
+
+class NetworkView:
+    """State of the layers of a network, by layer name, at the time of an event"""
+
+    def __init__(self, network):
+        self.network = network
+        self._layers = {}
+
+    def __getitem__(self, name):
+        if name not in self._layers:
+            self._layers[name] = LayerView(self.network._get_layer(name))
+        return self._layers[name]
+
+
+class Recorder:
+    """A callback recording variables of layers, as `(n_events, n_units)` arrays.
+
+    >>> recorder = Recorder(['act', 'v_m'], layers=['hidden_layer'])
+    >>> network.add_hook('cycle', recorder)
+    >>> network.trial()
+    >>> recorder.arrays()['hidden_layer']['act'].shape
+    (100, n_units)
+    """
+
+    def __init__(self, variables, layers=None):
+        self.variables = list(variables)
+        self.layers    = layers
+        self.records   = {}  # layer name -> variable -> list of arrays
+
+    def __call__(self, network, state):
+        names = [layer.name for layer in network.layers] if self.layers is None else self.layers
+        for name in names:
+            records = self.records.setdefault(name, {var: [] for var in self.variables})
+            for var in self.variables:
+                records[var].append(state[name][var])
+
+    def arrays(self):
+        """Return the records, as `{layer_name: {variable: array}}`"""
+        return {name: {var: np.array(values) for var, values in records.items()}
+                for name, records in self.records.items()}
+
+    def clear(self):
+        self.records = {}
@@ -0,0 +1,313 @@
+"""Reading and writing emergent files: weights files (`.wts`) and data tables (`.dat`).
+
+Weights files are read line by line, and the values of each connection group (the
+links a unit receives from one layer) are converted in a single vectorized
+call. The whole file is never held in memory as strings.
+
+The weights of a `.wts` file are organized by receiving unit:
+
+    <Lay Hidden>                  receiving layer
+    <UgUn 0 >                     receiving unit index
+    <Un>
+    0                             bias weight (not used)
+    <Cg 0 Fm:Input>               connection group, and sending layer
+    <Cn 4>                        number of links
+    0 0.468802                    sending unit index, weight
+    ...
+"""
+import collections
+import itertools
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+
+
+def iter_wts(path):
+    """Iterate over the connection groups of a `.wts` file.
+
+    Yields `(pre_layer, post_layer, post_index, pre_indices, weights)` tuples,
+    with `pre_indices` and `weights` as arrays. Only weights are read: layers
+    and units parameters are skipped.
+    """
+    with open(path, 'r') as fd:
+        if fd.readline().strip() != '<Fmt TEXT>':
+            raise ValueError('{}: only text .wts files are supported'.format(path))
+
+        post_layer, post_index = None, None
+        for line in fd:
+            if line.startswith('<Lay '):
+                post_layer = line.strip()[len('<Lay '):-1]
+            elif line.startswith('<UgUn '):
+                post_index = int(line.strip()[len('<UgUn '):-1])
+            elif line.startswith('<Cg '):
+                pre_layer = line.strip()[line.index('Fm:') + len('Fm:'):-1]
+                n = int(fd.readline().strip()[len('<Cn '):-1])
+                values = np.fromstring(''.join(itertools.islice(fd, n)), sep=' ').reshape(n, -1)
+                yield pre_layer, post_layer, post_index, values[:, 0].astype(int), values[:, 1]
+
+def read_wts(path):
+    """Read a `.wts` file, and return its weight matrices.
+
+    Returns a dict with `(pre_layer, post_layer)` names tuples as keys, and
+    `(n_pre, n_post)` weight matrices as values. Missing links are set to 0.
+    """
+    groups = {}
+    for pre_layer, post_layer, post_index, pre_indices, weights in iter_wts(path):
+        groups.setdefault((pre_layer, post_layer), []).append((post_index, pre_indices, weights))
+
+    matrices = {}
+    for key, key_groups in groups.items():
+        n_pre  = 1 + max(int(pre_indices.max()) for _, pre_indices, _ in key_groups if len(pre_indices) > 0)
+        n_post = 1 + max(post_index for post_index, _, _ in key_groups)
+        W = np.zeros((n_pre, n_post))
+        for post_index, pre_indices, weights in key_groups:
+            W[pre_indices, post_index] = weights
+        matrices[key] = W
+    return matrices
+
+def load_wts(network, path, layer_names=None):
+    """Set the weights of the network's connections from a `.wts` file.
+
+    :param layer_names:  dict mapping the layer names of the file to the layer
+                         names of the network. Missing names are used as is.
+    """
+    layer_names = {} if layer_names is None else layer_names
+    conns = {(conn.pre.name, conn.post.name): conn for conn in network.connections}
+    link_index = {}  # position of each link in the connection arrays, as a (n_pre, n_post) matrix
+    for pre_layer, post_layer, post_index, pre_indices, weights in iter_wts(path):
+        key = (layer_names.get(pre_layer, pre_layer), layer_names.get(post_layer, post_layer))
+        if key not in conns:
+            raise ValueError('no connection from {} to {} in the network'.format(*key))
+        conn = conns[key]
+        conn.unshare_weights()
+        if key not in link_index:
+            link_index[key] = np.full((len(conn.pre.units), len(conn.post.units)), -1)
+            link_index[key][conn.pre_idx, conn.post_idx] = np.arange(conn.n_links)
+        links = link_index[key][pre_indices, post_index]
+        if np.any(links < 0):
+            raise ValueError('links to unit {} of {} do not exist in the network'.format(post_index, key[1]))
+        conn.wt[links if conn.wt_idx is None else conn.wt_idx[links]] = weights
+    for key in link_index:
+        conn = conns[key]
+        conn.fwt[:] = conn.spec.sig_inv(conn.wt)
+        conn.wt_version += 1
+
+def write_wts(network, path, layer_names=None, fmt='%.9g'):
+    """Write the weights of the network in a `.wts` file readable by emergent.
+
+    :param layer_names:  dict mapping the layer names of the network to the layer
+                         names to write in the file. Missing names are used as is.
+    :param fmt:          format of the weight values. The default preserves
+                         single precision values exactly.
+    """
+    layer_names = {} if layer_names is None else layer_names
+    link_fmt = '%d ' + fmt + '\n'
+    with open(path, 'w') as fd:
+        fd.write('<Fmt TEXT>\n<Name Network_0>\n<Epoch 0>\n')
+        for layer in network.layers:
+            fd.write('<Lay {}>\n'.format(layer_names.get(layer.name, layer.name)))
+            for name in ['acts_m_avg', 'acts_p_avg', 'acts_p_avg_eff']:
+                fd.write('<{} {}>\n'.format(name, layer.avg_act_p_eff))
+            fd.write('<Ug>\n')
+            # links of each connection, sorted by receiving unit
+            conns = []
+            for conn in layer.to_connections:
+                order = np.argsort(conn.post_idx, kind='stable')
+                bounds = np.searchsorted(conn.post_idx[order], np.arange(len(layer.units) + 1))
+                conns.append((conn, conn.link_wt, order, bounds))
+            for j in range(len(layer.units)):
+                fd.write('<UgUn {} >\n<Un>\n0\n'.format(j))
+                for k, (conn, link_wt, order, bounds) in enumerate(conns):
+                    links = order[bounds[j]:bounds[j+1]]
+                    fd.write('<Cg {} Fm:{}>\n<Cn {}>\n'.format(
+                             k, layer_names.get(conn.pre.name, conn.pre.name), len(links)))
+                    fd.write(''.join(link_fmt % link for link in
+                                     zip(conn.pre_idx[links].tolist(), link_wt[links].tolist())))
+                    fd.write('</Cn>\n</Cg>\n')
+                fd.write('</Un>\n</UgUn>\n')
+            fd.write('</Ug>\n</Lay>\n')
+
+
+DAT_TYPES = {'|': int, '$': str, '%': float, '&': float}  # emergent column type signs
+
+
+def read_dat(path, cache=True):
+    """Read an emergent data table (`_H:`/`_D:` text format) as typed columns.
+
+    Returns a dict with column names as keys and arrays of `n_rows` values:
+    int, float or str arrays for scalar columns (quotes are removed from str),
+    and float arrays of shape `(n_rows,) + dims` for matrix columns, using the
+    `<dims>` annotation of their first cell.
+
+    If `cache` is True, the parsed columns are saved in a `.cache.npz` sidecar
+    file, and reused as long as the modification time and size of the data
+    file do not change. The sidecar is written to a temporary file, renamed
+    when complete; an unreadable sidecar is ignored, and rewritten.
+    """
+    stat = os.stat(path)
+    cache_path = path + '.cache.npz'
+    if cache and os.path.exists(cache_path):
+        try:
+            with np.load(cache_path) as npz:
+                if npz['_mtime_ns'] == stat.st_mtime_ns and npz['_size'] == stat.st_size:
+                    return {name: npz[name] for name in npz.files if not name.startswith('_')}
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):  # truncated or older sidecar
+            pass
+
+    columns = _parse_dat(path)
+
+    if cache:
+        tmp_path = None
+        try:
+            with tempfile.NamedTemporaryFile(dir=os.path.dirname(os.path.abspath(path)),
+                                             suffix='.tmp', delete=False) as fd:
+                tmp_path = fd.name  # passing the file object: no `.npz` extension added
+                np.savez(fd, _mtime_ns=stat.st_mtime_ns, _size=stat.st_size, **columns)
+            os.replace(tmp_path, cache_path)
+        except OSError:  # read-only location: the cache is only an optimization
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return columns
+
+def _parse_dat(path):
+    with open(path, 'r') as fd:
+        header = fd.readline().rstrip('\n').split('\t')
+        if header[0] != '_H:':
+            raise ValueError('{}: unrecognized format'.format(path))
+        rows = [[v for v in line.rstrip('\n').split('\t')[1:] if v != '']
+                for line in fd if line.startswith('_D:')]
+
+    # header cells: "%name", "&name[2:0,0]<2:4,4>", "&name[2:1,0]", ...
+    cells = []  # (name, type, matrix position or None)
+    dims  = {}  # matrix dimensions, by name
+    for cell in header[1:]:
+        if cell == '':
+            continue
+        kind, name, pos = DAT_TYPES[cell[0]], cell[1:], None
+        if '[' in name:
+            pos  = tuple(int(d) for d in name[name.index('[')+1:name.index(']')].split(':')[1].split(','))
+            if '<' in name:
+                dims[name[:name.index('[')]] = tuple(int(d) for d in
+                                                     name[name.index('<')+1:name.index('>')].split(':')[1].split(','))
+            name = name[:name.index('[')]
+        cells.append((name, kind, pos))
+
+    for i, row in enumerate(rows):
+        if len(row) != len(cells):
+            raise ValueError('{}: row {} has {} values, header has {}'.format(path, i, len(row), len(cells)))
+    values = list(zip(*rows)) if len(rows) > 0 else [()] * len(cells)
+
+    columns = {}
+    for (name, kind, pos), column in zip(cells, values):
+        if pos is None:
+            if kind is str:
+                columns[name] = np.array([v.strip('"') for v in column], dtype=str)
+            else:
+                columns[name] = np.array(column, dtype=kind)
+        else:
+            if name not in columns:
+                columns[name] = np.zeros((len(rows),) + dims[name])
+            columns[name][(slice(None),) + pos] = np.array(column, dtype=float)
+    return columns
+
+
+class DatWriter:
+    """Write records incrementally to an emergent data table (`.dat`).
+
+    Records are dicts, with the same keys for every record. The columns are
+    defined by the first record: ints, floats and strs values create scalar
+    columns, arrays create matrix columns with a `<dims>` annotation. Rows are
+    buffered, and written `buffer_rows` at a time.
+
+    >>> with DatWriter('trials.dat') as writer:
+    ...     for _ in range(n_trials):
+    ...         network.trial()
+    ...         writer.write(trial_record(network))
+    """
+
+    def __init__(self, path, buffer_rows=1000, fmt='%.9g'):
+        self.fmt = fmt
+        self.buffer_rows = buffer_rows
+        self.columns = None  # list of (name, type, dims)
+        self._buffer = []
+        self._fd = open(path, 'w')
+
+    def write(self, record):
+        """Add a record (a row) to the table"""
+        if self.columns is None:
+            self._write_header(record)
+        if len(record) != len(self.columns):
+            raise ValueError('record has {} values, table has {} columns'.format(len(record), len(self.columns)))
+
+        values = ['_D:']
+        for name, kind, dims in self.columns:
+            value = record[name]
+            if dims is not None:  # first index varies fastest, as in emergent
+                value = np.asarray(value, dtype=float)
+                if value.shape != dims:
+                    raise ValueError('column {} has shape {}, record has {}'.format(name, dims, value.shape))
+                values.extend(self.fmt % v for v in value.ravel(order='F').tolist())
+            elif kind is str:
+                values.append('"{}"'.format(value))
+            elif kind is int:
+                values.append('%d' % value)
+            else:
+                values.append(self.fmt % value)
+        self._buffer.append('\t'.join(values) + '\n')
+        if len(self._buffer) >= self.buffer_rows:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered rows to the file"""
+        self._fd.write(''.join(self._buffer))
+        self._buffer = []
+        self._fd.flush()
+
+    def close(self):
+        self.flush()
+        self._fd.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _write_header(self, record):
+        self.columns, cells = [], ['_H:']
+        for name, value in record.items():
+            if np.ndim(value) > 0:
+                dims = np.shape(value)
+                self.columns.append((name, float, dims))
+                ndim = len(dims)
+                for k, pos in enumerate(itertools.product(*[range(d) for d in reversed(dims)])):
+                    pos = ','.join(str(i) for i in reversed(pos))
+                    cells.append('%{}[{}:{}]'.format(name, ndim, pos) + ('' if k > 0 else
+                                 '<{}:{}>'.format(ndim, ','.join(str(d) for d in dims))))
+            else:
+                kind = (int if isinstance(value, (int, np.integer)) and not isinstance(value, bool) else
+                        str if isinstance(value, str) else float)
+                self.columns.append((name, kind, None))
+                cells.append({int: '|', str: '$', float: '%'}[kind] + name)
+        self._fd.write('\t'.join(cells) + '\n')
+
+
+def trial_record(network, layers=None):
+    """Return a record of the last trial of the network, for a `DatWriter`.
+
+    The record holds the trial number, the trial metrics, and the `act_m`
+    activities of the `layers` (by default, all layers).
+    """
+    record = collections.OrderedDict([('trial', network.trial_count)])
+    record.update(network.compute_metrics())
+    for layer in (network.layers if layers is None else layers):
+        record['{}_act_m'.format(layer.name)] = layer.unit_array('act_m')
+    return record
+
+def epoch_record(network, epoch):
+    """Return a record of the network's epoch metrics, for a `DatWriter`."""
+    record = collections.OrderedDict([('epoch', epoch)])
+    record.update(network.epoch_metrics.summary())
+    return record
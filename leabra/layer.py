@@ -1,28 +1,59 @@
 import numpy as np
 
-from .unit import Unit, INPUT, HIDDEN, OUTPUT
+from .unit import Unit, UnitSpec, UnitParams, UNIT_ARRAY_PARAMS, INPUT, HIDDEN, OUTPUT
 
 
 class Layer:
     """Leabra Layer class"""
 
-    def __init__(self, size, spec=None, unit_spec=None, genre=HIDDEN, name=None):
+    def __init__(self, size, spec=None, unit_spec=None, genre=HIDDEN, name=None, unit_params=None,
+                 shape=None, log_names=None):
         """
-        size     :  Number of units in the layer.
-        spec     :  LayerSpec instance with custom values for the parameter of
-                    the layer. If None, default values will be used.
-        unit_spec:  UnitSpec instance with custom values for the parameters of
-                    the units of the layer. If None, default values will be used.
+        size       :  Number of units in the layer.
+        spec       :  LayerSpec instance with custom values for the parameter of
+                      the layer. If None, default values will be used.
+        unit_spec  :  UnitSpec instance with custom values for the parameters of
+                      the units of the layer. If None, default values will be used.
+        unit_params:  dict of per-unit parameter values, with `UnitSpec`
+                      parameter names as keys (see `UNIT_ARRAY_PARAMS`), and
+                      arrays of `size` values as values. The units share
+                      `unit_spec`, and read their own values in the arrays
+                      (see `UnitParams`); the vectorized engines use the
+                      arrays directly.
+        shape      :  geometry of the layer, as a tuple, for instance `(height,
+                      width)`; units are in row-major order. Default: `(size,)`.
+        log_names  :  variables the units record at every cycle (see
+                      `Unit.update_logs()`). `()` for none, for instance when
+                      recording with hooks. If None, the units's defaults.
         """
         self.genre = genre  # type of layer
 
         self.name = name
+        self.shape = (size,) if shape is None else tuple(shape)
+        if int(np.prod(self.shape)) != size:
+            raise ValueError('shape {} does not have {} units'.format(self.shape, size))
         self.spec = spec
         if self.spec is None:
             self.spec = LayerSpec()
         #!#assert self.spec.inhib.lower() in self.spec.legal_inhib
 
-        self.units = [Unit(spec=unit_spec, genre=genre) for _ in range(size)]
+        unit_kwargs = {} if log_names is None else {'log_names': tuple(log_names)}
+        self.unit_params = {}  # per-unit parameter arrays; empty for homogeneous layers
+        if unit_params:
+            unit_spec = UnitSpec() if unit_spec is None else unit_spec
+            for key, values in unit_params.items():
+                if key not in UNIT_ARRAY_PARAMS:
+                    raise ValueError("the '{}' parameter cannot vary across units".format(key))
+                values = np.array(values, dtype=float)
+                if values.shape != (size,):
+                    raise ValueError("'{}' has shape {}, expected ({},)".format(key, values.shape, size))
+                values.flags.writeable = False  # the units's values are not updated
+                self.unit_params[key] = values
+            columns = {key: values.tolist() for key, values in self.unit_params.items()}
+            self.units = [Unit(spec=unit_spec, genre=genre, params=UnitParams(unit_spec, columns, j),
+                               **unit_kwargs) for j in range(size)]
+        else:
+            self.units = [Unit(spec=unit_spec, genre=genre, **unit_kwargs) for _ in range(size)]
 
         self.gc_i = 0.0  # inhibitory conductance
         self.ffi  = 0.0  # feedforward component of inhibition
@@ -50,6 +81,11 @@ class Layer:
         """Return the matrix of the units's net exitatory input"""
         return [u.g_e for u in self.units]
 
+    def unit_array(self, name):
+        """Return an array of the `name` attribute of all the units of the layer."""
+        return np.fromiter((getattr(u, name) for u in self.units), dtype=float,
+                           count=len(self.units))
+
     def update_logs(self):
         """Record current state. Called after each cycle."""
         self.logs['gc_i'].append(self.gc_i)
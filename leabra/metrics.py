@@ -0,0 +1,91 @@
+"""Performance metrics on the output layers, following the definitions of emergent.
+
+Every function accepts either a single trial, as 1-d arrays of `n_units` values,
+or a batch of trials, as 2-d arrays of shape `(n_trials, n_units)`. In the
+latter case, all trials are computed at once and arrays of `n_trials` values are
+returned.
+"""
+import numpy as np
+
+
+def sse(targets, acts, tol=0.0):
+    """Sum of squared errors between targets and activities.
+
+    Unit errors whose absolute value is below `tol` are ignored.
+    """
+    err = np.asarray(targets, dtype=float) - np.asarray(acts, dtype=float)
+    if tol > 0:
+        err = np.where(np.abs(err) < tol, 0.0, err)
+    return np.sum(err * err, axis=-1)
+
+def norm_err(targets, acts, thr=0.5):
+    """Normalized binary error.
+
+    Number of units on the wrong side of `thr` (active while they should not be,
+    or the reverse), divided by twice the number of active units in the target,
+    and capped at 1.0.
+    """
+    targ_on = np.asarray(targets, dtype=float) > thr
+    act_on  = np.asarray(acts, dtype=float) > thr
+    n_err   = np.sum(targ_on != act_on, axis=-1)
+    n_on    = np.sum(targ_on, axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        err = np.where(n_on > 0, n_err / (2.0 * n_on), 0.0)
+    return np.minimum(err, 1.0)
+
+def cos_err(targets, acts):
+    """Cosine between the target and activity vectors (1.0 is a perfect match)."""
+    targets = np.asarray(targets, dtype=float)
+    acts    = np.asarray(acts, dtype=float)
+    dot  = np.sum(targets * acts, axis=-1)
+    norm = np.sqrt(np.sum(targets * targets, axis=-1) * np.sum(acts * acts, axis=-1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(norm > 0, dot / norm, 0.0)
+
+def trial_metrics(targets, acts, cnt_err_tol=0.0, sse_tol=0.0):
+    """Compute all trial metrics in one pass.
+
+    Returns a dict with the `sse`, `norm_err`, `cos_err` and `bin_err` values.
+    `bin_err` is 1 if the `sse` is above `cnt_err_tol`, 0 otherwise.
+    """
+    trial_sse = sse(targets, acts, tol=sse_tol)
+    return {'sse'     : trial_sse,
+            'norm_err': norm_err(targets, acts),
+            'cos_err' : cos_err(targets, acts),
+            'bin_err' : (trial_sse > cnt_err_tol).astype(float)}
+
+
+class EpochMetrics:
+    """Accumulate trial metrics, and aggregate them per epoch.
+
+    Accumulation only keeps running sums, so it can be left on for arbitrary
+    long runs. Batched trial metrics (arrays) are accepted as well.
+    """
+
+    names = ('sse', 'bin_err', 'norm_err', 'cos_err')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Forget all accumulated trials. Typically called at the start of an epoch."""
+        self.n_trials = 0
+        self._sums = {name: 0.0 for name in self.names}
+
+    def add(self, metrics):
+        """Add the metrics of one trial, or of a batch of trials."""
+        self.n_trials += np.size(metrics['sse'])
+        for name in self.names:
+            self._sums[name] += float(np.sum(metrics[name]))
+
+    def summary(self):
+        """Return the epoch metrics, with emergent's names."""
+        n = max(self.n_trials, 1)
+        pct_err = self._sums['bin_err'] / n
+        return {'n_trials'    : self.n_trials,
+                'avg_sse'     : self._sums['sse'] / n,
+                'cnt_err'     : self._sums['bin_err'],
+                'pct_err'     : pct_err,
+                'pct_cor'     : 1.0 - pct_err,
+                'avg_norm_err': self._sums['norm_err'] / n,
+                'avg_cos_err' : self._sums['cos_err'] / n}
@@ -1,3 +1,14 @@
+import collections
+import copy
+import os
+
+import numpy as np
+
+from . import hooks
+from . import metrics
+from . import storage
+
+
 
 class NetworkSpec:
     """Network parameters"""
@@ -5,6 +16,26 @@ class NetworkSpec:
     def __init__(self, quarter_size = 25, **kwargs):
         # number of cycles in a settle period
         self.quarter_size = quarter_size
+        # metrics
+        self.cnt_err_tol = 0.0  # trials with a sse above this value count as errors
+        # simulation
+        self.engine = 'python'  # engine executing the cycles: 'python', 'numpy' or 'numba'
+                                # (see the `engines` module). Run `build()` after changing it.
+        self.dtype  = 'float64'  # floating-point type of the connections's weights, and of the
+                                 # units's state while the 'numpy' and 'numba' engines run a quarter.
+                                 # With 'float32',
+                                 # on the LeabraStd4 project (tests/data), activities and weights stay
+                                 # within 1e-6 of 'float64' over 5 trials, and within 1e-5 of emergent.
+                                 # Errors accumulate with learning. Run `build()` after changing it.
+                                 # The units's state is stored as Python floats on the `Unit` objects
+                                 # (the engines' arrays only exist during quarters): 'float32' reduces
+                                 # the memory of the weights, not the memory of the units's state.
+        # learning
+        self.lrn_interval = 1  # number of trials over which weight changes are accumulated before
+                               # being applied. If 0, they are applied only by `apply_dwt()`
+        # evaluation
+        self.minus_cache_size = 0  # max number of minus phase results cached by `test_trial()`
+                                   # (0 disables the cache)
 
         for key, value in kwargs.items():
             assert hasattr(self, key) # making sure the parameter exists.
@@ -23,12 +54,20 @@ class Network:
         self.cycle_tot   = 0 # total number of cycles executed (not reset at end of trial)
         self.quarter_nb  = 1 # current quarter number (1, 2, 3 or 4)
         self.trial_count = 0 # number of trial finished
+        self.lrn_count   = 0 # number of trials with weight changes accumulated but not applied
         self.phase       = 'minus'
 
         self.layers      = list(layers)
         self.connections = list(connections)
 
         self._inputs, self._outputs = {}, {}
+        self._layer_map = {}
+        for layer in self.layers:
+            self._layer_map.setdefault(layer.name, layer)
+        self.epoch_metrics = metrics.EpochMetrics()  # metrics accumulated over trials
+        self._minus_cache = collections.OrderedDict()  # LRU cache of minus phase results
+        self.profiler = None  # see `enable_profiling()`
+        self._hooks = {}  # callbacks, by event (see the `hooks` module)
         self.build()
 
     def add_connection(self, connection):
@@ -37,6 +76,7 @@ class Network:
 
     def add_layer(self, layer):
         self.layers.append(layer)
+        self._layer_map.setdefault(layer.name, layer)
 
     def build(self):
         """Precompute necessary network datastructures.
@@ -49,16 +89,200 @@ class Network:
             rel_sum = sum(connection.spec.wt_scale_rel for connection in layer.to_connections)
             for connection in layer.to_connections:
                 connection.wt_scale_rel_eff = connection.spec.wt_scale_rel / rel_sum
+        dtype = np.dtype(self.spec.dtype)
+        for connection in self.connections:
+            if connection.wt.dtype != dtype:
+                connection.set_dtype(dtype)
+        self.clear_minus_cache()
+        self._engine = None
+        if self.spec.engine != 'python':
+            from . import engines
+            self._engine = engines.create_engine(self.spec.engine)
+
+    def save(self, path):
+        """Save the network state in a `.npz` file (see the `checkpoint` module).
+
+        Weights, fast weights, units and layers states, running averages and
+        counters are saved. The parameters of the specs are not: the network
+        must be rebuilt with the same specs before `load()`.
+        """
+        from . import checkpoint  # imported on demand, to keep `import leabra` light
+        checkpoint.save(self, path)
+
+    def load(self, path, mmap_mode=None):
+        """Restore a state saved with `save()` into this network.
+
+        The network must have the same layers and connections as the saved one.
+        If `mmap_mode` is not None, weights are memory-mapped from the file.
+        """
+        from . import checkpoint
+        checkpoint.load(self, path, mmap_mode=mmap_mode)
+
+    def fork(self):
+        """Return a copy of the network that shares the weights of this one.
+
+        The weight arrays are shared until the fork or this network modifies
+        them (by learning, or by assigning weights): they are copied at that
+        point (copy-on-write). Until then, the shared arrays are read-only:
+        direct writes (`conn.wt[k] = x`) raise an error, and must be preceded by
+        `conn.unshare_weights()`. Units and layers are copied, and so is their
+        dynamic state, but not their logs. Layer specs are copied, as they hold
+        a cycle counter; the other specs are shared. Hooks and profiling are
+        not carried over.
+
+        The files of memory-mapped connections become read-only: both networks
+        write their copies of the weights, and any new file, in new
+        subdirectories of the storage directory.
+
+        The units hold their state as attributes: forking makes one shallow
+        copy of each unit object, in a Python loop, rather than a bulk copy of
+        state arrays. Its cost is proportional to the number of units, and
+        independent of the number of links.
+        """
+        fork = copy.copy(self)
+        layer_map, layer_specs = {}, {}
+        fork.layers = []
+        for layer in self.layers:
+            layer_fork = copy.copy(layer)
+            if id(layer.spec) not in layer_specs:  # layers sharing a spec still share it in the fork
+                spec_fork = copy.copy(layer.spec)
+                spec_fork.__dict__.pop('_inhibition', None)  # profiling wrapper
+                layer_specs[id(layer.spec)] = spec_fork
+            layer_fork.spec = layer_specs[id(layer.spec)]
+            layer_fork.units = []
+            for unit in layer.units:
+                unit_fork = copy.copy(unit)
+                unit_fork.ex_inputs = list(unit.ex_inputs)
+                unit_fork.logs = {name: [] for name in unit.log_names}
+                layer_fork.units.append(unit_fork)
+            layer_fork.logs = {name: [] for name in layer.logs}
+            layer_fork.from_connections, layer_fork.to_connections = [], []
+            layer_map[id(layer)] = layer_fork
+            fork.layers.append(layer_fork)
+
+        fork.connections = []
+        weight_stores = {}  # tied connections remain tied in the fork
+        storage_dirs = {}   # memory-mapped connections: the current files become read-only
+        for conn in self.connections:
+            conn_fork = copy.copy(conn)
+            store = conn.weight_store
+            conn_fork.weight_store = weight_stores.setdefault(id(store), store.fork())
+            if conn.storage_dir is not None:  # both networks write their new files elsewhere
+                if conn.storage_dir not in storage_dirs:
+                    parent_dir = os.path.dirname(conn.storage_dir)
+                    storage_dirs[conn.storage_dir] = storage.claim(parent_dir), storage.claim(parent_dir)
+                conn.storage_dir, conn_fork.storage_dir = storage_dirs[conn.storage_dir]
+            conn_fork.pre, conn_fork.post = layer_map[id(conn.pre)], layer_map[id(conn.post)]
+            conn_fork._links = None
+            conn_fork.pre.from_connections.append(conn_fork)
+            conn_fork.post.to_connections.append(conn_fork)
+            fork.connections.append(conn_fork)
+
+        fork._inputs, fork._outputs = dict(self._inputs), dict(self._outputs)
+        fork._layer_map = {}
+        for layer in fork.layers:
+            fork._layer_map.setdefault(layer.name, layer)
+        fork.epoch_metrics = copy.deepcopy(self.epoch_metrics)
+        fork._minus_cache = collections.OrderedDict(self._minus_cache)  # same weights: still valid
+        fork.profiler, fork._hooks = None, {}
+        return fork
+
+    def get_state(self):
+        """Return a copy of the dynamic state of the network, as a `NetworkState`.
+
+        The state holds the units's and layers's variables and the counters,
+        but no weights or specs. The network itself keeps its dynamic state on
+        its `Unit` and `Layer` objects: it runs one state at a time, and
+        `set_state()` copies a state into them. Concurrent states are only
+        served by `FrozenNetwork.from_network()`, which runs the minus phase
+        only (no plus phase or learning), and the parameters of the specs only
+        (no spec subclasses); see the `state` and `frozen` modules.
+        """
+        from .state import NetworkState
+        return NetworkState.capture(self)
+
+    def set_state(self, state):
+        """Restore a state returned by `get_state()`."""
+        from .state import NetworkState
+        if not isinstance(state, NetworkState):
+            raise TypeError('expected a NetworkState, as returned by get_state(), got a {}'.format(
+                            type(state).__name__))
+        state.restore(self)
+
+    def freeze(self, path, quantize=None, accumulate='float32'):
+        """Export the network as a frozen, inference-only artifact (see the `frozen` module).
+
+        If `quantize` is not None, weights are quantized to this integer type.
+        """
+        from . import frozen
+        frozen.freeze(self, path, quantize=quantize, accumulate=accumulate)
+
+    def prune(self, threshold=None, top_k=None, connections=None):
+        """Remove the weak links of the connections, converted to 'sparse'
+        projections (see the `pruning` module). Returns the reports, by connection name.
+        """
+        from . import pruning
+        return pruning.prune_network(self, threshold=threshold, top_k=top_k, connections=connections)
+
+    def enable_profiling(self):
+        """Start accumulating time and call counts by stage (see the `profiling` module).
+
+        Layers and connections added afterwards are not profiled. Profiling has
+        no cost when disabled.
+        """
+        from . import profiling
+        if self.profiler is None:
+            self.profiler = profiling.Profiler(self)
+            self.profiler.install()
+
+    def disable_profiling(self):
+        """Stop profiling, and discard the accumulated statistics."""
+        if self.profiler is not None:
+            self.profiler.uninstall()
+            self.profiler = None
+
+    def profile_stats(self, reset=False):
+        """Return the profiling statistics, as `{stage: {name: {'time': seconds, 'calls': count}}}`.
+
+        :param reset:  if True, zero the counters after reading them, for
+                       instance at the end of each epoch.
+        """
+        assert self.profiler is not None, 'profiling is not enabled'
+        stats = self.profiler.stats()
+        if reset:
+            self.profiler.reset()
+        return stats
+
+    def add_hook(self, event, callback):
+        """Call `callback(network, state)` at each `event` (see the `hooks` module).
+
+        :param event:  'cycle', 'quarter', 'minus_phase', 'plus_phase' or 'trial'.
+        """
+        if event not in hooks.EVENTS:
+            raise ValueError("unknown event '{}', must be one of {}".format(event, hooks.EVENTS))
+        self._hooks.setdefault(event, []).append(callback)
+
+    def remove_hook(self, event, callback):
+        """Unregister a callback added with `add_hook()`."""
+        self._hooks[event].remove(callback)
+        if len(self._hooks[event]) == 0:
+            del self._hooks[event]  # no dispatch when no callback is registered
+
+    def _dispatch(self, events):
+        state = hooks.NetworkView(self)
+        for event in events:
+            for callback in self._hooks.get(event, ()):
+                callback(self, state)
 
     def _get_layer(self, name):
         """Get a layer from its name.
 
         If layers share the name, return the first one added to the network.
         """
-        for layer in self.layers:
-            if layer.name == name:
-                return layer
-        raise ValueError("layer '{}' not found.".format(name))
+        try:
+            return self._layer_map[name]
+        except KeyError:
+            raise ValueError("layer '{}' not found.".format(name))
 
     def set_inputs(self, act_map):
         """Set inputs activities, set at the beginning of all quarters.
@@ -118,11 +342,24 @@ class Network:
             if self.quarter_nb == 4: # end of plus phase
                 self.end_plus_phase()
 
+            if self._hooks:
+                self._dispatch({3: ('quarter', 'minus_phase'),
+                                4: ('quarter', 'plus_phase', 'trial')}.get(self.quarter_nb, ('quarter',)))
+
 
     def cycle(self):
         """Execute a cycle"""
         self._pre_cycle()
+        self._cycle()
+        if self._hooks:
+            self._dispatch(('cycle',))
+        self._post_cycle()
 
+    def _cycle(self):
+        """Update connections and layers, without the phase and trial bookkeeping"""
+        if self._engine is not None:
+            self._engine.run(self, 1)
+            return
         for conn in self.connections:
             conn.cycle()
         for layer in self.layers:
@@ -130,11 +367,14 @@ class Network:
         self.cycle_count += 1
         self.cycle_tot   += 1
 
-        self._post_cycle()
-
 
     def quarter(self): # FIXME:
         """Execute a quarter"""
+        if self._engine is not None and not self._hooks:  # the whole quarter at once
+            self._pre_cycle()
+            self._engine.run(self, self.spec.quarter_size - self.cycle_count)
+            self._post_cycle()
+            return
         self.cycle()
         while self.cycle_count < self.spec.quarter_size:
             self.cycle()
@@ -146,18 +386,139 @@ class Network:
         while self.quarter_nb != 4:
             assert self.cycle_count == self.spec.quarter_size
             self.quarter()
-        return self.compute_sse()
+        if len(self._outputs) > 0:
+            trial_metrics = self.compute_metrics()
+            self.epoch_metrics.add(trial_metrics)
+            return trial_metrics['sse']
+        return 0.0
+
+    def test_trial(self):
+        """Execute the minus phase of a trial, without plus phase or learning.
+
+        Must be called between trials. Returns a dict with, for each layer, the
+        array of the units's `act_m`.
+
+        If `spec.minus_cache_size` is positive, results are cached, keyed by the
+        input pattern and the `wt_version` of the connections that influence the
+        layers the inputs reach (the connections to these layers, including
+        from layers the inputs do not reach, and, recursively, to the layers
+        that project to them): repeating an input pattern while these weights
+        did not change skips settling entirely. On a cache hit, only the units's
+        `act_m` and the layer's inhibition state are restored. Learning or
+        assigning weights through the `weights` setter invalidates the entries
+        of the projection; direct writes to the arrays (`conn.wt[k] = x`) must
+        be followed by `conn.wt_version += 1`. Cached results ignore the small
+        influence that the activity carried over from the previous trial has on
+        settling. On a cache hit, the 'minus_phase' hooks are called, but not the
+        'cycle' and 'quarter' hooks, as no cycle is executed.
+        """
+        assert (self.cycle_count, self.quarter_nb) in ((0, 1), (self.spec.quarter_size, 4)), \
+               'test_trial() must be called between trials'
+        if self.spec.minus_cache_size <= 0:
+            self._settle_minus()
+            return self._act_m_map()
+
+        key = (tuple((name, np.asarray(acts, dtype=float).tobytes())
+                     for name, acts in sorted(self._inputs.items())),
+               tuple(conn.wt_version for conn in self._input_connections()))
+        if key in self._minus_cache:
+            self._minus_cache.move_to_end(key)
+            self._restore_minus(self._minus_cache[key])
+            if self._hooks:
+                self._dispatch(('minus_phase',))
+        else:
+            self._settle_minus()
+            self._minus_cache[key] = [(layer.unit_array('act_m'), layer.avg_act,
+                                       layer.ffi, layer.fbi, layer.gc_i)
+                                      for layer in self.layers]
+            if len(self._minus_cache) > self.spec.minus_cache_size:
+                self._minus_cache.popitem(last=False)
+        return self._act_m_map()
+
+    def _input_connections(self):
+        """Connections that influence the layers the inputs reach: the connections
+        to these layers, and, recursively, to the layers that project to them"""
+        reached = {id(self._layer_map[name]) for name in self._inputs}
+        n_reached = None
+        while n_reached != len(reached):  # layers reached from the input layers
+            n_reached = len(reached)
+            reached.update(id(conn.post) for conn in self.connections if id(conn.pre) in reached)
+        connections, n_reached = [], None
+        while n_reached != len(reached):  # and the layers projecting to them, active on their own
+            n_reached = len(reached)
+            connections = [conn for conn in self.connections if id(conn.post) in reached]
+            reached.update(id(conn.pre) for conn in connections)
+        return connections
+
+    def clear_minus_cache(self):
+        """Empty the minus phase cache of `test_trial()`.
+
+        Needed only if specs or inputs were modified in place.
+        """
+        self._minus_cache.clear()
+
+    def _settle_minus(self):
+        """Run the minus phase, then rewind the phase so that the next cycle starts a trial."""
+        while not (self.quarter_nb == 3 and self.cycle_count == self.spec.quarter_size):
+            self.quarter()
+        self.quarter_nb = 4
+        self.phase      = 'minus'
+
+    def _restore_minus(self, cached):
+        """Restore the state cached at the end of a minus phase, in place of settling."""
+        if self.cycle_count == self.spec.quarter_size:
+            self.trial_count += 1
+        for layer, (act_m, avg_act, ffi, fbi, gc_i) in zip(self.layers, cached):
+            for unit, act in zip(layer.units, act_m):
+                unit.act_m = act
+            layer.avg_act, layer.ffi, layer.fbi, layer.gc_i = avg_act, ffi, fbi, gc_i
+        self.cycle_count = self.spec.quarter_size
+        self.quarter_nb  = 4
+
+    def _act_m_map(self):
+        return {layer.name: layer.unit_array('act_m') for layer in self.layers}
 
     def compute_sse(self):
         """Compute the sum of squared error in prediction (SSE).
 
         Should be run only after the minus phase is finished.
         """
-        sse = 0
+        return float(sum(metrics.sse(activities, self._get_layer(name).unit_array('act_m'))
+                         for name, activities in self._outputs.items()))
+
+    def compute_metrics(self):
+        """Compute the trial metrics (sse, norm_err, cos_err, bin_err) on the output layers.
+
+        The sse is summed over output layers, `norm_err` and `cos_err` are averaged.
+        Should be run only after the minus phase is finished.
+        """
+        sse, norm_err, cos_err = 0.0, 0.0, 0.0
         for name, activities in self._outputs.items():
-            for act, unit in zip(activities, self._get_layer(name).units):
-                sse += (act - unit.act_m)**2
-        return sse
+            layer_metrics = metrics.trial_metrics(activities,
+                                                  self._get_layer(name).unit_array('act_m'))
+            sse      += float(layer_metrics['sse'])
+            norm_err += float(layer_metrics['norm_err'])
+            cos_err  += float(layer_metrics['cos_err'])
+        n = max(len(self._outputs), 1)
+        return {'sse': sse, 'norm_err': norm_err / n, 'cos_err': cos_err / n,
+                'bin_err': float(sse > self.spec.cnt_err_tol)}
+
+    def apply_dwt(self):
+        """Apply the weight changes accumulated since the last update.
+
+        To be called at the end of a batch when `spec.lrn_interval` is 0, or to
+        flush a partial interval.
+        """
+        self._apply_dwt(self.connections)
+        self.lrn_count = 0
+
+    def _apply_dwt(self, connections):
+        """Apply the weight changes of the connections, once for tied connections"""
+        applied = set()
+        for conn in connections:
+            if id(conn.weight_store) not in applied and not conn.transposed:
+                applied.add(id(conn.weight_store))
+                conn.apply_dwt()
 
     def end_minus_phase(self):
         """End of the minus phase. Current unit activity is stored."""
@@ -167,9 +528,15 @@ class Network:
         self.phase = 'plus'
 
     def end_plus_phase(self):
-        """End of the plus phase. Connections change weights."""
-        for conn in self.connections:
-            conn.learn()
+        """End of the plus phase. Connections compute their weight changes, and
+        apply them every `spec.lrn_interval` trials."""
+        self.lrn_count += 1
+        apply = self.spec.lrn_interval > 0 and self.lrn_count >= self.spec.lrn_interval
+        for conn in self.connections:  # tied connections apply their summed changes below
+            conn.learn(apply=apply and not conn.tied)
+        if apply:
+            self._apply_dwt([conn for conn in self.connections if conn.tied])
+            self.lrn_count = 0
         for layer in self.layers:
             for unit in layer.units:
                 unit.update_avg_l()
@@ -0,0 +1,126 @@
+"""Parity checks of a network's dynamics against reference traces.
+
+Traces are dicts `{layer_name: {variable: array}}`, with arrays of shape
+`(n_cycles, n_units)`. Reference traces are typically emergent cycle logs, read
+with `load_reference()`; recorded traces come from `record_cycles()`. The
+comparison is done on whole arrays, and reports, for each layer and variable,
+the maximum absolute and relative errors and the first divergence.
+
+    >>> reference = {'hidden_layer': load_reference('leabra_std4_cycle_hidden.dat')}
+    >>> report = check_parity(network, reference, variables=['net', 'act', 'v_m'])
+    >>> assert report.ok, str(report)
+"""
+import collections
+
+import numpy as np
+
+from . import hooks
+from . import io
+
+
+Divergence = collections.namedtuple('Divergence', ['layer', 'variable', 'n_cycles', 'max_abs_err',
+                                                   'max_rel_err', 'first_cycle', 'first_unit'])
+Divergence.__doc__ = """Comparison of a variable of a layer. `first_cycle` and
+`first_unit` locate the first value out of tolerance, and are None if there is none."""
+
+
+class ParityReport:
+    """Result of a parity check, as a list of `Divergence` (one by layer and variable)"""
+
+    def __init__(self, results):
+        self.results = list(results)
+
+    @property
+    def ok(self):
+        """True if all the values are within tolerance"""
+        return all(r.first_cycle is None for r in self.results)
+
+    def failures(self):
+        return [r for r in self.results if r.first_cycle is not None]
+
+    def __str__(self):
+        lines = []
+        for r in self.results:
+            status = 'ok' if r.first_cycle is None else 'diverges at cycle {} (unit {})'.format(
+                                                         r.first_cycle, r.first_unit)
+            lines.append('{}.{}: max_abs={:.2e} max_rel={:.2e} [{} cycles] {}'.format(
+                         r.layer, r.variable, r.max_abs_err, r.max_rel_err, r.n_cycles, status))
+        return '\n'.join(lines)
+
+
+def load_reference(path, variables=None):
+    """Read an emergent cycle log as a `{variable: (n_cycles, n_units) array}` dict.
+
+    Only matrix columns (one value per unit) are kept.
+    """
+    columns = io.read_dat(path)
+    return {name: values for name, values in columns.items()
+            if values.ndim == 2 and (variables is None or name in variables)}
+
+def record_cycles(network, variables, n_cycles, layers=None):
+    """Run the network for `n_cycles` cycles, and record the state of its units.
+
+    Values are recorded before the end of phase updates (`act_m`, learning,
+    `avg_l`) of the cycle, as emergent does in its cycle logs.
+
+    :param variables:  names of the unit attributes to record.
+    :param layers:     names of the layers to record (default: all).
+    :returns:          traces, as a `{layer_name: {variable: (n_cycles, n_units) array}}` dict.
+    """
+    recorder = hooks.Recorder(variables, layers=layers)
+    network.add_hook('cycle', recorder)
+    try:
+        for _ in range(n_cycles):
+            network.cycle()
+    finally:
+        network.remove_hook('cycle', recorder)
+    return recorder.arrays()
+
+def compare(traces, reference, rtol=2e-05, atol=2e-07):
+    """Compare traces against reference traces.
+
+    Only the layers and variables present in both are compared, on their
+    common number of cycles and units. Values are within tolerance if
+    `abs(value - ref) <= atol + rtol * abs(ref)`, as with `numpy.allclose`.
+    """
+    results = []
+    for layer_name in sorted(set(traces) & set(reference)):
+        for name in sorted(set(traces[layer_name]) & set(reference[layer_name])):
+            values, ref = np.asarray(traces[layer_name][name]), np.asarray(reference[layer_name][name])
+            n_cycles, n_units = min(len(values), len(ref)), min(values.shape[1], ref.shape[1])
+            values, ref = values[:n_cycles, :n_units], ref[:n_cycles, :n_units]
+
+            abs_err = np.abs(values - ref)
+            rel_err = abs_err / np.maximum(np.abs(ref), np.finfo(float).tiny)
+            bad = np.argwhere(abs_err > atol + rtol * np.abs(ref))  # sorted by cycle, then unit
+            first_cycle, first_unit = (None, None) if len(bad) == 0 else (int(bad[0, 0]), int(bad[0, 1]))
+            results.append(Divergence(layer_name, name, n_cycles,
+                                      float(abs_err.max()) if abs_err.size else 0.0,
+                                      float(rel_err.max()) if rel_err.size else 0.0,
+                                      first_cycle, first_unit))
+    return ParityReport(results)
+
+def check_parity(network, reference, variables=None, n_cycles=None, rtol=2e-05, atol=2e-07):
+    """Run the network and compare its dynamics to the reference traces.
+
+    :param network:    a network, or a dict of networks (for instance, the same
+                       network on different engines), with names as keys.
+    :param variables:  variables to compare (default: all the variables of the
+                       reference that are unit attributes).
+    :param n_cycles:   number of cycles to run (default: the length of the reference).
+    :returns:          a `ParityReport`, or a dict of reports if `network` is a dict.
+    """
+    if isinstance(network, dict):
+        return {name: check_parity(net, reference, variables=variables, n_cycles=n_cycles,
+                                   rtol=rtol, atol=atol)
+                for name, net in network.items()}
+
+    layers = [layer for layer in network.layers if layer.name in reference]
+    if variables is None:
+        variables = sorted(set.intersection(*[set(reference[layer.name]) for layer in layers]))
+        variables = [name for name in variables if all(hasattr(layer.units[0], name) for layer in layers)]
+    if n_cycles is None:
+        n_cycles = min(len(values) for layer in layers for values in reference[layer.name].values())
+
+    traces = record_cycles(network, variables, n_cycles, layers=[layer.name for layer in layers])
+    return compare(traces, reference, rtol=rtol, atol=atol)
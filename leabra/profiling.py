@@ -0,0 +1,144 @@
+"""Per-stage timing of a network's cycles and learning.
+
+When profiling is enabled on a network, the methods of its layers, units and
+connections are wrapped, on the instances, by timing functions; disabling it
+removes the wrappers, so that a network that is not profiled runs the
+unmodified code. The stages are:
+
+    propagation   `Connection.cycle()`, by connection
+    inhibition    `LayerSpec._inhibition()`, by layer
+    integration   `Unit.calculate_net_in()` and `Unit.cycle()`, by layer
+    logging       `Unit.update_logs()` and `Layer.update_logs()`, by layer
+    learning      `Connection.learn()`, by connection
+
+Times are exclusive: the logging done inside `Unit.cycle()` is counted in the
+logging stage, not in the integration one.
+
+The 'numpy' and 'numba' engines (see the `engines` module) do not call these
+methods: they time their own stages, with `Profiler.timing()`. With the
+'numba' engine, the inhibition of a layer is computed in the same compiled
+loop as its units, and is counted in the integration stage.
+"""
+import collections
+import functools
+import time
+
+
+STAGES = ('propagation', 'inhibition', 'integration', 'logging', 'learning')
+
+
+def connection_name(conn):
+    return '{}->{}'.format(conn.pre.name, conn.post.name)
+
+
+class Profiler:
+    """Accumulates wall time and call counts by stage and by layer or connection"""
+
+    def __init__(self, network):
+        self.network = network
+        self._times  = collections.defaultdict(float)  # (stage, name) -> time
+        self._calls  = collections.defaultdict(int)    # (stage, name) -> number of calls
+        self._stack  = []  # time spent in nested timed calls, for each active timed call
+        self._wrapped = []  # (object, attribute) wrapped on the instance
+        self._layer_names = {}  # id(layer) -> name, for the layers of the network
+
+    def reset(self):
+        """Zero all the counters, for instance at the start of an epoch"""
+        self._times.clear()
+        self._calls.clear()
+
+    def stats(self):
+        """Return `{stage: {name: {'time': seconds, 'calls': count}}}`"""
+        stats = {stage: {} for stage in STAGES}
+        for (stage, name), t in self._times.items():
+            stats[stage][name] = {'time': t, 'calls': self._calls[(stage, name)]}
+        return stats
+
+    def install(self):
+        """Wrap the methods of the network's objects"""
+        self._layer_names = {id(layer): layer.name for layer in self.network.layers}
+        for conn in self.network.connections:
+            self._wrap(conn, 'cycle', 'propagation', connection_name(conn))
+            self._wrap(conn, 'learn', 'learning', connection_name(conn))
+        for layer in self.network.layers:
+            self._wrap(layer, 'update_logs', 'logging', layer.name)
+            self._wrap_inhibition(layer.spec)
+            for unit in layer.units:
+                self._wrap(unit, 'calculate_net_in', 'integration', layer.name)
+                self._wrap(unit, 'cycle', 'integration', layer.name)
+                self._wrap(unit, 'update_logs', 'logging', layer.name)
+
+    def uninstall(self):
+        """Remove the wrappers, restoring the original methods"""
+        for obj, attr in self._wrapped:
+            delattr(obj, attr)
+        self._wrapped = []
+        for key, (spec, profilers) in list(_inhibition_profilers.items()):
+            if self in profilers:
+                profilers.remove(self)
+                if len(profilers) == 0:  # last profiled network using the spec
+                    del spec._inhibition
+                    del _inhibition_profilers[key]
+
+    def timing(self, stage, name):
+        """Context manager timing its block, as a call of the `stage` for `name`"""
+        return _Timing(self, (stage, name))
+
+    def _wrap(self, obj, attr, stage, name):
+        """Time the calls to `obj.attr`"""
+        method = getattr(obj, attr)
+        key = (stage, name)
+
+        @functools.wraps(method)
+        def timed(*args, **kwargs):
+            with _Timing(self, key):
+                return method(*args, **kwargs)
+
+        setattr(obj, attr, timed)
+        self._wrapped.append((obj, attr))
+
+    def _wrap_inhibition(self, spec):
+        """Time the calls to `spec._inhibition()`. Layer specs can be shared by the
+        layers of several networks: the spec is wrapped once, and each call is
+        counted by the profiler of the network of the layer."""
+        if id(spec) not in _inhibition_profilers:
+            method, profilers = spec._inhibition, []
+            _inhibition_profilers[id(spec)] = (spec, profilers)
+
+            @functools.wraps(method)
+            def timed(layer):
+                for profiler in profilers:
+                    name = profiler._layer_names.get(id(layer))
+                    if name is not None:
+                        with _Timing(profiler, ('inhibition', name)):
+                            return method(layer)
+                return method(layer)  # layer of a network that is not profiled
+
+            spec._inhibition = timed
+        profilers = _inhibition_profilers[id(spec)][1]
+        if self not in profilers:
+            profilers.append(self)
+
+
+_inhibition_profilers = {}  # id(layer spec) -> (spec, profilers using its wrapped `_inhibition()`)
+
+
+class _Timing:
+    """Times a block, excluding the time of the timed blocks nested in it"""
+
+    def __init__(self, profiler, key):
+        self.profiler, self.key = profiler, key
+
+    def __enter__(self):
+        self.profiler._stack.append(0.0)
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        stack = self.profiler._stack
+        nested = stack.pop()
+        if len(stack) > 0:
+            stack[-1] += elapsed
+        self.profiler._times[self.key] += elapsed - nested
+        self.profiler._calls[self.key] += 1
+        return False
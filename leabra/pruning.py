@@ -0,0 +1,102 @@
+"""Magnitude-based pruning of the links of trained connections.
+
+After training, the sigmoidal contrast enhancement of the weights
+(`ConnectionSpec.sig()`) pins many weights of 'full' projections near 0.
+`prune()` removes the links whose weight is below a threshold, or keeps only
+the `top_k` strongest links of each post unit, and converts the connection to
+a 'sparse' projection: its link arrays only hold the remaining links, and its
+netin scaling is computed per post unit, from the number of links it keeps.
+
+The report of `prune()` gives the number of links, the memory of the link
+arrays and the time of a net input computation, before and after pruning. A
+'sparse' net input is a scatter-add over the links: it is faster than the
+dense matrix product of a 'full' projection only when few links remain.
+"""
+import copy
+import time
+
+import numpy as np
+
+from .connection import Weights
+from .profiling import connection_name
+
+
+def prune(connection, threshold=None, top_k=None, repeat=100):
+    """Remove the weak links of `connection`, converted to a 'sparse' projection.
+
+    :param threshold:  links with a weight strictly below are removed.
+    :param top_k:      maximum number of links kept for each post unit, the
+                       ones with the largest weights.
+    :param repeat:     number of net input computations timed for the report.
+    :returns:          a dict with the number of links (`'n_links'`), the memory
+                       of the link arrays (`'nbytes'`) and the time of a net
+                       input computation (`'time'`), as (before, after) pairs.
+
+    The connection's spec is copied if it is not already 'sparse', so that
+    the other connections using it are not affected. Tied, reciprocal,
+    'conv' and memory-mapped connections cannot be pruned.
+    """
+    if threshold is None and top_k is None:
+        raise ValueError('either threshold or top_k must be specified')
+    if connection.tied or connection.transposed or connection.wt_idx is not None:
+        raise ValueError('tied, reciprocal and convolutional connections cannot be pruned')
+    if connection.storage_dir is not None:
+        raise ValueError('memory-mapped connections cannot be pruned')
+
+    wt = connection.wt
+    keep = np.ones(connection.n_links, dtype=bool)
+    if threshold is not None:
+        keep &= wt >= threshold
+    if top_k is not None:  # rank of each link among the kept links of its post unit, by decreasing weight
+        candidates = np.flatnonzero(keep)
+        order = candidates[np.lexsort((-wt[candidates], connection.post_idx[candidates]))]
+        counts = np.bincount(connection.post_idx[order], minlength=len(connection.post.units))
+        starts = np.cumsum(counts) - counts
+        rank = np.arange(len(order)) - starts[connection.post_idx[order]]
+        keep[order[rank >= top_k]] = False
+
+    before = _nbytes(connection), _netin_time(connection, repeat)
+    n_links = connection.n_links
+
+    store = connection.weight_store
+    connection.pre_idx, connection.post_idx = connection.pre_idx[keep], connection.post_idx[keep]
+    connection.weight_store = Weights(store.wt[keep], store.fwt[keep], store.dwt[keep])
+    connection.weight_store.version = store.version + 1
+    connection.weight_store.n_connections = 1
+    connection._links = None
+    if connection.spec.proj != 'sparse':
+        connection.spec = copy.copy(connection.spec)
+        connection.spec.proj = 'sparse'
+    connection.compute_netin_scaling()
+
+    after = _nbytes(connection), _netin_time(connection, repeat)
+    return {'n_links': (n_links, connection.n_links),
+            'nbytes': (before[0], after[0]), 'time': (before[1], after[1])}
+
+def prune_network(network, threshold=None, top_k=None, connections=None, repeat=100):
+    """Prune the 'full' and 'sparse' connections of the network (see `prune()`).
+
+    :param connections:  the connections to prune. If None, all the untied
+                         'full' and 'sparse' connections of the network.
+    :returns:            the reports of `prune()`, by connection name
+                         (`'pre->post'`).
+    """
+    if connections is None:
+        connections = [conn for conn in network.connections
+                       if conn.spec.proj in ('full', 'sparse') and not conn.tied
+                       and conn.storage_dir is None]
+    return {connection_name(conn): prune(conn, threshold=threshold, top_k=top_k, repeat=repeat)
+            for conn in connections}
+
+def _nbytes(connection):
+    """Memory of the link arrays of the connection"""
+    return sum(array.nbytes for array in (connection.pre_idx, connection.post_idx,
+                                          connection.wt, connection.fwt, connection.dwt))
+
+def _netin_time(connection, repeat):
+    """Mean time of a net input computation, on random pre activities"""
+    acts = np.random.RandomState(0).uniform(size=len(connection.pre.units))
+    start = time.perf_counter()
+    for _ in range(repeat):
+        connection.spec.netin(connection, acts)
+    return (time.perf_counter() - start) / max(1, repeat)
@@ -0,0 +1,40 @@
+"""Base class of specs, caching the constants derived from their parameters.
+
+Constants derived from the parameters of a spec (`1 / tau_v_m`, ...) are
+computed once, as an immutable namedtuple available as `spec.derived`, and
+recomputed on the next access after any parameter of the spec is set.
+"""
+import collections
+
+
+NoDerived = collections.namedtuple('NoDerived', [])
+
+
+class Spec:
+    """Spec with cached derived constants"""
+
+    _state_names = ()  # attributes that are not parameters: setting them keeps the caches
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if not name.startswith('_') and name not in self._state_names:
+            self.__dict__.pop('_derived', None)
+            self._invalidate(name)
+
+    def _invalidate(self, name):
+        """Discard the caches depending on the parameter `name`, after it was set"""
+        pass
+
+    def _derive(self):
+        """Return the derived constants, as a namedtuple. Specs without derived
+        constants return an empty one."""
+        return NoDerived()
+
+    @property
+    def derived(self):
+        """Constants derived from the parameters"""
+        try:
+            return self.__dict__['_derived']
+        except KeyError:
+            self._derived = self._derive()
+            return self._derived
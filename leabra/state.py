@@ -0,0 +1,121 @@
+"""The dynamic state of a network, separated from its weights and specs.
+
+States do not reference the network they come from: they are cheap to allocate
+and copy, and several states can be run against the same weights. There are
+two kinds of states, which cannot be used in place of one another:
+
+    NetworkState  the state of a `Network`: for each layer, the state variables
+                  of its units as 1-d arrays and the inhibition state of the
+                  layer as floats, and the network's counters. Captured with
+                  `Network.get_state()` and restored with `Network.set_state()`.
+                  A `Network` holds a single state at a time.
+    FrozenState   the state of a `FrozenNetwork`, for a batch of patterns: its
+                  arrays have a leading batch dimension. Created with
+                  `FrozenNetwork.new_state()`. Since the frozen network never
+                  modifies its weights, one frozen network can advance different
+                  states concurrently, from multiple threads.
+
+To run concurrent states against the weights of a trained `Network`, create a
+frozen network from it with `FrozenNetwork.from_network()`. This only covers
+inference: a frozen network runs the minus phase, and reproduces the parameters
+of the specs but not spec subclasses. A `Network` keeps its own state on its
+unit and layer objects, so trials with plus phases and learning run one state
+at a time.
+"""
+import numpy as np
+
+
+UNIT_STATE  = ('g_e', 'I_net', 'I_net_r', 'v_m', 'v_m_eq', 'act', 'act_nd', 'act_m', 'act_ext',
+               'adapt', 'spike', 'avg_ss', 'avg_s', 'avg_m', 'avg_l', 'avg_s_eff')
+LAYER_STATE = ('gc_i', 'ffi', 'fbi', 'avg_act', 'avg_act_p_eff')
+COUNTERS    = ('cycle_count', 'cycle_tot', 'quarter_nb', 'trial_count', 'lrn_count')
+
+
+class NetworkState:
+    """Dynamic state of a network's units, layers and counters"""
+
+    def __init__(self, layers, counters=None, phase='minus'):
+        """
+        :param layers:    list, one entry per layer, of dicts with the state
+                          variables names as keys, and arrays (units variables)
+                          or floats (layer variables) as values.
+        :param counters:  dict of the network's counters.
+        """
+        self.layers   = layers
+        self.counters = {} if counters is None else counters
+        self.phase    = phase
+
+    def copy(self):
+        """Return an independent copy of the state"""
+        return NetworkState([{name: (value.copy() if isinstance(value, np.ndarray) else value)
+                              for name, value in layer.items()} for layer in self.layers],
+                            counters=dict(self.counters), phase=self.phase)
+
+    @classmethod
+    def capture(cls, network):
+        """Copy the state of a `Network`"""
+        layers = []
+        for layer in network.layers:
+            values = {name: unit_array(layer, name) for name in UNIT_STATE}
+            values.update({name: getattr(layer, name) for name in LAYER_STATE})
+            layers.append(values)
+        return cls(layers, counters={name: getattr(network, name) for name in COUNTERS},
+                   phase=network.phase)
+
+    def restore(self, network):
+        """Set the state of a `Network` (with the same layers) to this state"""
+        if len(self.layers) != len(network.layers):
+            raise ValueError('state has {} layers, network has {}'.format(
+                             len(self.layers), len(network.layers)))
+        for layer, values in zip(network.layers, self.layers):
+            for unit in layer.units:
+                unit.ex_inputs = []
+            for name in UNIT_STATE:
+                if len(values[name]) != len(layer.units):
+                    raise ValueError('layer {} has {} units, state has {}'.format(
+                                     layer.name, len(layer.units), len(values[name])))
+                set_unit_array(layer, name, values[name])
+            for name in LAYER_STATE:
+                setattr(layer, name, float(values[name]))
+        for name, value in self.counters.items():
+            setattr(network, name, int(value))
+        network.phase = self.phase
+
+
+class FrozenState:
+    """Dynamic state of a `FrozenNetwork`, for a batch of patterns"""
+
+    def __init__(self, layers, batched=False, cycle_count=0):
+        """
+        :param layers:       list, one entry per layer, of dicts with the state
+                             variables names as keys, and arrays of shape
+                             `(batch_size, layer_size)` (units variables) or
+                             `(batch_size,)` (layer variables) as values.
+        :param batched:      if False, the state was created from 1-d inputs,
+                             and `FrozenNetwork.settle()` returns 1-d activities.
+        :param cycle_count:  number of cycles run since the start of the trial.
+        """
+        self.layers      = layers
+        self.batched     = batched
+        self.cycle_count = cycle_count
+
+    def copy(self):
+        """Return an independent copy of the state"""
+        return FrozenState([{name: (value.copy() if isinstance(value, np.ndarray) else value)
+                             for name, value in layer.items()} for layer in self.layers],
+                           batched=self.batched, cycle_count=self.cycle_count)
+
+
+def unit_array(layer, name):
+    """Array of a units variable, with a forced activity (`act_ext`) of None as NaN"""
+    if name == 'act_ext':
+        return np.array([np.nan if u.act_ext is None else u.act_ext for u in layer.units])
+    return layer.unit_array(name)
+
+def set_unit_array(layer, name, values):
+    """Inverse of `unit_array()`"""
+    for unit, value in zip(layer.units, values):
+        value = float(value)
+        if name == 'act_ext' and np.isnan(value):
+            value = None
+        setattr(unit, name, value)
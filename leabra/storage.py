@@ -0,0 +1,66 @@
+"""Memory-mapped storage of the links of connections larger than memory.
+
+A connection created with `Connection(..., storage_dir=directory)` holds its
+link arrays (`pre_idx`, `post_idx`, `wt`, `fwt` and `dwt`) in `.npy` files,
+memory-mapped with `numpy.memmap`, rather than in memory. Each connection has
+its own subdirectory of `directory` (`links-0`, `links-1`, ..., in the order of
+creation), so that several connections can use the same directory; tied and
+reciprocal connections use the files of the connection they share them with.
+A directory must not be used by two processes at the same time. Its
+links are created, propagated and learned by blocks of `block_size` links, in
+the order of the files, so that the working set stays bounded and the files
+are read sequentially, which keeps the OS page cache effective. For 'full'
+projections, propagation skips the pre units with no activity.
+
+The files are flushed when the network is saved (`Network.save()`). Forks of
+the network copy the arrays in memory when they modify them.
+"""
+import os
+
+import numpy as np
+
+
+BLOCK_SIZE = 2**20  # default number of links per block
+
+_claimed = set()  # connection subdirectories in use in the process
+
+
+def claim(directory):
+    """Return a new subdirectory of `directory`, for the files of one connection.
+
+    Files left in the subdirectory by a previous process are overwritten.
+    """
+    k = 0
+    while os.path.abspath(os.path.join(directory, 'links-{}'.format(k))) in _claimed:
+        k += 1
+    subdirectory = os.path.join(directory, 'links-{}'.format(k))
+    _claimed.add(os.path.abspath(subdirectory))
+    return subdirectory
+
+def allocate(directory, name, dtype, size):
+    """Create the `name` array, of `size` zeros, as a memory-mapped `.npy` file"""
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    path = os.path.join(directory, '{}-{}.npy'.format(name, np.dtype(dtype).name))
+    return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(size,))
+
+def store(directory, name, values, dtype=None, block_size=BLOCK_SIZE):
+    """Copy `values` in a new memory-mapped `.npy` file, by blocks"""
+    array = allocate(directory, name, values.dtype if dtype is None else dtype, len(values))
+    for block in blocks(len(values), block_size):
+        array[block] = values[block]
+    return array
+
+def blocks(size, block_size=None):
+    """Slices covering `size` elements, by blocks of `block_size` (None for a single block)"""
+    if block_size is None:
+        yield slice(0, size)
+        return
+    for start in range(0, size, block_size):
+        yield slice(start, min(size, start + block_size))
+
+def flush(arrays):
+    """Write the changes of the memory-mapped arrays to their files"""
+    for array in arrays:
+        if isinstance(array, np.memmap):
+            array.flush()
@@ -4,10 +4,12 @@ Implementation of a Leabra Unit, reproducing the behavior of emergent 8.0.
 We implement only the rate-coded version. The code is intended to be as simple
 as possible to understand. It is not in any way optimized for performance.
 """
+import collections
 import copy
 
 import numpy as np
-import scipy.interpolate
+
+from .spec import Spec
 
 
 # type of layer and correspondingly, unit behaviors
@@ -19,16 +21,20 @@ OUTPUT = 2
 class Unit:
     """Leabra Unit (as implemented in emergent 8.0)"""
 
-    def __init__(self, spec=None, genre=HIDDEN, log_names=('net', 'I_net', 'v_m', 'act', 'v_m_eq', 'adapt')):
+    def __init__(self, spec=None, genre=HIDDEN, log_names=('net', 'I_net', 'v_m', 'act', 'v_m_eq', 'adapt'),
+                 params=None):
         """
-        spec:  UnitSpec instance with custom values for the unit parameters.
-               If None, default values will be used.
+        spec:    UnitSpec instance with custom values for the unit parameters.
+                 If None, default values will be used.
+        params:  `UnitParams` of the unit, in layers with per-unit parameters.
+                 If None, the parameters are the ones of `spec`.
         """
         self.genre = genre  # type of Unit
 
         self.spec = spec
         if self.spec is None:
             self.spec = UnitSpec()
+        self._params = params
 
         self.log_names = log_names
         self.logs  = {name: [] for name in self.log_names}
@@ -49,7 +55,7 @@ class Unit:
         self.g_e     = 0                  # excitatory conductance
         self.I_net   = 0                  # net current
         self.I_net_r = self.I_net         # net current, equilibrium version (for v_m_eq)
-        self.v_m     = self.spec.v_m_init # membrane potential
+        self.v_m     = self.params.v_m_init # membrane potential
         self.v_m_eq  = self.v_m           # equilibrium membrane potential
                                           # (not reseted after a spike)
         self.act_ext = None               # externally forced activity (None for not forced)
@@ -59,12 +65,18 @@ class Unit:
 
         self.adapt   = 0     # adaptation current: causes the rate of activation
                               # to decrease over time
+        self.spike   = 0     # 1 if v_m crossed the threshold at the last cycle, else 0
 
     @property
     def act_eq(self):
         """For rate-coded units, `act` == `act_eq`. This Unit implementation is only rate-coded."""
         return self.act
 
+    @property
+    def params(self):
+        """Parameters of the unit: its `UnitParams`, or its spec"""
+        return self.spec if self._params is None else self._params
+
     @property
     def avg_l_lrn(self):
         return self.spec.avg_l_lrn(self)
@@ -79,7 +91,7 @@ class Unit:
     @property
     def net(self):
         """Excitatory conductance."""
-        return self.spec.g_bar_e * self.g_e
+        return self.params.g_bar_e * self.g_e
 
     def force_activity(self, act_ext):
         """Force the activity of a unit.
@@ -114,14 +126,56 @@ class Unit:
         print('Parameters:')
         for name in ['dt_v_m', 'dt_net', 'g_l', 'g_bar_e', 'g_bar_l', 'g_bar_i',
                      'e_rev_e', 'e_rev_l', 'e_rev_i', 'act_thr', 'act_gain']:
-            print('   {}: {:.2f}'.format(name, getattr(self.spec, name)))
+            print('   {}: {:.2f}'.format(name, getattr(self.params, name)))
         print('State:')
         for name in ['g_e', 'I_net', 'v_m', 'act', 'v_m_eq']:
             print('   {}: {:.2f}'.format(name, getattr(self, name)))
 
 
 
-class UnitSpec:
+# parameters that can take a different value for each unit of a layer (see `Layer`)
+UNIT_ARRAY_PARAMS = ('tau_net', 'tau_v_m', 'g_l', 'g_bar_e', 'g_bar_l', 'g_bar_i',
+                     'e_rev_e', 'e_rev_l', 'e_rev_i', 'act_thr', 'v_m_init', 'v_m_r',
+                     'dt_adapt', 'v_m_gain', 'spike_gain',
+                     'avg_ss_dt', 'avg_s_dt', 'avg_m_dt', 'avg_m_in_s')
+
+class UnitParams:
+    """Parameters of a unit of a layer with per-unit parameters (see `Layer`).
+
+    The units of the layer share one spec. The parameters of `UNIT_ARRAY_PARAMS`
+    with per-unit values are read in the layer's columns, the others in the spec.
+    """
+
+    def __init__(self, spec, columns, index):
+        """
+        :param columns:  dict of the per-unit values of the layer's units, as
+                         lists, with the parameter names as keys.
+        :param index:    index of the unit in the layer.
+        """
+        self._spec, self._columns, self._index = spec, columns, index
+        self._derived = (None, None)  # (spec.derived, derived constants of the unit)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if name in self._columns:
+            return self._columns[name][self._index]
+        return getattr(self._spec, name)
+
+    @property
+    def derived(self):
+        """Derived constants of the unit, recomputed when the spec's are"""
+        spec_derived = self._spec.derived
+        if self._derived[0] is not spec_derived:
+            values = {name: column[self._index] for name, column in self._columns.items()}
+            self._derived = (spec_derived, self._spec.derive_with(values))
+        return self._derived[1]
+
+
+UnitDerived = collections.namedtuple('UnitDerived', ['dt_net', 'dt_v_m', 'gc_l', 'avg_fact'])
+
+
+class UnitSpec(Spec):
     """Units specification.
 
     Each unit can have different parameters values. They don't change during
@@ -188,19 +242,33 @@ class UnitSpec:
 
         self._nxx1_conv = None # precomputed convolution for the noisy xx1 function
 
+    def _derive(self):
+        return self.derive_with({})
+
+    def derive_with(self, values):
+        """Return the derived constants, computed with the parameters of `values`
+        (a dict of floats, or of per-unit arrays) in place of the spec's. Not cached."""
+        p = lambda name: values[name] if name in values else getattr(self, name)
+        return UnitDerived(dt_net=1.0 / p('tau_net'), dt_v_m=1.0 / p('tau_v_m'),
+                           gc_l=p('g_bar_l') * p('g_l'),
+                           avg_fact=(self.avg_lrn_max - self.avg_lrn_min)/(self.avg_l_gain - self.avg_l_min))
+
+    def _invalidate(self, name):
+        if name in ('act_gain', 'act_sd'):
+            self._nxx1_conv = None
+
     def avg_l_lrn(self, unit):
         if unit.genre != HIDDEN:  # no self-organization for non-hidden layers
             return 0.0
-        avg_fact = (self.avg_lrn_max - self.avg_lrn_min)/(self.avg_l_gain - self.avg_l_min)
-        return self.avg_lrn_min + avg_fact * (unit.avg_l - self.avg_l_min)
+        return self.avg_lrn_min + self.derived.avg_fact * (unit.avg_l - self.avg_l_min)
 
     @property
     def dt_net(self):
-        return 1.0 / self.tau_net
+        return self.derived.dt_net
 
     @property
     def dt_v_m(self):
-        return 1.0 / self.tau_v_m
+        return self.derived.dt_v_m
 
     def copy(self):
         """Return a copy of the spec"""
@@ -217,7 +285,8 @@ class UnitSpec:
         The noisy x/(x+1) function is the convolution of the x/(x+1) function
         with a Gaussian with a `self.spec.act_sd` standard deviation. Here, we
         precompute the convolution as a look-up table, and interpolate it with
-        the desired point every time the function is called.
+        the desired point every time the function is called. The look-up table
+        is computed on the first call.
         """
         if self._nxx1_conv is None:  # convolution not precomputed yet
             res = 0.001 # resolution of the precomputed array
@@ -251,8 +320,7 @@ class UnitSpec:
         elif xs[-1] < v_m:
             return self.xx1(v_m)
         else:
-            return float(scipy.interpolate.interp1d(xs, conv, kind='linear',
-                                                    fill_value='extrapolate')(v_m))
+            return float(np.interp(v_m, xs, conv))
 
 
     def calculate_net_in(self, unit, dt_integ=1):
@@ -272,7 +340,7 @@ class UnitSpec:
             unit.ex_inputs = []
 
         # updating net
-        unit.g_e += dt_integ * self.dt_net * (net_raw - unit.g_e)  # eq 2.16
+        unit.g_e += dt_integ * unit.params.derived.dt_net * (net_raw - unit.g_e)  # eq 2.16
 
 
     def force_activity(self, unit):
@@ -281,16 +349,17 @@ class UnitSpec:
         Note that this is computed immediately when forcing a unit's activity, and in particular
         before cycling connections.
         """
+        p = unit.params
         # calculate_netin
-        unit.g_e = unit.act_ext / self.g_bar_e  # unit.net == unit.act
+        unit.g_e = unit.act_ext / p.g_bar_e  # unit.net == unit.act
         # cycle
         unit.I_net = 0.0
         unit.act    = unit.act_ext
         unit.act_nd = unit.act_ext
         if unit.act == 0:
-            unit.v_m = self.e_rev_l
+            unit.v_m = p.e_rev_l
         else:
-            unit.v_m = self.act_thr + unit.act_ext / self.act_gain;
+            unit.v_m = p.act_thr + unit.act_ext / self.act_gain;
         unit.v_m_eq = unit.v_m
 
 
@@ -303,22 +372,25 @@ class UnitSpec:
         """
         if unit.act_ext is not None: # forced activity
             self.update_avgs(unit, dt_integ)
-            unit.update_logs()
+            if unit.logs:
+                unit.update_logs()
             return # see self.force_activity
+        p = unit.params
+        derived = p.derived
 
         # computing I_net and I_net_r
         unit.I_net   = self.integrate_I_net(unit, g_i, dt_integ, ratecoded=False, steps=2) # half-step integration
         unit.I_net_r = self.integrate_I_net(unit, g_i, dt_integ, ratecoded=True,  steps=1) # one-step integration
 
         # updating v_m and v_m_eq
-        unit.v_m    += dt_integ * self.dt_v_m * unit.I_net   # - unit.adapt is done on the I_net value.
-        unit.v_m_eq += dt_integ * self.dt_v_m * unit.I_net_r
+        unit.v_m    += dt_integ * derived.dt_v_m * unit.I_net   # - unit.adapt is done on the I_net value.
+        unit.v_m_eq += dt_integ * derived.dt_v_m * unit.I_net_r
         #unit.v_m     = max(self.v_m_min, min(unit.v_m, self.v_m_max))
 
         # reseting v_m if over the threshold (spike-like behavior)
-        if unit.v_m > self.act_thr:
+        if unit.v_m > p.act_thr:
             unit.spike = 1
-            unit.v_m   = self.v_m_r
+            unit.v_m   = p.v_m_r
             unit.I_net = 0.0
         else:
             unit.spike = 0
@@ -327,23 +399,22 @@ class UnitSpec:
         act_fun = self.noisy_xx1 if self.noisy_act else self.xx1
 
         # computing new_act, from v_m_eq (because rate-coded neuron)
-        if unit.v_m_eq <= self.act_thr:
-            new_act = act_fun(unit.v_m_eq - self.act_thr)
-            #print('SUBTHR {} {}\n       new_act={}'.format(unit.v_m_eq, self.act_thr, new_act))
+        if unit.v_m_eq <= p.act_thr:
+            new_act = act_fun(unit.v_m_eq - p.act_thr)
+            #print('SUBTHR {} {}\n       new_act={}'.format(unit.v_m_eq, p.act_thr, new_act))
         else:
-            gc_e = self.g_bar_e * unit.g_e
-            gc_i = self.g_bar_i * g_i
-            gc_l = self.g_bar_l * self.g_l
-            g_e_thr = (  gc_i * (self.e_rev_i - self.act_thr)
-                       + gc_l * (self.e_rev_l - self.act_thr)
-                       - unit.adapt) / (self.act_thr - self.e_rev_e)
+            gc_e = p.g_bar_e * unit.g_e
+            gc_i = p.g_bar_i * g_i
+            g_e_thr = (  gc_i * (p.e_rev_i - p.act_thr)
+                       + derived.gc_l * (p.e_rev_l - p.act_thr)
+                       - unit.adapt) / (p.act_thr - p.e_rev_e)
 
             new_act = act_fun(gc_e - g_e_thr)  # gc_e == unit.net
             #print('ABVTHR {} net={} {}\n       new_act={}'.format(unit.v_m_eq, gc_e, g_e_thr, new_act))
 
 
         # updating activity
-        unit.act_nd += dt_integ * self.dt_v_m * (new_act - unit.act_nd)
+        unit.act_nd += dt_integ * derived.dt_v_m * (new_act - unit.act_nd)
         #print('FASTCYV act={}'.format(unit.act_nd))
 
         #unit.act_nd = max(self.act_min, min(unit.act_nd, self.act_max))
@@ -352,13 +423,14 @@ class UnitSpec:
         # updating adaptation
         if self.adapt_on:
             unit.adapt += dt_integ * (
-                            self.dt_adapt * (self.v_m_gain * (unit.v_m - self.e_rev_l) - unit.adapt)
-                            + unit.spike * self.spike_gain
+                            p.dt_adapt * (p.v_m_gain * (unit.v_m - p.e_rev_l) - unit.adapt)
+                            + unit.spike * p.spike_gain
                           )
 
         # if phase == 'minus':
         self.update_avgs(unit, dt_integ)
-        unit.update_logs()
+        if unit.logs:  # no logs: monitoring with hooks, see the `hooks` module
+            unit.update_logs()
 
 
     def integrate_I_net(self, unit, g_i, dt_integ, ratecoded=True, steps=1):
@@ -368,27 +440,30 @@ class UnitSpec:
         """
         assert steps >= 1
 
-        gc_e = self.g_bar_e * unit.g_e
-        gc_i = self.g_bar_i * g_i
-        gc_l = self.g_bar_l * self.g_l
+        p = unit.params
+        gc_e = p.g_bar_e * unit.g_e
+        gc_i = p.g_bar_i * g_i
+        gc_l = p.derived.gc_l
+        dt_v_m = p.derived.dt_v_m
         v_m_eff = unit.v_m_eq if ratecoded else unit.v_m
 
         for _ in range(steps):
-            I_net = (  gc_e * (self.e_rev_e - v_m_eff)
-                     + gc_i * (self.e_rev_i - v_m_eff)
-                     + gc_l * (self.e_rev_l - v_m_eff)
+            I_net = (  gc_e * (p.e_rev_e - v_m_eff)
+                     + gc_i * (p.e_rev_i - v_m_eff)
+                     + gc_l * (p.e_rev_l - v_m_eff)
                      - unit.adapt)
-            v_m_eff += dt_integ/steps * self.dt_v_m * I_net
+            v_m_eff += dt_integ/steps * dt_v_m * I_net
 
         return I_net
 
 
     def update_avgs(self, unit, dt_integ):
         """Update all averages except long-term, at the end of every cycle."""
-        unit.avg_ss += dt_integ * self.avg_ss_dt * (unit.act_nd - unit.avg_ss)
-        unit.avg_s  += dt_integ * self.avg_s_dt  * (unit.avg_ss - unit.avg_s )
-        unit.avg_m  += dt_integ * self.avg_m_dt  * (unit.avg_s  - unit.avg_m )
-        unit.avg_s_eff = self.avg_m_in_s * unit.avg_m + (1 - self.avg_m_in_s) * unit.avg_s
+        p = unit.params
+        unit.avg_ss += dt_integ * p.avg_ss_dt * (unit.act_nd - unit.avg_ss)
+        unit.avg_s  += dt_integ * p.avg_s_dt  * (unit.avg_ss - unit.avg_s )
+        unit.avg_m  += dt_integ * p.avg_m_dt  * (unit.avg_s  - unit.avg_m )
+        unit.avg_s_eff = p.avg_m_in_s * unit.avg_m + (1 - p.avg_m_in_s) * unit.avg_s
         # print('avg_s_eff', unit.avg_s_eff)
 
     def update_avg_l(self, unit):
@@ -50,9 +50,9 @@ setuptools.setup(
     packages=['leabra'],
 
     # required dependencies
-    install_requires=['numpy', 'scipy', 'bokeh>=0.12.6', 'ipywidgets>=7.0', 'jupyter'],
+    install_requires=['numpy', 'bokeh>=0.12.6', 'ipywidgets>=7.0', 'jupyter'],
 
     # you can install extras_require with
     # $ pip install -e .[test]
-    extras_require={'test': ['pytest', 'pytest-cov']},
+    extras_require={'test': ['pytest', 'pytest-cov'], 'numba': ['numba']},
 )
@@ -1,5 +1,7 @@
 import os
-import numpy as np
+
+import dotdot  # pylint: disable=unused-import
+import leabra.io
 
 
 # unit_fmt = {'cycle': int, 'net': float, 'I_net': float,
@@ -23,73 +25,21 @@ def parse_xy(filename, flat=False):
     return parse_file(filename, flat=flat)
 
 def parse_file(filename, trans=None, flat=False):
-    """Return the data file as a dict
+    """Return the data file as a dict of lists, one element per row.
 
-    `vm_eq` is renamed in `v_m_eq`.
+    Matrix columns are lists of arrays. Column names are renamed according to
+    the `trans` dict. The parsing itself is done by `leabra.io.read_dat()`.
     """
-
     filepath = os.path.join(os.path.abspath(os.path.join(__file__, '..')), filename)
-    with open(filepath, 'r') as fd:
-        lines = fd.readlines()
-
-    # removing the newline characters
-    for i, line in enumerate(lines):
-        if line.endswith('\n'):
-            lines[i] = line[:-1]
-
-    # checking some assumptions about the format
-    assert lines[0].startswith('_H:'), 'Unrecognized format {}'.format(filepath)
-    for line in lines[1:]:
-        assert len(line) == 0 or line.startswith('_D:'), 'Unrecognized format {}'.format(filepath)
-
-    header, fmt, matrices_pos, matrices_dim = [], {}, [], []
-    for name in lines[0].split('\t')[1:]:
-        fmt_sign = name[0]
-        name = name[1:]
-
-        if '[' in name:
-            core_name = name[:name.index('[')]
-            header.append(core_name)
-            fmt[core_name] = float
-
-            matrix_pos = (name[name.index('[')+1:name.index(']')]).split(':')[1].split(',')
-            matrix_pos = tuple(int(d) for d in matrix_pos)
-            matrices_pos.append(matrix_pos)
-
-            if '<' in name:
-                matrix_dims = (name[name.index('<')+1:name.index('>')]).split(':')[1].split(',')
-                matrix_dims = tuple(int(d) for d in matrix_dims)
-                matrices_dim.append(matrix_dims)
-            else:
-                matrices_dim.append(None)
-
-        else:
-            matrices_dim.append(None)
-            matrices_pos.append(None)
-            header.append(name)
-            fmt[name] = {'|': int, '$': str, '%': float, '&': float}[fmt_sign]
-
-    data = {name: [] for name in header}
-
-    for line in lines[1:]:
-        if len(line) > 0:
-            values = line.split('\t')[1:]
-            values = [v for v in values if v != '']
-            assert len(values) == len(header), 'len({}) [values] {} != {} [header] len({})'.format(values, len(values), len(header), header)
-
-            for name, dims in zip(header, matrices_dim):
-                if dims is not None:
-                    data[name].append(np.ndarray(dims))
+    columns = leabra.io.read_dat(filepath)
 
-            for name, mpos, v in zip(header, matrices_pos, values):
-                if mpos is None:
-                    data[name].append(fmt[name](v))
-                else:
-                    data[name][-1][mpos] = fmt[name](v)
+    data = {}
+    for name, values in columns.items():
+        data[name] = values.tolist() if values.ndim == 1 else list(values)
 
     # transforming names according to trans dict
     if trans is not None:
-        for name in set(header):
+        for name in list(data.keys()):
             if name in trans:
                 data[trans[name]] = data.pop(name)
 
@@ -0,0 +1,57 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+import dotdot  # pylint: disable=unused-import
+import leabra
+
+import utils
+
+
+def build_network():
+    return utils.build_network(conn_params={'lrate': 0.04, 'rnd_var': 0.25}, hidden_size=3)
+
+
+class CheckpointTest(unittest.TestCase):
+
+    def test_save_load(self):
+        """A restored network continues exactly as the saved one"""
+        for mmap_mode in [None, 'c', 'r']:
+            network = build_network()
+            for _ in range(3):
+                network.trial()
+
+            with tempfile.TemporaryDirectory() as tmpdir:
+                path = os.path.join(tmpdir, 'network.npz')
+                network.save(path)
+                restored = build_network()
+                restored.load(path, mmap_mode=mmap_mode)
+
+                for conn, conn_r in zip(network.connections, restored.connections):
+                    self.assertTrue(np.array_equal(conn.weights, conn_r.weights))
+                self.assertEqual(network.trial_count, restored.trial_count)
+                self.assertEqual(network.layers[1].spec.cycle_count, restored.layers[1].spec.cycle_count)
+
+                for _ in range(2):
+                    self.assertEqual(network.trial(), restored.trial())
+                for conn, conn_r in zip(network.connections, restored.connections):
+                    self.assertTrue(np.array_equal(conn.weights, conn_r.weights))
+                del restored  # releasing memory-mapped files
+
+    def test_load_mismatch(self):
+        """Loading into a different architecture fails"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'network.npz')
+            build_network().save(path)
+            input_layer  = leabra.Layer(4, name='input_layer')
+            output_layer = leabra.Layer(2, name='output_layer')
+            network = leabra.Network(layers=[input_layer, output_layer],
+                                     connections=[leabra.Connection(input_layer, output_layer)])
+            with self.assertRaises(ValueError):
+                network.load(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
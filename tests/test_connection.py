@@ -1,5 +1,13 @@
+import os
+import random
+import tempfile
+
+import numpy as np
+
 import dotdot
 import leabra
+from leabra import pruning
+from leabra.frozen import FrozenNetwork
 
 def test_sig_inv():
     conn_spec = leabra.ConnectionSpec()
@@ -8,3 +16,210 @@ def test_sig_inv():
     assert conn_spec.sig_inv( 0.5) == 0.5
     assert conn_spec.sig_inv( 1.0) == 1.0
     assert conn_spec.sig_inv( 2.0) == 1.0
+
+def test_derived():
+    conn_spec = leabra.ConnectionSpec(d_rev=0.1)
+    assert conn_spec.xcal(0.01, 1.0) == -0.01 * 9
+    conn_spec.d_rev = 0.5
+    assert conn_spec.xcal(0.01, 1.0) == -0.01
+
+def build_conv_network(engine='python'):
+    random.seed(0)
+    np.random.seed(0)
+    unit_spec = leabra.UnitSpec()
+    input_layer  = leabra.Layer(36, shape=(6, 6), unit_spec=unit_spec, genre=leabra.INPUT, name='input_layer')
+    hidden_layer = leabra.Layer(9, shape=(3, 3), unit_spec=unit_spec, name='hidden_layer')
+    conn_spec = leabra.ConnectionSpec(proj='conv', kernel=(3, 3), stride=2, padding=1,
+                                      lrule='leabra', lrate=0.01)
+    conn = leabra.Connection(input_layer, hidden_layer, spec=conn_spec)
+    network = leabra.Network(spec=leabra.NetworkSpec(engine=engine, lrn_interval=0),
+                             layers=[input_layer, hidden_layer], connections=[conn])
+    network.set_inputs({'input_layer': (np.random.uniform(size=36) > 0.5).astype(float).tolist()})
+    return network
+
+def test_conv_projection():
+    network = build_conv_network()
+    conn = network.connections[0]
+    assert conn.wt.shape == (9,) and conn.n_links == 64  # kernel weights; no links from the padding
+    # the first post unit only receives from the bottom-right of the kernel
+    assert conn.pre_idx[conn.post_idx == 0].tolist() == [0, 1, 6, 7]
+    assert conn.wt_idx[conn.post_idx == 0].tolist() == [4, 5, 7, 8]
+
+    acts = np.random.uniform(size=36)
+    link_sum = np.bincount(conn.post_idx, weights=conn.link_wt * acts[conn.pre_idx])
+    assert np.allclose(conn.spec.netin(conn, acts), link_sum)
+    assert conn.weights.shape == (3, 3)  # the kernel
+    assert np.array_equal(conn.weights.ravel()[conn.wt_idx], conn.link_wt)
+    kernel = conn.weights
+    conn.weights = kernel * 0.5
+    assert np.allclose(conn.spec.netin(conn, acts), 0.5 * link_sum)
+    conn.weights = kernel
+    assert np.array_equal(conn.weights, kernel)
+
+    network.trial()
+    assert len(set(conn.wt_scale.tolist())) > 1  # per post unit fan-in
+    assert np.count_nonzero(conn.dwt) > 0
+
+    # weight changes are summed over the positions of the kernel
+    pre, post, spec = network.layers[0], network.layers[1], conn.spec
+    conn.dwt[:] = 0.0
+    spec.learning_rule(conn)
+    srs = post.unit_array('avg_s_eff')[conn.post_idx] * pre.unit_array('avg_s_eff')[conn.pre_idx]
+    srm = post.unit_array('avg_m')[conn.post_idx] * pre.unit_array('avg_m')[conn.pre_idx]
+    avg_l, avg_l_lrn = post.unit_array('avg_l')[conn.post_idx], post.unit_array('avg_l_lrn')[conn.post_idx]
+    dwt = spec.lrate * (spec.m_lrn * spec.xcal(srs, srm) + avg_l_lrn * spec.xcal(srs, avg_l))
+    assert np.allclose(conn.dwt, [dwt[conn.wt_idx == k].sum() for k in range(9)])
+
+    for engine in ['numpy']:  # the engines use the convolution
+        other = build_conv_network(engine)
+        other.trial()
+        assert np.allclose(other.connections[0].wt_scale, conn.wt_scale)
+        assert np.allclose(other.layers[1].unit_array('act'), network.layers[1].unit_array('act'),
+                           rtol=1e-10, atol=1e-12)
+
+def test_conv_save_freeze():
+    """Convolutional connections are saved, restored and frozen"""
+    network = build_conv_network()
+    for _ in range(2):
+        network.trial()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'network.npz')
+        network.save(path)
+        restored = build_conv_network()
+        restored.load(path)
+        assert np.array_equal(restored.connections[0].weights, network.connections[0].weights)
+        assert np.isclose(restored.trial(), network.trial())
+
+        frozen_path = os.path.join(tmpdir, 'frozen.npz')
+        network.freeze(frozen_path)
+        frozen = FrozenNetwork.load(frozen_path)
+
+    for layer in network.layers:  # starting from a fresh layer state, like the frozen network
+        layer.avg_act, layer.fbi = 0.0, 0.0
+    act_m = network.test_trial()
+    assert np.allclose(frozen.settle(network._inputs)['hidden_layer'], act_m['hidden_layer'],
+                       rtol=1e-10, atol=1e-12)
+
+def test_storage():
+    """Memory-mapped links, processed by blocks, give the results of in-memory links"""
+    def build_network(storage_dir):
+        random.seed(0)
+        np.random.seed(0)
+        unit_spec = leabra.UnitSpec()
+        layers = [leabra.Layer(n, unit_spec=unit_spec, name=name)
+                  for n, name in [(10, 'input_layer'), (8, 'hidden_layer'), (3, 'output_layer')]]
+        conn_spec = leabra.ConnectionSpec(proj='full', lrule='leabra', lrate=0.04)
+        conn_ih = leabra.Connection(layers[0], layers[1], spec=conn_spec, storage_dir=storage_dir)
+        conn_ho = leabra.Connection(layers[1], layers[2], spec=conn_spec, storage_dir=storage_dir)
+        conn_oh = leabra.Connection(layers[2], layers[1], reciprocal=conn_ho)  # memory-mapped as well
+        if storage_dir is not None:
+            conn_ih.block_size = 16  # two pre units per block
+            conn_ho.block_size = conn_oh.block_size = 6  # two hidden units per block
+        network = leabra.Network(layers=layers, connections=[conn_ih, conn_ho, conn_oh])
+        network.set_inputs({'input_layer': [1.0, 0.0, 0.0, 1.0, 0.0, 0.0, 1.0, 1.0, 0.0, 0.0]})
+        network.set_outputs({'output_layer': [1.0, 0.0, 0.0]})
+        return network
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        network, reference = build_network(tmpdir), build_network(None)
+        conn, conn_ho, conn_oh = network.connections
+        assert conn.storage_dir != conn_ho.storage_dir == conn_oh.storage_dir  # one directory per connection
+        assert isinstance(conn.wt, np.memmap) and isinstance(conn.pre_idx, np.memmap)
+        assert np.array_equal(conn_ho.wt, reference.connections[1].wt)
+        assert np.array_equal(conn.wt, reference.connections[0].wt)
+        assert np.array_equal(conn.pre_idx, reference.connections[0].pre_idx)
+
+        for _ in range(3):
+            assert np.isclose(network.trial(), reference.trial())
+        assert np.allclose(conn.wt, reference.connections[0].wt)
+
+        network.save(os.path.join(tmpdir, 'network.npz'))  # flushes the files
+        assert np.array_equal(np.load(os.path.join(conn.storage_dir, 'wt-float64.npy')), conn.wt)
+        wt = conn.wt.copy()
+        network.trial()
+        network.load(os.path.join(tmpdir, 'network.npz'))
+        assert isinstance(conn.wt, np.memmap) and np.array_equal(conn.wt, wt)
+
+        # a fork does not write in the files of its parent
+        network.trial()
+        trained = conn.wt.copy()
+        fork = network.fork()
+        fork.load(os.path.join(tmpdir, 'network.npz'))
+        conn_fork = fork.connections[0]
+        assert np.array_equal(conn_fork.wt, wt) and np.array_equal(conn.wt, trained)
+        assert isinstance(conn.wt, np.memmap) and conn.wt.filename is not None
+        assert os.path.dirname(conn_fork.wt.filename) == conn_fork.storage_dir != conn.storage_dir
+        wt_ho = conn_ho.wt.copy()
+        fork.connections[1].set_dtype(np.float32)
+        assert conn_ho.wt.dtype == np.float64 and np.array_equal(conn_ho.wt, wt_ho)
+        network.trial()
+        assert np.array_equal(conn_fork.wt, wt)
+
+def test_storage_blocks():
+    """'1to1' and 'sparse' connections propagate, learn and assign weights by blocks"""
+    def build_network(storage_dir):
+        random.seed(0)
+        unit_spec = leabra.UnitSpec()
+        layers = [leabra.Layer(7, unit_spec=unit_spec, name=name) for name in ['input_layer', 'output_layer']]
+        conn_spec = leabra.ConnectionSpec(proj='1to1', lrule='leabra', lrate=0.5)
+        conn = leabra.Connection(layers[0], layers[1], spec=conn_spec, storage_dir=storage_dir)
+        if storage_dir is not None:
+            conn.block_size = 3
+        network = leabra.Network(layers=layers, connections=[conn])
+        network.set_inputs({'input_layer': [1.0, 0.0, 1.0, 1.0, 0.0, 1.0, 0.0]})
+        network.set_outputs({'output_layer': [0.0, 1.0, 1.0, 0.0, 0.0, 1.0, 1.0]})
+        return network
+
+    acts = np.random.uniform(size=7)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        network, reference = build_network(tmpdir), build_network(None)
+        conn, conn_r = network.connections[0], reference.connections[0]
+        assert np.allclose(conn.spec.netin(conn, acts), conn_r.spec.netin(conn_r, acts))
+        for _ in range(2):
+            assert np.isclose(network.trial(), reference.trial())
+        assert np.allclose(conn.wt, conn_r.wt) and np.allclose(conn.fwt, conn_r.fwt)
+
+        W = np.linspace(0.1, 0.9, 7)[np.newaxis, :]
+        conn.weights, conn_r.weights = W, W
+        assert np.allclose(conn.fwt, conn_r.fwt)
+        conn.spec.proj = 'sparse'  # same links, through the 'sparse' path
+        assert np.allclose(conn.spec.netin(conn, acts), W[0] * acts)
+        conn.weights = np.diag(W[0])
+        assert np.allclose(conn.wt, W[0]) and np.allclose(conn.fwt, conn_r.fwt)
+        del network, conn  # releasing memory-mapped files
+
+def test_pruning():
+    random.seed(0)
+    np.random.seed(0)
+    unit_spec = leabra.UnitSpec()
+    input_layer  = leabra.Layer(20, unit_spec=unit_spec, genre=leabra.INPUT, name='input_layer')
+    output_layer = leabra.Layer(10, unit_spec=unit_spec, genre=leabra.OUTPUT, name='output_layer')
+    conn_spec = leabra.ConnectionSpec(proj='full', lrule='leabra', rnd_mean=0.5, rnd_var=0.45)
+    conn  = leabra.Connection(input_layer, output_layer, spec=conn_spec)
+    other = leabra.Connection(input_layer, output_layer, spec=conn_spec)  # same spec, not pruned
+    network = leabra.Network(layers=[input_layer, output_layer], connections=[conn, other])
+    W = conn.weights
+
+    report = pruning.prune(conn, threshold=0.5)
+    assert conn.spec.proj == 'sparse' and other.spec.proj == 'full'
+    assert report['n_links'] == (200, int(np.sum(W >= 0.5)))
+    assert report['nbytes'][1] < report['nbytes'][0]
+    assert np.all(conn.wt >= 0.5) and np.allclose(conn.fwt, conn_spec.sig_inv(conn.wt))
+    acts = np.random.uniform(size=20)
+    assert np.allclose(conn.spec.netin(conn, acts), np.dot(acts, np.where(W >= 0.5, W, 0.0)))
+    fan_in = np.bincount(conn.post_idx, minlength=10)  # netin scaling from the remaining links
+    assert len(set(conn.wt_scale_act.tolist())) > 1 and len(set(fan_in.tolist())) > 1
+
+    # top-k links per post unit, after the threshold
+    reports = network.prune(top_k=3, connections=[conn])
+    assert reports['input_layer->output_layer']['n_links'] == (report['n_links'][1], 30)
+    assert np.all(np.bincount(conn.post_idx, minlength=10) == 3)
+    for j in range(10):
+        kept = np.sort(conn.wt[conn.post_idx == j])
+        assert np.allclose(kept, np.sort(W[:, j][W[:, j] >= 0.5])[-3:])
+
+    network.set_inputs({'input_layer': np.random.uniform(size=20).tolist()})
+    network.set_outputs({'output_layer': np.random.uniform(size=10).tolist()})
+    network.trial()  # the sparse connection learns
+    assert conn.n_links == 30 and np.count_nonzero(conn.weights) == 30
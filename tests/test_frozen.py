@@ -0,0 +1,159 @@
+import concurrent.futures
+import os
+import random
+import tempfile
+import unittest
+
+import numpy as np
+
+import dotdot  # pylint: disable=unused-import
+import leabra
+from leabra import frozen as frozen_module
+from leabra.frozen import FrozenNetwork, quantization_report
+
+
+def build_network(hidden_params=None):
+    unit_spec    = leabra.UnitSpec(adapt_on=True, noisy_act=True)
+    layer_spec   = leabra.LayerSpec(lay_inhib=True, g_i=1.8, ff=1, fb=1)
+    input_layer  = leabra.Layer(4, spec=layer_spec, unit_spec=unit_spec, genre=leabra.INPUT, name='input_layer')
+    hidden_layer = leabra.Layer(5, spec=layer_spec, unit_spec=unit_spec, genre=leabra.HIDDEN, name='hidden_layer',
+                                unit_params=hidden_params)
+    output_layer = leabra.Layer(3, spec=layer_spec, unit_spec=unit_spec, genre=leabra.OUTPUT, name='output_layer')
+    conn_spec = leabra.ConnectionSpec(proj='full', lrule='leabra', lrate=0.04)
+    network = leabra.Network(layers=[input_layer, hidden_layer, output_layer],
+                             connections=[leabra.Connection(input_layer, hidden_layer, spec=conn_spec),
+                                          leabra.Connection(hidden_layer, output_layer, spec=conn_spec)])
+    return network
+
+
+class FrozenTest(unittest.TestCase):
+
+    def test_settle(self):
+        """The frozen network settles like the original network"""
+        self._check_settle(build_network())
+
+    def test_unit_params(self):
+        """Per-unit parameters are frozen"""
+        self._check_settle(build_network({'act_thr': [0.4, 0.45, 0.5, 0.55, 0.6],
+                                          'v_m_r':   [0.3, 0.3, 0.2, 0.3, 0.4]}))
+
+    def _check_settle(self, network):
+        patterns = [[1.0, 1.0, 0.0, 0.0], [0.0, 1.0, 1.0, 0.0], [0.0, 0.0, 0.0, 1.0]]
+        network.set_inputs({'input_layer': patterns[0]})
+        network.set_outputs({'output_layer': [1.0, 0.0, 0.0]})
+        for _ in range(5):
+            network.trial()
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'frozen.npz')
+            network.freeze(path)
+            frozen = FrozenNetwork.load(path)
+
+        batch_acts = frozen.settle({'input_layer': patterns})
+        for i, pattern in enumerate(patterns):
+            for layer in network.layers:  # starting from a fresh layer state, like the frozen network.
+                layer.avg_act, layer.fbi = 0.0, 0.0
+            network.set_inputs({'input_layer': pattern})
+            act_m = network.test_trial()
+            frozen_act_m = frozen.settle({'input_layer': pattern})
+            for name in ['hidden_layer', 'output_layer']:
+                self.assertTrue(np.allclose(act_m[name], frozen_act_m[name], rtol=1e-10, atol=1e-12))
+                self.assertTrue(np.allclose(frozen_act_m[name], batch_acts[name][i]))
+
+    def test_quantize(self):
+        """Quantized weights reduce memory, and settle close to the float weights"""
+        random.seed(0)
+        np.random.seed(0)
+        network = build_network()
+        patterns = np.array([[1.0, 1.0, 0.0, 0.0], [0.0, 1.0, 1.0, 0.0], [0.0, 0.0, 0.0, 1.0]])
+        targets  = np.array([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]])
+        for _ in range(3):
+            for pattern, target in zip(patterns, targets):
+                network.set_inputs({'input_layer': pattern.tolist()})
+                network.set_outputs({'output_layer': target.tolist()})
+                network.trial()
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'frozen.npz')
+            network.freeze(path)
+            frozen = FrozenNetwork.load(path)
+            network.freeze(path, quantize='uint16')
+            frozen_uint16 = FrozenNetwork.load(path)
+        self.assertEqual(frozen_uint16.connections[0]['W'].dtype, np.uint16)
+
+        inputs = {'input_layer': patterns}
+        # the steep activation function amplifies the errors of 8-bit weights, and of 8-bit activities
+        for dtype, accumulate, ratio, tol in [('int8', 'float32', 8, 0.2), ('uint8', 'int', 8, 0.2),
+                                              ('uint16', 'float32', 4, 5e-3), ('uint16', 'int', 4, 0.1)]:
+            quantized = frozen.quantize(dtype, accumulate=accumulate)
+            report = quantization_report(frozen, quantized, inputs, targets={'output_layer': targets})
+            self.assertEqual(report['weight_nbytes'][0], ratio * report['weight_nbytes'][1])
+            for name in ['hidden_layer', 'output_layer']:
+                self.assertLess(report['act_m'][name]['max'], tol, (dtype, accumulate, name))
+            sse, sse_q = report['sse']['output_layer']
+            self.assertLess(abs(sse - sse_q), tol)
+
+        acts = frozen.quantize('uint16').settle(inputs)
+        acts_file = frozen_uint16.settle(inputs)
+        self.assertTrue(np.allclose(acts['output_layer'], acts_file['output_layer']))
+
+        # the quantized weights are converted by blocks of rows, without a full copy
+        W = np.random.randint(0, 2**16, size=(50, 30)).astype(np.uint16)
+        acts = np.random.uniform(size=(3, 50))
+        for accumulate in ['float32', 'int']:
+            conn = {'W': W, 'w_scale': 0.5, 'accumulate': accumulate}
+            acts_dtype = acts if accumulate == 'float32' else np.rint(acts * frozen_module.ACT_LEVELS)
+            expected = np.dot(acts_dtype, W.astype(float)) * 0.5
+            if accumulate == 'int':
+                expected /= frozen_module.ACT_LEVELS
+            frozen_module.QUANT_BLOCK, block = 64, frozen_module.QUANT_BLOCK  # several blocks of two rows
+            try:
+                netin = FrozenNetwork._netin(conn, acts)
+            finally:
+                frozen_module.QUANT_BLOCK = block
+            self.assertTrue(np.allclose(netin, expected, rtol=1e-6), accumulate)
+
+    def test_concurrent_states(self):
+        """States settled from several threads on the same weights give the sequential results"""
+        network = build_network()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'frozen.npz')
+            network.freeze(path)
+            frozen = FrozenNetwork.load(path)
+
+        rng = np.random.RandomState(0)
+        patterns = [(rng.uniform(size=4) > 0.5).astype(float) for _ in range(16)]
+        expected = [frozen.settle({'input_layer': pattern}) for pattern in patterns]
+
+        def settle_in_steps(pattern):  # interleaving the threads as much as possible
+            state = frozen.new_state({'input_layer': pattern})
+            for _ in range(3 * frozen.quarter_size):
+                frozen.run(state, 1)
+            return frozen.settle(state=state)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(settle_in_steps, patterns))
+        for acts, expected_acts in zip(results, expected):
+            self.assertTrue(np.array_equal(acts['output_layer'], expected_acts['output_layer']))
+
+        # the states of networks and frozen networks cannot be mixed
+        with self.assertRaises(TypeError):
+            network.set_state(frozen.new_state({'input_layer': patterns[0]}))
+        with self.assertRaises(TypeError):
+            frozen.run(network.get_state(), 1)
+
+    def test_from_network(self):
+        """A frozen network created in memory settles like one loaded from a file"""
+        network = build_network()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'frozen.npz')
+            network.freeze(path)
+            frozen = FrozenNetwork.load(path)
+        in_memory = FrozenNetwork.from_network(network)
+        pattern = {'input_layer': [1.0, 0.0, 1.0, 0.0]}
+        self.assertTrue(np.array_equal(in_memory.settle(pattern)['output_layer'],
+                                       frozen.settle(pattern)['output_layer']))
+
+
+if __name__ == '__main__':
+    unittest.main()
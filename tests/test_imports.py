@@ -0,0 +1,16 @@
+import os
+import subprocess
+import sys
+
+
+def test_light_import():
+    """`import leabra` only loads NumPy, and no heavy dependency"""
+    root = os.path.abspath(os.path.join(__file__, '../..'))
+    code = 'import sys, leabra; print(" ".join(sorted(sys.modules)))'
+    modules = subprocess.check_output([sys.executable, '-c', code], cwd=root).decode().split()
+    for name in ['scipy', 'bokeh', 'ipywidgets', 'zipfile']:
+        assert name not in modules, '{} imported by `import leabra`'.format(name)
+
+
+if __name__ == '__main__':
+    test_light_import()
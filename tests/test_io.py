@@ -0,0 +1,124 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+import dotdot  # pylint: disable=unused-import
+import leabra
+from leabra import io
+
+
+WTS_DIR  = os.path.join(os.path.dirname(__file__), 'emergent_projects')
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+
+class WtsTest(unittest.TestCase):
+
+    def test_read_wts(self):
+        """Read an emergent weights file"""
+        weights = io.read_wts(os.path.join(WTS_DIR, 'leabra_std4.wts'))
+        self.assertEqual(set(weights.keys()), {('Input', 'Hidden'), ('Hidden', 'Output')})
+        self.assertEqual(weights[('Input', 'Hidden')].shape, (4, 4))
+        self.assertEqual(weights[('Input', 'Hidden')][0, 0], 0.468802)
+        self.assertEqual(weights[('Input', 'Hidden')][3, 1], 0.742688)
+        self.assertEqual(weights[('Hidden', 'Output')][3, 3], 0.367567)
+
+    def test_round_trip(self):
+        """Weights written and loaded back are identical"""
+        input_layer  = leabra.Layer(25, name='Input')
+        hidden_layer = leabra.Layer(25, name='Hidden')
+        output_layer = leabra.Layer(25, name='Output')
+        network = leabra.Network(layers=[input_layer, hidden_layer, output_layer],
+                                 connections=[leabra.Connection(input_layer, hidden_layer),
+                                              leabra.Connection(hidden_layer, output_layer)])
+        io.load_wts(network, os.path.join(WTS_DIR, 'leabra_std25.wts'))
+        expected = io.read_wts(os.path.join(WTS_DIR, 'leabra_std25.wts'))
+        self.assertTrue(np.array_equal(network.connections[0].weights, expected[('Input', 'Hidden')]))
+        self.assertTrue(np.array_equal(network.connections[1].weights, expected[('Hidden', 'Output')]))
+
+        # one-to-one projections are supported as well
+        onetoone = leabra.Layer(25, name='OneToOne')
+        network.add_layer(onetoone)
+        network.add_connection(leabra.Connection(output_layer, onetoone,
+                                                 spec=leabra.ConnectionSpec(proj='1to1')))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'network.wts')
+            io.write_wts(network, path, fmt='%.17g')
+            weights = [conn.weights for conn in network.connections]
+            for conn in network.connections:
+                conn.weights = np.zeros_like(conn.weights)
+            io.load_wts(network, path)
+            for conn, wts in zip(network.connections, weights):
+                self.assertTrue(np.array_equal(conn.weights, wts))
+
+
+class DatTest(unittest.TestCase):
+
+    def test_read_dat(self):
+        """Read an emergent data table as typed columns"""
+        columns = io.read_dat(os.path.join(DATA_DIR, 'leabra_std4_trial.dat'), cache=False)
+        self.assertEqual(columns['trial'].dtype.kind, 'i')
+        self.assertEqual(columns['trial_name'][0], 'checks')
+        self.assertEqual(columns['sse'][0], 1.98061)
+        self.assertEqual(columns['hidden_wts'].shape, (5, 4, 4))
+        self.assertEqual(columns['hidden_wts'][0, 0, 0], 0.468802)  # same as the weights file
+        self.assertEqual(columns['hidden_wts'][0, 3, 1], 0.742688)
+
+    def test_cache(self):
+        """The cache is used, and invalidated when the file changes"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'table.dat')
+            with open(path, 'w') as fd:
+                fd.write('_H:\t|cycle\t%act\n_D:\t1\t0.5\n')
+            self.assertEqual(io.read_dat(path)['act'][0], 0.5)
+            self.assertTrue(os.path.exists(path + '.cache.npz'))
+            self.assertEqual(io.read_dat(path)['act'][0], 0.5)
+
+            with open(path, 'w') as fd:
+                fd.write('_H:\t|cycle\t%act\n_D:\t1\t0.25\n_D:\t2\t0.75\n')
+            self.assertEqual(io.read_dat(path)['act'].tolist(), [0.25, 0.75])
+
+            with open(path + '.cache.npz', 'r+b') as fd:  # interrupted write: truncated sidecar
+                fd.truncate(20)
+            self.assertEqual(io.read_dat(path)['act'].tolist(), [0.25, 0.75])
+            self.assertEqual(sorted(os.listdir(tmpdir)), ['table.dat', 'table.dat.cache.npz'])
+
+    def test_write_dat(self):
+        """Trial and epoch logs written by a DatWriter are read back identically"""
+        input_layer  = leabra.Layer(4, name='input_layer')
+        output_layer = leabra.Layer(2, name='output_layer')
+        network = leabra.Network(layers=[input_layer, output_layer],
+                                 connections=[leabra.Connection(input_layer, output_layer)])
+        network.set_inputs({'input_layer': [1.0, 1.0, 0.0, 0.0]})
+        network.set_outputs({'output_layer': [1.0, 0.0]})
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            trial_path, epoch_path = os.path.join(tmpdir, 'trial.dat'), os.path.join(tmpdir, 'epoch.dat')
+            records = []
+            with io.DatWriter(trial_path, buffer_rows=2, fmt='%.17g') as trial_log, \
+                 io.DatWriter(epoch_path) as epoch_log:
+                for _ in range(3):
+                    network.trial()
+                    records.append(io.trial_record(network))
+                    trial_log.write(records[-1])
+                epoch_log.write(io.epoch_record(network, 0))
+
+            columns = io.read_dat(trial_path, cache=False)
+            self.assertEqual(columns['trial'].tolist(), [0, 1, 2])
+            self.assertEqual(columns['trial'].dtype.kind, 'i')
+            self.assertEqual(columns['sse'].tolist(), [r['sse'] for r in records])
+            self.assertTrue(np.array_equal(columns['input_layer_act_m'],
+                                           [r['input_layer_act_m'] for r in records]))
+            self.assertEqual(io.read_dat(epoch_path, cache=False)['n_trials'].tolist(), [3])
+
+            matrix_path = os.path.join(tmpdir, 'matrix.dat')
+            acts = np.arange(6.0).reshape(2, 3)
+            with io.DatWriter(matrix_path) as writer:
+                writer.write({'acts': acts})
+            self.assertTrue(np.array_equal(io.read_dat(matrix_path, cache=False)['acts'][0], acts))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+
+import numpy as np
+
+import data
+
+import dotdot  # pylint: disable=unused-import
+import leabra
+from leabra import metrics
+
+
+class MetricsTest(unittest.TestCase):
+
+    def test_trial_metrics(self):
+        """Check metrics values on a simple trial"""
+        targets = [0.0, 0.0, 1.0, 1.0]
+        acts    = [1.0, 1.0, 1.0, 1.0]
+        trial = metrics.trial_metrics(targets, acts)
+        self.assertEqual(trial['sse'], 2.0)
+        self.assertEqual(trial['norm_err'], 0.5)
+        self.assertTrue(np.isclose(trial['cos_err'], np.sqrt(0.5)))
+        self.assertEqual(trial['bin_err'], 1.0)
+
+    def test_batched_metrics(self):
+        """Batched metrics are identical to trial-by-trial ones"""
+        rng = np.random.RandomState(0)
+        targets = (rng.uniform(size=(10, 25)) > 0.8).astype(float)
+        acts    = rng.uniform(size=(10, 25))
+        batch = metrics.trial_metrics(targets, acts)
+        for name, values in batch.items():
+            self.assertEqual(values.shape, (10,))
+            for t in range(10):
+                self.assertTrue(np.isclose(values[t], metrics.trial_metrics(targets[t], acts[t])[name]))
+
+    def test_epoch_aggregation(self):
+        """Epoch aggregation matches emergent's epoch data"""
+        trial_data = data.parse_file('leabra_std4_trial.dat')
+        epoch_data = data.parse_file('leabra_std4_epoch.dat')
+        for t in range(len(trial_data['sse'])):  # one trial per epoch
+            epoch_metrics = leabra.EpochMetrics()
+            epoch_metrics.add({'sse': trial_data['sse'][t], 'norm_err': trial_data['norm_err'][t],
+                               'cos_err': trial_data['cos_err'][t],
+                               'bin_err': trial_data['Output_lay_bin_err'][t]})
+            summary = epoch_metrics.summary()
+            for name in ['avg_sse', 'cnt_err', 'pct_cor', 'pct_err', 'avg_norm_err', 'avg_cos_err']:
+                self.assertTrue(np.isclose(summary[name], epoch_data[name][t]))
+
+    def test_network_metrics(self):
+        """Network accumulates metrics over trials"""
+        input_layer  = leabra.Layer(4, name='input_layer')
+        output_layer = leabra.Layer(2, name='output_layer')
+        conn    = leabra.Connection(input_layer, output_layer,
+                                    spec=leabra.ConnectionSpec(lrule='leabra'))
+        network = leabra.Network(layers=[input_layer, output_layer], connections=[conn])
+        network.set_inputs({'input_layer': [1.0, 1.0, 0.0, 0.0]})
+        network.set_outputs({'output_layer': [1.0, 0.0]})
+
+        sses = [network.trial() for _ in range(3)]
+        summary = network.epoch_metrics.summary()
+        self.assertEqual(summary['n_trials'], 3)
+        self.assertTrue(np.isclose(summary['avg_sse'], np.mean(sses)))
+        self.assertTrue(np.isclose(sses[-1], network.compute_sse()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,4 @@
+import copy
 import unittest
 import os
 
@@ -7,9 +8,10 @@ import data
 
 import dotdot  # pylint: disable=unused-import
 import leabra
+import leabra.hooks
+import leabra.io
 
-from read_weight_file import read_weights
-from utils import quantitative_match
+from utils import quantitative_match, build_network
 
 
 class NetworkTestAPI(unittest.TestCase):
@@ -33,6 +35,276 @@ class NetworkTestAPI(unittest.TestCase):
 
         self.assertTrue(True)
 
+    def test_minus_cache(self):
+        """Test that test_trial() caches minus phase results until weights change"""
+        cached, reference = build_network(minus_cache_size=4), build_network(minus_cache_size=0)
+        for network in [cached, reference]:
+            network.trial()
+
+        act_m = cached.test_trial()
+        cycle_tot = cached.cycle_tot
+        self.assertTrue(np.allclose(act_m['output_layer'], cached.test_trial()['output_layer']))
+        self.assertEqual(cycle_tot, cached.cycle_tot)  # cache hit: no settling
+        self.assertTrue(np.allclose(act_m['output_layer'],
+                                    reference.test_trial()['output_layer']))
+
+        for network in [cached, reference]:  # learning invalidates the cache
+            network.trial()
+        self.assertTrue(np.allclose(cached.test_trial()['output_layer'],
+                                    reference.test_trial()['output_layer']))
+        self.assertEqual(cached.trial_count, reference.trial_count + 1)  # one more test trial
+
+        # entries are keyed by the versions of the connections influencing the reached layers only
+        other_layer   = leabra.Layer(2, name='other_layer')  # not reached, but projects to a reached layer
+        other_conn    = leabra.Connection(other_layer, cached.layers[1])
+        island_layers = [leabra.Layer(2, name='island_{}'.format(i)) for i in range(2)]
+        island_conn   = leabra.Connection(*island_layers)
+        for layer in [other_layer] + island_layers:
+            cached.add_layer(layer)
+        for conn in [other_conn, island_conn]:
+            cached.add_connection(conn)
+        cached.test_trial()
+        cycle_tot = cached.cycle_tot
+        island_conn.weights = np.zeros((2, 2))
+        cached.test_trial()
+        self.assertEqual(cycle_tot, cached.cycle_tot)
+        other_conn.weights = np.zeros((2, 2))
+        cached.test_trial()
+        self.assertGreater(cached.cycle_tot, cycle_tot)
+        cycle_tot = cached.cycle_tot
+        conn = cached.connections[0]
+        conn.wt[:] = 0.0  # direct writes need a version bump
+        conn.wt_version += 1
+        self.assertTrue(np.allclose(cached.test_trial()['output_layer'], 0.0))
+        self.assertGreater(cached.cycle_tot, cycle_tot)
+
+    def test_lrn_interval(self):
+        """Weight changes are accumulated over `lrn_interval` trials, and applied once"""
+        for lrn_interval in [3, 0]:
+            network = build_network(lrn_interval=lrn_interval)
+            conn = network.connections[0]
+            wt = conn.wt.copy()
+            for _ in range(2):
+                network.trial()
+            self.assertTrue(np.array_equal(conn.wt, wt))
+            self.assertEqual(network.lrn_count, 2)
+            dwt = conn.dwt.copy()
+            self.assertTrue(np.any(dwt != 0))
+            network.trial()
+            if lrn_interval == 0:  # applied only on demand
+                self.assertTrue(np.array_equal(conn.wt, wt))
+                network.apply_dwt()
+            self.assertFalse(np.array_equal(conn.wt, wt))
+            self.assertTrue(np.all(conn.dwt == 0))
+            self.assertEqual(network.lrn_count, 0)
+
+        # with an interval of 1, every trial updates the weights
+        network = build_network(lrn_interval=1)
+        wt = network.connections[0].wt.copy()
+        network.trial()
+        self.assertFalse(np.array_equal(network.connections[0].wt, wt))
+
+    def test_tied_weights(self):
+        """Tied connections share their weights, and apply their summed changes once"""
+        network, untied = build_network(tie=True, lrn_interval=0), build_network(tie=False, lrn_interval=0)
+        conn0, conn1 = network.connections
+        self.assertTrue(conn0.tied and conn1.tied and not untied.connections[0].tied)
+        self.assertIs(conn1.wt, conn0.wt)
+        self.assertIs(conn1.pre_idx, conn0.pre_idx)
+
+        network.trial()
+        untied.trial()
+        dwt = untied.connections[0].dwt + untied.connections[1].dwt
+        self.assertTrue(np.allclose(conn0.dwt, dwt))
+
+        network.apply_dwt()  # applied once
+        reference = untied.connections[0]
+        reference.dwt = dwt
+        reference.apply_dwt()
+        self.assertTrue(np.allclose(conn0.wt, reference.wt))
+        self.assertIs(conn1.wt, conn0.wt)
+
+        fork = network.fork()  # still tied in the fork, and not with the original
+        fork.connections[0].weights = np.zeros((4, 2))
+        self.assertTrue(np.all(fork.connections[1].wt == 0.0))
+        self.assertTrue(np.allclose(conn1.wt, reference.wt))
+
+        with self.assertRaises(ValueError):
+            leabra.Connection(leabra.Layer(4), leabra.Layer(3), tie=conn0)
+        conspec_params = {'proj': 'full', 'lrule': 'leabra', 'rnd_var': 0.0}
+        for params in [{'lrate': 0.02}, {'lrule': None}, {'sig_gain': 1.0}, {'sig_off': 1.1}]:
+            with self.assertRaises(ValueError):  # the summed changes are applied with one spec
+                leabra.Connection(leabra.Layer(4), leabra.Layer(2), tie=conn0,
+                                  spec=leabra.ConnectionSpec(**dict(conspec_params, **params)))
+
+    def test_reciprocal(self):
+        """A reciprocal connection reads the transposed weights, and does not learn"""
+        rng = np.random.RandomState(0)
+        W_ih, W_ho = rng.uniform(size=(4, 3)), rng.uniform(size=(3, 2))
+
+        def build_network(reciprocal):
+            unit_spec = leabra.UnitSpec()
+            layers = [leabra.Layer(n, unit_spec=unit_spec, name=name)
+                      for n, name in [(4, 'input_layer'), (3, 'hidden_layer'), (2, 'output_layer')]]
+            ff_spec = leabra.ConnectionSpec(proj='full', lrule='leabra', lrate=0.04)
+            fb_spec = leabra.ConnectionSpec(proj='full', wt_scale_rel=0.5)
+            conn_ih = leabra.Connection(layers[0], layers[1], spec=ff_spec)
+            conn_ho = leabra.Connection(layers[1], layers[2], spec=ff_spec)
+            conn_ih.weights, conn_ho.weights = W_ih, W_ho
+            if reciprocal:
+                conn_oh = leabra.Connection(layers[2], layers[1], spec=fb_spec, reciprocal=conn_ho)
+            else:
+                conn_oh = leabra.Connection(layers[2], layers[1], spec=fb_spec)
+                conn_oh.weights = W_ho.T
+            network = leabra.Network(layers=layers, connections=[conn_ih, conn_ho, conn_oh])
+            network.set_inputs({'input_layer': [1.0, 1.0, 0.0, 0.0]})
+            network.set_outputs({'output_layer': [1.0, 0.0]})
+            return network
+
+        network, reference = build_network(True), build_network(False)
+        conn_ho, conn_oh = network.connections[1:]
+        self.assertIs(conn_oh.wt, conn_ho.wt)
+        self.assertTrue(np.allclose(conn_oh.weights, W_ho.T))
+        acts = rng.uniform(size=2)
+        self.assertTrue(np.allclose(conn_oh.spec.netin(conn_oh, acts), np.dot(W_ho, acts)))
+
+        network.trial()
+        reference.trial()
+        for layer, layer_ref in zip(network.layers, reference.layers):
+            self.assertTrue(np.allclose(layer.unit_array('act'), layer_ref.unit_array('act')))
+        self.assertTrue(np.allclose(conn_ho.wt, reference.connections[1].wt))
+        self.assertFalse(np.allclose(conn_ho.weights, W_ho))
+        self.assertTrue(np.allclose(conn_oh.weights, conn_ho.weights.T))
+
+        with self.assertRaises(ValueError):
+            leabra.Connection(network.layers[1], network.layers[2], reciprocal=conn_ho)
+
+    def test_state(self):
+        """A network restored to a previous state repeats the same trials"""
+        network = build_network(conn_params={'lrule': None, 'rnd_var': 0.25})
+        network.trial()
+
+        state = network.get_state()
+        acts = [network.test_trial()['output_layer'] for _ in range(2)]
+        self.assertEqual(network.trial_count, 2)
+        network.set_state(state)
+        self.assertEqual(network.trial_count, 0)
+        for act in acts:
+            self.assertTrue(np.array_equal(network.test_trial()['output_layer'], act))
+
+    def test_fork(self):
+        """A fork shares the weights until it learns, and behaves like a deep copy"""
+        network = build_network(conn_params={'rnd_var': 0.25})
+        conn = network.connections[0]
+        network.trial()
+
+        reference = copy.deepcopy(network)
+        fork = network.fork()
+        self.assertIs(fork.connections[0].wt, conn.wt)
+        with self.assertRaises(ValueError):  # direct writes to shared weights
+            fork.connections[0].wt[0] = 1.0
+        self.assertIs(fork.connections[0].pre, fork.layers[0])
+        self.assertTrue(np.array_equal(fork.test_trial()['output_layer'],
+                                       reference.test_trial()['output_layer']))
+        self.assertIs(fork.connections[0].wt, conn.wt)  # no learning, no copy
+
+        fork.set_outputs({'output_layer': [0.0, 1.0]})
+        for _ in range(3):
+            fork.trial()
+        self.assertIsNot(fork.connections[0].wt, conn.wt)
+        self.assertTrue(np.array_equal(conn.wt, reference.connections[0].wt))
+        self.assertFalse(np.array_equal(fork.connections[0].wt, conn.wt))
+
+        network.test_trial()  # the parent continues as if not forked
+        for _ in range(2):
+            self.assertEqual(network.trial(), reference.trial())
+        self.assertTrue(np.array_equal(conn.wt, reference.connections[0].wt))
+        self.assertEqual(network.layers[1].spec.cycle_count, reference.layers[1].spec.cycle_count)
+        self.assertIsNot(fork.layers[1].spec, network.layers[1].spec)
+        conn.wt[0] = 1.0  # no longer shared
+
+    def test_profiling(self):
+        """Profiling counts calls by stage, and does not change the results"""
+        layer_spec = leabra.LayerSpec()  # shared by the networks
+        profiled, reference = build_network(layer_spec=layer_spec), build_network(layer_spec=layer_spec)
+        profiled.enable_profiling()
+        self.assertEqual(profiled.trial(), reference.trial())
+
+        stats = profiled.profile_stats(reset=True)
+        self.assertEqual(stats['propagation']['input_layer->output_layer']['calls'], 100)
+        self.assertEqual(stats['learning']['input_layer->output_layer']['calls'], 1)
+        self.assertEqual(stats['integration']['output_layer']['calls'], 2 * 2 * 100)
+        self.assertEqual(stats['inhibition']['output_layer']['calls'], 75)  # minus phase only
+        self.assertTrue(all(entry['time'] >= 0 for stage in stats.values() for entry in stage.values()))
+        self.assertEqual(profiled.profile_stats()['learning'], {})
+
+        other = build_network(layer_spec=layer_spec)  # a second profiled network, with the same layer spec
+        other.enable_profiling()
+        other.trial()
+        self.assertEqual(other.profile_stats()['inhibition']['output_layer']['calls'], 75)
+        self.assertEqual(profiled.profile_stats()['inhibition'], {})
+
+        profiled.disable_profiling()
+        self.assertNotIn('cycle', vars(profiled.layers[0].units[0]))
+        self.assertEqual(profiled.trial(), reference.trial())
+        other.trial()  # still profiled
+        self.assertEqual(other.profile_stats()['inhibition']['output_layer']['calls'], 150)
+        other.disable_profiling()
+        self.assertNotIn('_inhibition', vars(layer_spec))
+
+        vectorized = build_network(engine='numpy', layer_spec=layer_spec)  # the engines time their own stages
+        vectorized.enable_profiling()
+        vectorized.trial()
+        stats = vectorized.profile_stats()
+        self.assertEqual(stats['propagation']['input_layer->output_layer']['calls'], 100)
+        self.assertEqual(stats['integration']['output_layer']['calls'], 100)
+        self.assertEqual(stats['inhibition']['output_layer']['calls'], 75)
+        self.assertEqual(stats['logging']['output_layer']['calls'], 100)
+        vectorized.disable_profiling()
+
+    def test_hooks(self):
+        """Callbacks are called at each event, in order, with the layers's state"""
+        network = build_network(conn_params={'rnd_var': 0.25}, log_names=(),  # recorded with a hook
+                                minus_cache_size=4)
+        input_layer, output_layer = network.layers
+
+        events = []
+        def on_event(event):
+            return lambda net, state: events.append((event, net.cycle_count))
+        callbacks = {event: on_event(event) for event in ['quarter', 'minus_phase', 'plus_phase', 'trial']}
+        for event, callback in callbacks.items():
+            network.add_hook(event, callback)
+        act_m = []
+        network.add_hook('minus_phase', lambda net, state: act_m.append(state['output_layer']['act_m']))
+        recorder = leabra.hooks.Recorder(['act'], layers=['output_layer'])
+        network.add_hook('cycle', recorder)
+        with self.assertRaises(ValueError):
+            network.add_hook('epoch', recorder)
+
+        network.trial()
+        self.assertEqual(events, [('quarter', 25), ('quarter', 25), ('quarter', 25), ('minus_phase', 25),
+                                  ('quarter', 25), ('plus_phase', 25), ('trial', 25)])
+        self.assertTrue(np.array_equal(act_m[0], output_layer.unit_array('act_m')))
+        self.assertEqual(recorder.arrays()['output_layer']['act'].shape, (100, 2))
+        self.assertEqual(output_layer.units[0].logs, {})
+        self.assertEqual(len(input_layer.units[0].logs['act']), 100)
+
+        for event, callback in callbacks.items():
+            network.remove_hook(event, callback)
+        network.remove_hook('cycle', recorder)
+        network.trial()
+        self.assertEqual(len(events), 7)
+        self.assertEqual(len(act_m), 2)
+
+        # a cached minus phase executes no cycle, and only calls the 'minus_phase' hooks
+        for event in ['quarter', 'minus_phase']:
+            network.add_hook(event, callbacks[event])
+        network.test_trial()
+        network.test_trial()
+        self.assertEqual(events[7:], [('quarter', 25)] * 3 + [('minus_phase', 25)] * 2)
+        self.assertEqual(len(act_m), 4)
+        self.assertTrue(np.array_equal(act_m[3], act_m[2]))
+
 
 class NetworkTestBehavior(unittest.TestCase):
     """Check that the Network behaves as it should.
@@ -182,7 +454,7 @@ class NetworkTestBehavior(unittest.TestCase):
                     unit.logs      = {name: [] for name in unit.log_names}
 
             # connections
-            weights = read_weights(os.path.join(os.path.dirname(__file__), 'emergent_projects/leabra_std{}.wts'.format(n)))
+            weights = leabra.io.read_wts(os.path.join(os.path.dirname(__file__), 'emergent_projects/leabra_std{}.wts'.format(n)))
             inphid_conn_spec = leabra.ConnectionSpec(proj='full', lrule='leabra', lrate=0.04, rnd_mean=0.5, rnd_var=0.0,
                                                      wt_scale_abs=1.0, wt_scale_rel=1.0)
             hidout_conn_spec = leabra.ConnectionSpec(proj='full', lrule='leabra', lrate=0.04, rnd_mean=0.5, rnd_var=0.0,
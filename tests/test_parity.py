@@ -0,0 +1,199 @@
+import os
+import random
+import unittest
+
+import numpy as np
+
+import dotdot  # pylint: disable=unused-import
+import leabra
+import leabra.engines
+import leabra.io
+from leabra import parity
+
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+
+def build_std4_network(engine='python'):
+    """The LeabraStd4 emergent project, with the weights of `leabra_std4.wts`"""
+    u_spec = leabra.UnitSpec(act_thr=0.5, act_gain=100, act_sd=0.005,
+                             g_bar_e=1.0, g_bar_l=0.1, g_bar_i=1.0,
+                             e_rev_e=1.0, e_rev_l=0.3, e_rev_i=0.25,
+                             avg_l_min=0.2, avg_l_init=0.4, avg_l_gain=2.5,
+                             adapt_on=False)
+    layer_spec = leabra.LayerSpec(lay_inhib=False)
+    layers = [leabra.Layer(4, spec=layer_spec, unit_spec=u_spec, genre=genre, name=name)
+              for genre, name in [(leabra.INPUT, 'input_layer'), (leabra.HIDDEN, 'hidden_layer'),
+                                  (leabra.OUTPUT, 'output_layer')]]
+    weights = leabra.io.read_wts(os.path.join(os.path.dirname(__file__), 'emergent_projects/leabra_std4.wts'))
+    conn_spec = leabra.ConnectionSpec(proj='full', lrule='leabra', lrate=0.04, rnd_mean=0.5, rnd_var=0.0)
+    inphid_conn = leabra.Connection(layers[0], layers[1], spec=conn_spec)
+    inphid_conn.weights = weights[('Input', 'Hidden')]
+    hidout_conn = leabra.Connection(layers[1], layers[2], spec=conn_spec)
+    hidout_conn.weights = weights[('Hidden', 'Output')]
+
+    network = leabra.Network(spec=leabra.NetworkSpec(engine=engine),
+                             layers=layers, connections=[inphid_conn, hidout_conn])
+    network.set_inputs ({'input_layer' : [0.95, 0.95, 0.0, 0.0]})
+    network.set_outputs({'output_layer': [0.0, 0.0, 0.95, 0.95]})
+    return network
+
+def std4_reference():
+    return {'{}_layer'.format(name): parity.load_reference(
+                os.path.join(DATA_DIR, 'leabra_std4_cycle_{}.dat'.format(name)))
+            for name in ['input', 'hidden', 'output']}
+
+
+class ParityTest(unittest.TestCase):
+
+    def test_std4_parity(self):
+        """The LeabraStd4 project matches emergent over 5 trials"""
+        report = parity.check_parity(build_std4_network(), std4_reference())
+        self.assertTrue(report.ok, str(report))
+        self.assertEqual({r.layer for r in report.results},
+                         {'input_layer', 'hidden_layer', 'output_layer'})
+        self.assertTrue(all(r.n_cycles == 500 for r in report.results))
+
+    def test_divergence(self):
+        """The first divergence is located, and errors are reported per layer and variable"""
+        reference = std4_reference()
+        traces = {name: {var: values.copy() for var, values in layer.items()}
+                  for name, layer in reference.items()}
+        traces['hidden_layer']['act'][120:, 2] += 0.01
+        traces['hidden_layer']['act'][130, 1] += 0.01
+
+        report = parity.compare(traces, reference)
+        self.assertFalse(report.ok)
+        failures = report.failures()
+        self.assertEqual(len(failures), 1)
+        self.assertEqual((failures[0].layer, failures[0].variable), ('hidden_layer', 'act'))
+        self.assertEqual((failures[0].first_cycle, failures[0].first_unit), (120, 2))
+        self.assertTrue(np.isclose(failures[0].max_abs_err, 0.01))
+
+    def test_multiple_networks(self):
+        """Several networks are checked against the same reference"""
+        reports = parity.check_parity({'a': build_std4_network(), 'b': build_std4_network()},
+                                      std4_reference(), variables=['net', 'act'], n_cycles=100)
+        self.assertEqual(set(reports.keys()), {'a', 'b'})
+        self.assertTrue(all(report.ok for report in reports.values()))
+
+
+class EnginesTest(unittest.TestCase):
+
+    def engines(self):
+        try:
+            import numba  # pylint: disable=unused-import
+            return ['numpy', 'numba']
+        except ImportError:
+            return ['numpy']
+
+    def test_engines_parity(self):
+        """All engines match emergent on the LeabraStd4 project"""
+        networks = {engine: build_std4_network(engine) for engine in ['python'] + self.engines()}
+        reports = parity.check_parity(networks, std4_reference())
+        for engine, report in reports.items():
+            self.assertTrue(report.ok, '{}:\n{}'.format(engine, report))
+
+    def test_engines_trials(self):
+        """Whole quarters run by the engines give the results of the reference engine"""
+        reference = build_std4_network('python')
+        sses = [reference.trial() for _ in range(5)]
+        for engine in self.engines():
+            network = build_std4_network(engine)
+            for sse in sses:
+                self.assertTrue(np.isclose(network.trial(), sse, rtol=1e-10, atol=1e-12))
+            for conn, conn_ref in zip(network.connections, reference.connections):
+                self.assertTrue(np.allclose(conn.wt, conn_ref.wt, rtol=1e-10, atol=1e-12))
+            for layer, layer_ref in zip(network.layers, reference.layers):
+                for name in ['act', 'v_m', 'avg_m', 'avg_l']:
+                    self.assertTrue(np.allclose(layer.unit_array(name), layer_ref.unit_array(name),
+                                                rtol=1e-10, atol=1e-12))
+                self.assertEqual(len(layer.units[0].logs['act']), 500)
+                self.assertTrue(np.allclose(layer.units[0].logs['v_m'], layer_ref.units[0].logs['v_m'],
+                                            rtol=1e-10, atol=1e-12))
+
+    def test_float32(self):
+        """Single precision stays within 1e-6 of double precision over 5 trials"""
+        for engine in ['python'] + self.engines():
+            networks = {}
+            for dtype in ['float64', 'float32']:
+                networks[dtype] = build_std4_network(engine)
+                networks[dtype].spec.dtype = dtype
+                networks[dtype].build()
+                for _ in range(5):
+                    networks[dtype].trial()
+            for conn, conn64 in zip(networks['float32'].connections, networks['float64'].connections):
+                self.assertEqual(conn.wt.dtype, np.float32)
+                self.assertTrue(np.allclose(conn.wt, conn64.wt, rtol=0, atol=1e-6))
+            for layer, layer64 in zip(networks['float32'].layers, networks['float64'].layers):
+                for name in ['net', 'act', 'v_m']:
+                    self.assertTrue(np.allclose(layer.units[0].logs[name], layer64.units[0].logs[name],
+                                                rtol=0, atol=1e-6), '{}: {}'.format(engine, name))
+
+        network = build_std4_network()
+        network.spec.dtype = 'float32'
+        network.build()
+        report = parity.check_parity(network, std4_reference(), rtol=1e-4, atol=1e-5)
+        self.assertTrue(report.ok, str(report))
+
+    def test_unit_params(self):
+        """Per-unit parameters give the same results on all engines"""
+        unit_params = {'act_thr': [0.45, 0.5, 0.5, 0.55], 'g_bar_l': [0.1, 0.2, 0.1, 0.05],
+                       'spike_gain': [0.0, 0.00805, 0.02, 0.00805]}
+        def build(engine, unit_specs=False):
+            random.seed(0)
+            np.random.seed(0)
+            unit_spec = leabra.UnitSpec(adapt_on=True, noisy_act=True)
+            input_layer  = leabra.Layer(4, unit_spec=unit_spec, genre=leabra.INPUT, name='input_layer')
+            hidden_layer = leabra.Layer(4, unit_spec=unit_spec, name='hidden_layer',
+                                        unit_params=None if unit_specs else unit_params)
+            if unit_specs:  # one spec object per unit, with its values
+                for j, unit in enumerate(hidden_layer.units):
+                    unit.spec = unit_spec.copy()
+                    for name, values in unit_params.items():
+                        setattr(unit.spec, name, values[j])
+            output_layer = leabra.Layer(2, unit_spec=unit_spec, genre=leabra.OUTPUT, name='output_layer')
+            conn_spec = leabra.ConnectionSpec(proj='full', lrule='leabra', lrate=0.04)
+            network = leabra.Network(spec=leabra.NetworkSpec(engine=engine),
+                                     layers=[input_layer, hidden_layer, output_layer],
+                                     connections=[leabra.Connection(input_layer, hidden_layer, spec=conn_spec),
+                                                  leabra.Connection(hidden_layer, output_layer, spec=conn_spec)])
+            network.set_inputs ({'input_layer' : [1.0, 1.0, 0.0, 0.0]})
+            network.set_outputs({'output_layer': [1.0, 0.0]})
+            return network
+
+        reference = build('python')
+        units = reference.layers[1].units
+        self.assertTrue(all(u.spec is units[0].spec for u in units))  # one shared spec
+        self.assertEqual([u.params.act_thr for u in units], [0.45, 0.5, 0.5, 0.55])
+        sses = [reference.trial() for _ in range(3)]
+        unit_specs = build('python', unit_specs=True)
+        self.assertEqual([unit_specs.trial() for _ in range(3)], sses)
+        for engine in self.engines():
+            network = build(engine)
+            for sse in sses:
+                self.assertTrue(np.isclose(network.trial(), sse, rtol=1e-10, atol=1e-12))
+            for name in ['act', 'v_m', 'adapt', 'avg_m']:
+                self.assertTrue(np.allclose(network.layers[1].unit_array(name),
+                                            reference.layers[1].unit_array(name), rtol=1e-10, atol=1e-12))
+
+        with self.assertRaises(ValueError):
+            leabra.Layer(2, unit_params={'act_gain': [100, 200]})
+        with self.assertRaises(ValueError):
+            leabra.Layer(2, unit_params={'act_thr': [0.5, 0.5, 0.5]})
+
+    def test_unsupported_spec(self):
+        """Specs overriding cycle methods are rejected by the vectorized engines"""
+        class CustomUnitSpec(leabra.UnitSpec):
+            def xx1(self, v_m):
+                return 0.0
+        layer0 = leabra.Layer(2, name='layer0')
+        layer1 = leabra.Layer(2, unit_spec=CustomUnitSpec(), name='layer1')
+        network = leabra.Network(spec=leabra.NetworkSpec(engine='numpy'), layers=[layer0, layer1],
+                                 connections=[leabra.Connection(layer0, layer1)])
+        with self.assertRaises(ValueError):
+            network.cycle()
+
+
+if __name__ == '__main__':
+    unittest.main()
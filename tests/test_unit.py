@@ -32,6 +32,25 @@ class UnitTestsAPI(unittest.TestCase):
         self.assertEqual(u2.spec.act_thr, 0.30)
         self.assertEqual(u3.spec.act_thr, 0.45)
 
+    def test_derived(self):
+        """Derived constants and the noisy xx1 table follow parameter changes"""
+        u_spec = leabra.UnitSpec(tau_v_m=2.0)
+        self.assertEqual(u_spec.dt_v_m, 0.5)
+        u_spec.tau_v_m = 4.0
+        self.assertEqual(u_spec.dt_v_m, 0.25)
+        with self.assertRaises(AttributeError):
+            u_spec.derived.dt_v_m = 1.0
+        derived = u_spec.derive_with({'tau_v_m': np.array([2.0, 4.0])})  # per-unit values
+        self.assertEqual(derived.dt_v_m.tolist(), [0.5, 0.25])
+        self.assertEqual(derived.dt_net, u_spec.dt_net)
+        self.assertEqual(leabra.spec.Spec().derived, ())  # no derived constants
+
+        act = u_spec.noisy_xx1(0.01)
+        u_spec.act_gain = 50
+        self.assertIsNone(u_spec._nxx1_conv)
+        self.assertLess(u_spec.noisy_xx1(0.01), act)
+        self.assertEqual(u_spec.noisy_xx1(0.01), leabra.UnitSpec(tau_v_m=4.0, act_gain=50).noisy_xx1(0.01))
+
     def test_forced_act(self):
         """Test that forcing activity behaves as expected"""
         u = leabra.Unit()
@@ -1,6 +1,9 @@
 import numpy as np
 import color
 
+import dotdot  # pylint: disable=unused-import
+import leabra
+
 
 def quantitative_match(python_logs, emergent_logs, limit=-1, check=True, rtol=1e-05, atol=0,
                        verbose=0, postprocessing=None, prefix='', suffix=''):
@@ -39,3 +42,47 @@ def quantitative_match(python_logs, emergent_logs, limit=-1, check=True, rtol=1e
                            name, t, sign_text[1], py, sign_text[0], em, diff_text, suffix))
             check = check and local_check
     return check
+
+
+def build_network(engine='python', layer_spec=None, conn_params=None, hidden_size=None, tie=None,
+                  log_names=None, **spec_params):
+    """A 4-unit input layer fully connected to a 2-unit output layer, with an
+    input and a target pattern set.
+
+    Parameters:
+        layer_spec   the LayerSpec of all the layers. If None, one per layer.
+        conn_params  parameters of the ConnectionSpec, overriding the defaults
+                     (a 'full' projection learning with 'leabra', and equal
+                     initial weights).
+        hidden_size  if not None, the size of a hidden layer between the input
+                     and the output layers.
+        tie          if not None, a second pair of layers, 'input_1' and
+                     'output_1', with a connection tied to the first one if
+                     `tie` is True, untied if False.
+        log_names    variables the output layer's units record (see `Layer`).
+        spec_params  parameters of the NetworkSpec.
+    """
+    unit_spec = leabra.UnitSpec()
+    def layer(size, genre, name, **kwargs):
+        return leabra.Layer(size, spec=layer_spec, unit_spec=unit_spec, genre=genre, name=name, **kwargs)
+
+    layers = [layer(4, leabra.INPUT, 'input_layer')]
+    if hidden_size is not None:
+        layers.append(layer(hidden_size, leabra.HIDDEN, 'hidden_layer'))
+    layers.append(layer(2, leabra.OUTPUT, 'output_layer', log_names=log_names))
+    conn_spec = leabra.ConnectionSpec(**dict({'proj': 'full', 'lrule': 'leabra', 'rnd_var': 0.0},
+                                             **(conn_params or {})))
+    connections = [leabra.Connection(pre, post, spec=conn_spec) for pre, post in zip(layers[:-1], layers[1:])]
+    inputs, outputs = {'input_layer': [1.0, 1.0, 0.0, 0.0]}, {'output_layer': [1.0, 0.0]}
+    if tie is not None:
+        pair = [layer(4, leabra.INPUT, 'input_1'), layer(2, leabra.OUTPUT, 'output_1')]
+        connections.append(leabra.Connection(pair[0], pair[1], spec=conn_spec,
+                                             tie=connections[0] if tie else None))
+        layers.extend(pair)
+        inputs['input_1'], outputs['output_1'] = [0.0, 1.0, 1.0, 0.0], [0.0, 1.0]
+
+    network = leabra.Network(spec=leabra.NetworkSpec(engine=engine, **spec_params),
+                             layers=layers, connections=connections)
+    network.set_inputs(inputs)
+    network.set_outputs(outputs)
+    return network